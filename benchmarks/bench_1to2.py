@@ -0,0 +1,78 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Time converting a v1 stream to v2, with and without the transcoder.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_1to2.py
+"""
+
+from io import BytesIO
+import sys
+import timeit
+
+from testtools import ExtendedToStreamDecorator
+
+import subunit
+from subunit._to_v2 import v1_to_v2
+
+
+def make_stream(tests=20000):
+    """Build a v1 stream of tagged, timed tests, one in ten failing."""
+    lines = ['tags: worker-0\n']
+    for index in range(tests):
+        name = 'package.module.TestClass.test_%d' % index
+        lines.append('time: 2013-01-01 00:00:%02d.000000Z\n' % (index % 60))
+        lines.append('test: %s\n' % name)
+        if index % 10:
+            lines.append('success: %s\n' % name)
+        else:
+            lines.append('failure: %s [ multipart\n' % name)
+            lines.append('Content-Type: text/x-traceback;charset=utf8\n')
+            lines.append('traceback\n')
+            lines.append('1A\r\nTraceback: AssertionError\n0\r\n]\n')
+    return ''.join(lines).encode('utf8')
+
+
+def via_decorator(stream):
+    """How subunit-1to2 converted streams before the transcoder."""
+    output = subunit.StreamResultToBytes(BytesIO())
+    result = ExtendedToStreamDecorator(output)
+    result.startTestRun()
+    subunit.ProtocolTestCase(BytesIO(stream), BytesIO()).run(result)
+    result.stopTestRun()
+
+
+def via_transcoder(stream):
+    output = subunit.StreamResultToBytes(BytesIO())
+    v1_to_v2(BytesIO(stream), output, BytesIO())
+
+
+def main():
+    stream = make_stream()
+    sys.stdout.write('%d bytes of v1\n' % len(stream))
+    for label, convert in [
+        ('decorator', via_decorator),
+        ('transcoder', via_transcoder),
+        ]:
+        seconds = min(timeit.repeat(
+            lambda: convert(stream), number=1, repeat=3))
+        sys.stdout.write('%-14s %6.3f s\n' % (label, seconds))
+
+
+if __name__ == '__main__':
+    main()
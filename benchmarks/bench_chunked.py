@@ -0,0 +1,67 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Time chunked.Decoder on a large multipart detail.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_chunked.py
+"""
+
+import sys
+import timeit
+
+from subunit import chunked
+
+
+SIZE = 16 * 1024 * 1024
+
+
+class NullStream(object):
+    """A stream that discards what is written to it."""
+
+    def write(self, data):
+        return len(data)
+
+
+def encode(body, chunk_size):
+    """Chunk body into chunk_size pieces, as a v1 stream would carry it."""
+    pieces = []
+    for pos in range(0, len(body), chunk_size):
+        piece = body[pos:pos + chunk_size]
+        pieces.append(b'%X\r\n' % len(piece) + piece)
+    pieces.append(b'0\r\n')
+    return b''.join(pieces)
+
+
+def decode(data, write_size):
+    decoder = chunked.Decoder(NullStream())
+    for pos in range(0, len(data), write_size):
+        decoder.write(data[pos:pos + write_size])
+    decoder.close()
+
+
+def main():
+    data = encode(b'log line\n' * (SIZE // 9), 65536)
+    sys.stdout.write('detail         %8.2f MiB\n' % (len(data) / 1048576.0))
+    for write_size in (4096, 65536, len(data)):
+        seconds = min(timeit.repeat(
+            lambda: decode(data, write_size), number=1, repeat=3))
+        sys.stdout.write('writes of %-8d %6.3f s\n' % (write_size, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare subunit-filter's packet filter with the decorators it replaced.
+
+Filters a stream down to its failures. Run with the python directory on
+the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_filter.py [tests]
+"""
+
+from io import BytesIO
+import os
+import sys
+import tempfile
+import time
+
+from testtools import ExtendedToStreamDecorator, StreamToExtendedDecorator
+
+from subunit import ByteStreamToStreamResult, StreamResultToBytes
+from subunit._filter import PacketFilter
+from subunit.test_results import TestResultFilter
+
+
+def make_stream(tests):
+    """Make a v2 stream where one test in twenty fails with a traceback."""
+    stream = BytesIO()
+    result = StreamResultToBytes(stream)
+    log = b'captured log line\n' * 20
+    for i in range(tests):
+        test_id = 'bench.module.TestCase.test_%d' % i
+        result.status(test_id=test_id, test_status='inprogress',
+            timestamp=(1577836800 + i, 0))
+        result.status(test_id=test_id, file_name='log', file_bytes=log,
+            mime_type='text/plain; charset=utf8',
+            timestamp=(1577836800 + i, 500))
+        if i % 20:
+            status = 'success'
+        else:
+            status = 'fail'
+            result.status(test_id=test_id, file_name='traceback',
+                file_bytes=b'Traceback (most recent call last):\n  boom\n',
+                mime_type='text/x-traceback; charset=utf8',
+                timestamp=(1577836800 + i, 900))
+        result.status(test_id=test_id, test_status=status,
+            timestamp=(1577836800 + i, 1000))
+    return stream.getvalue()
+
+
+def read_only(source, output):
+    while source.read(65536):
+        pass
+
+
+def decorators(source, output):
+    result = StreamToExtendedDecorator(TestResultFilter(
+        ExtendedToStreamDecorator(StreamResultToBytes(output))))
+    result.startTestRun()
+    ByteStreamToStreamResult(source, non_subunit_name='stdout',
+        block_size=65536).run(result)
+    result.stopTestRun()
+
+
+def packets(source, output):
+    PacketFilter(StreamResultToBytes(output)).run(source)
+
+
+def main():
+    tests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_stream(tests)
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        megabytes = len(data) / 1048576.0
+        for label, run in [('read only', read_only),
+            ('decorators', decorators), ('packets', packets)]:
+            with open(path, 'rb') as source:
+                output = BytesIO()
+                start = time.time()
+                run(source, output)
+                elapsed = time.time() - start
+            sys.stdout.write('%-10s %8.3fs %8.2f MiB/s %8d bytes out\n' % (
+                label, elapsed, megabytes / elapsed, len(output.getvalue())))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare iso8601.parse_date with the parser it replaced on time lines.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_iso8601.py
+"""
+
+from datetime import datetime
+import sys
+import time
+
+from subunit import iso8601
+
+
+def regex_parse_date(datestring, default_timezone=iso8601.UTC):
+    """parse_date as it was before the fast path and the timezone cache."""
+    m = iso8601.ISO8601_REGEX.match(datestring)
+    groups = m.groupdict()
+    tzstring = groups["timezone"]
+    if tzstring is None or tzstring == iso8601.zulu:
+        tz = default_timezone
+    else:
+        prefix, hours, minutes = iso8601.TIMEZONE_REGEX.match(
+            tzstring).groups()
+        hours, minutes = int(hours), int(minutes)
+        if prefix == iso8601.minus:
+            hours, minutes = -hours, -minutes
+        tz = iso8601.FixedOffset(hours, minutes, tzstring)
+    if groups["fraction"] is None:
+        fraction = 0
+    else:
+        fraction = int(float("0.%s" % groups["fraction"].decode()) * 1e6)
+    return datetime(int(groups["year"]), int(groups["month"]),
+        int(groups["day"]), int(groups["hour"]), int(groups["minute"]),
+        int(groups["second"]), fraction, tz)
+
+
+def time_lines(count, suffix):
+    """Build distinct time line payloads, as _handleTime sees them."""
+    return [
+        ("2013-02-%02d %02d:%02d:%02d.%06d%s" % (
+            i % 28 + 1, i // 3600 % 24, i // 60 % 60, i % 60, i % 1000000,
+            suffix)).encode('ascii')
+        for i in range(count)]
+
+
+def main():
+    count = 1000000
+    for label, suffix in [('client form', 'Z'), ('offset form', '+10:30')]:
+        lines = time_lines(count, suffix)
+        for parser_label, parser in [
+            ('regex', regex_parse_date), ('parse_date', iso8601.parse_date)]:
+            start = time.time()
+            for line in lines:
+                parser(line)
+            elapsed = time.time() - start
+            sys.stdout.write('%-12s %-10s %6.2fs %8.0f lines/s\n' % (
+                label, parser_label, elapsed, count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
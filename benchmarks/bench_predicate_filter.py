@@ -0,0 +1,204 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare TestResultFilter's predicate filter with the decorators it replaced.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_predicate_filter.py
+"""
+
+import datetime
+import sys
+import time
+
+from testtools import PlaceHolder
+from testtools.content import text_content
+from testtools.testresult.doubles import ExtendedTestResult
+
+from subunit import iso8601
+from subunit.test_results import (
+    TagCollapsingDecorator,
+    TagsMixin,
+    TestResultDecorator,
+    TimeCollapsingDecorator,
+    _PredicateFilter,
+    )
+
+
+class DecoratorPredicateFilter(TestResultDecorator, TagsMixin):
+    """_PredicateFilter as it was, over the collapsing decorators."""
+
+    def __init__(self, result, predicate):
+        super(DecoratorPredicateFilter, self).__init__(result)
+        self._clear_tags()
+        self.decorated = TimeCollapsingDecorator(
+            TagCollapsingDecorator(self.decorated))
+        self._predicate = predicate
+        # The current test (for filtering tags)
+        self._current_test = None
+        # Has the current test been filtered (for outputting test tags)
+        self._current_test_filtered = None
+        # Calls to this result that we don't know whether to forward on yet.
+        self._buffered_calls = []
+
+    def filter_predicate(self, test, outcome, error, details):
+        return self._predicate(
+            test, outcome, error, details, self._get_active_tags())
+
+    def addError(self, test, err=None, details=None):
+        if (self.filter_predicate(test, 'error', err, details)):
+            self._buffered_calls.append(
+                ('addError', [test, err], {'details': details}))
+        else:
+            self._filtered()
+
+    def addFailure(self, test, err=None, details=None):
+        if (self.filter_predicate(test, 'failure', err, details)):
+            self._buffered_calls.append(
+                ('addFailure', [test, err], {'details': details}))
+        else:
+            self._filtered()
+
+    def addSkip(self, test, reason=None, details=None):
+        if (self.filter_predicate(test, 'skip', reason, details)):
+            self._buffered_calls.append(
+                ('addSkip', [test, reason], {'details': details}))
+        else:
+            self._filtered()
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        if self.filter_predicate(test, 'expectedfailure', err, details):
+            self._buffered_calls.append(
+                ('addExpectedFailure', [test, err], {'details': details}))
+        else:
+            self._filtered()
+
+    def addUnexpectedSuccess(self, test, details=None):
+        self._buffered_calls.append(
+            ('addUnexpectedSuccess', [test], {'details': details}))
+
+    def addSuccess(self, test, details=None):
+        if (self.filter_predicate(test, 'success', None, details)):
+            self._buffered_calls.append(
+                ('addSuccess', [test], {'details': details}))
+        else:
+            self._filtered()
+
+    def _filtered(self):
+        self._current_test_filtered = True
+
+    def startTest(self, test):
+        """Start a test.
+
+        Not directly passed to the client, but used for handling of tags
+        correctly.
+        """
+        TagsMixin.startTest(self, test)
+        self._current_test = test
+        self._current_test_filtered = False
+        self._buffered_calls.append(('startTest', [test], {}))
+
+    def stopTest(self, test):
+        """Stop a test.
+
+        Not directly passed to the client, but used for handling of tags
+        correctly.
+        """
+        if not self._current_test_filtered:
+            for method, args, kwargs in self._buffered_calls:
+                getattr(self.decorated, method)(*args, **kwargs)
+            self.decorated.stopTest(test)
+        self._current_test = None
+        self._current_test_filtered = None
+        self._buffered_calls = []
+        TagsMixin.stopTest(self, test)
+
+    def tags(self, new_tags, gone_tags):
+        TagsMixin.tags(self, new_tags, gone_tags)
+        if self._current_test is not None:
+            self._buffered_calls.append(('tags', [new_tags, gone_tags], {}))
+        else:
+            return super(DecoratorPredicateFilter, self).tags(new_tags, gone_tags)
+
+    def time(self, a_time):
+        return self.decorated.time(a_time)
+
+    def id_to_orig_id(self, id):
+        if id.startswith("subunit.RemotedTestCase."):
+            return id[len("subunit.RemotedTestCase."):]
+        return id
+
+
+class NullResult(object):
+    """Accept every TestResult call and do nothing."""
+
+    def __getattr__(self, name):
+        return self._ignore
+
+    def _ignore(self, *args, **kwargs):
+        pass
+
+
+def make_calls(tests=20000):
+    """Return the (method, args, kwargs) of a run where one in ten fails."""
+    start = datetime.datetime(2020, 1, 1, tzinfo=iso8601.UTC)
+    details = {'traceback': text_content('Traceback: boom')}
+    calls = [('tags', (set(['worker-0']), set()), {}),
+        ('startTestRun', (), {})]
+    for i in range(tests):
+        test = PlaceHolder('bench.module.TestCase.test_%d' % i)
+        calls.append(
+            ('time', (start + datetime.timedelta(seconds=i),), {}))
+        calls.append(('startTest', (test,), {}))
+        calls.append(('tags', (set(['quick']), set()), {}))
+        calls.append(('time',
+            (start + datetime.timedelta(seconds=i, microseconds=5),), {}))
+        if i % 10:
+            calls.append(('addSuccess', (test,), {}))
+        else:
+            calls.append(('addFailure', (test,), {'details': details}))
+        calls.append(('stopTest', (test,), {}))
+    calls.append(('stopTestRun', (), {}))
+    return calls
+
+
+def run(result, calls):
+    start = time.time()
+    for name, args, kwargs in calls:
+        getattr(result, name)(*args, **kwargs)
+    return time.time() - start
+
+
+def predicate(test, outcome, err, details, tags):
+    return outcome != 'success'
+
+
+def main():
+    calls = make_calls()
+    for label, filter_class in [
+        ('decorators', DecoratorPredicateFilter),
+        ('_PredicateFilter', _PredicateFilter)]:
+        recorded = ExtendedTestResult()
+        run(filter_class(recorded, predicate), calls)
+        elapsed = min(run(filter_class(NullResult(), predicate), calls)
+            for _ in range(3))
+        sys.stdout.write('%-17s %8.3fs %10.0f events/s %6d calls out\n' % (
+            label, elapsed, len(calls) / elapsed, len(recorded._events)))
+
+
+if __name__ == '__main__':
+    main()
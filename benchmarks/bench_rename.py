@@ -0,0 +1,99 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare --rename through the decorators with the packet filter's Renamer.
+
+The stream holds 100k tests: a thousand test ids run a hundred times over,
+so the same ids come round again as they do across repeated runs. Run with
+the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_rename.py
+"""
+
+from io import BytesIO
+import re
+import sys
+import time
+
+from testtools import ExtendedToStreamDecorator, StreamToExtendedDecorator
+
+from subunit import ByteStreamToStreamResult, StreamResultToBytes
+from subunit._filter import PacketFilter, Renamer
+from subunit.test_results import TestResultFilter
+
+
+RENAMES = [
+    (r'^bench\.module\.', 'renamed.'),
+    (r'test_(\d+)$', r'test_\1_renamed'),
+    (r'TestCase', 'Case'),
+    ]
+
+
+def compile_rename(patterns):
+    """The rename function subunit-filter used before Renamer."""
+    def rename(name):
+        for (from_pattern, to_pattern) in patterns:
+            name = re.sub(from_pattern, to_pattern, name)
+        return name
+    return rename
+
+
+def make_stream(tests=100000, distinct=1000):
+    stream = BytesIO()
+    result = StreamResultToBytes(stream)
+    for i in range(tests):
+        test_id = 'bench.module.TestCase.test_%d' % (i % distinct)
+        result.status(test_id=test_id, test_status='inprogress')
+        result.status(test_id=test_id, test_status='fail')
+    return stream.getvalue()
+
+
+def decorators(data):
+    result = StreamToExtendedDecorator(TestResultFilter(
+        ExtendedToStreamDecorator(StreamResultToBytes(BytesIO())),
+        rename=compile_rename(RENAMES)))
+    result.startTestRun()
+    ByteStreamToStreamResult(BytesIO(data), block_size=65536).run(result)
+    result.stopTestRun()
+
+
+def packets(data):
+    PacketFilter(StreamResultToBytes(BytesIO()),
+        rename=Renamer(RENAMES)).run(BytesIO(data))
+
+
+def main():
+    data = make_stream()
+    ids = ['bench.module.TestCase.test_%d' % (i % 1000)
+        for i in range(100000)]
+    old_rename = compile_rename(RENAMES)
+    renamer = Renamer(RENAMES)
+    cases = [
+        ('re.sub ids', lambda: [old_rename(test_id) for test_id in ids]),
+        ('Renamer ids', lambda: [renamer(test_id) for test_id in ids]),
+        ('decorators', lambda: decorators(data)),
+        ('packets', lambda: packets(data)),
+        ]
+    for label, case in cases:
+        start = time.time()
+        case()
+        elapsed = time.time() - start
+        sys.stdout.write('%-12s %8.3fs %10.0f tests/s\n' % (
+            label, elapsed, len(ids) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
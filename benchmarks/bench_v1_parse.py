@@ -0,0 +1,100 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Time parsing a v1 stream, and classifying its lines.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_v1_parse.py
+"""
+
+from io import BytesIO
+import sys
+import timeit
+import unittest
+
+import subunit
+from subunit import _ParserState
+
+
+def make_stream(tests=20000, output_lines=5):
+    """Build a v1 stream of passing and failing tests with some output."""
+    lines = []
+    for index in range(tests):
+        name = 'package.module.TestClass.test_%d' % index
+        lines.append('time: 2013-01-01 00:00:%02d.000000Z\n' % (index % 60))
+        lines.append('test: %s\n' % name)
+        for line in range(output_lines):
+            lines.append('output line %d of %s\n' % (line, name))
+        if index % 10:
+            lines.append('success: %s\n' % name)
+        else:
+            lines.append('failure: %s [ multipart\n' % name)
+            lines.append('Content-Type: text/plain\ntraceback\n')
+            lines.append('5\r\nboom\n0\r\n]\n')
+    return ''.join(lines).encode('utf8')
+
+
+_SYMBOLS = [
+    (b'test', b'testing'), (b'error',), (b'failure',), (b'progress',),
+    b'skip', (b'success', b'successful'), (b'tags',), (b'time',),
+    (b'xfail',), (b'uxsuccess',)]
+
+
+def classify_chain(line):
+    """How _ParserState.lineReceived classified lines before the table."""
+    parts = line.split(None, 1)
+    if len(parts) == 2 and line.startswith(parts[0]):
+        cmd = parts[0].rstrip(b':')
+        for position, symbols in enumerate(_SYMBOLS):
+            if cmd in symbols:
+                return position
+    return None
+
+
+def classify_table(line):
+    match = _ParserState._command_re.match(line)
+    if match is None:
+        return None
+    return _ParserState._commands[match.group(1)]
+
+
+def main():
+    stream = make_stream()
+    lines = stream.splitlines(True)
+    sys.stdout.write('%d lines, %d bytes\n' % (len(lines), len(stream)))
+    for label, classify in [
+        ('classify chain', classify_chain),
+        ('classify table', classify_table)]:
+        elapsed = min(timeit.repeat(
+            lambda: [classify(line) for line in lines], number=1, repeat=3))
+        sys.stdout.write('%-15s %8.1f ns/line\n' % (
+            label, elapsed / len(lines) * 1e9))
+
+    for label, block_size in [
+        ('readFrom lines', None),
+        ('readFrom blocks', 65536)]:
+        def parse():
+            protocol = subunit.TestProtocolServer(
+                unittest.TestResult(), stream=subunit.DiscardStream())
+            protocol.readFrom(BytesIO(stream), block_size=block_size)
+        elapsed = min(timeit.repeat(parse, number=1, repeat=3))
+        sys.stdout.write('%-15s %8.1f ns/line\n' % (
+            label, elapsed / len(lines) * 1e9))
+
+
+if __name__ == '__main__':
+    main()
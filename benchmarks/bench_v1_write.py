@@ -0,0 +1,68 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Time writing many small tests with TestProtocolClient.
+
+The stream is an unbuffered temporary file, so every write is a system
+call, as it is for a runner writing to a pipe.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_v1_write.py
+"""
+
+import sys
+import tempfile
+import timeit
+
+from testtools import PlaceHolder
+
+import subunit
+
+
+TESTS = 20000
+
+
+def write_tests(**kwargs):
+    stream = tempfile.TemporaryFile(buffering=0)
+    try:
+        protocol = subunit.TestProtocolClient(stream, **kwargs)
+        protocol.startTestRun()
+        for index in range(TESTS):
+            test = PlaceHolder('package.module.TestClass.test_%d' % index)
+            protocol.startTest(test)
+            protocol.addSuccess(test)
+            protocol.stopTest(test)
+        protocol.stopTestRun()
+    finally:
+        stream.close()
+
+
+def main():
+    sys.stdout.write('%d tests\n' % TESTS)
+    for label, kwargs in [
+        ('unbuffered', {}),
+        ('flush_tests=1', dict(flush_tests=1)),
+        ('flush_tests=100', dict(flush_tests=100)),
+        ('flush_interval=1', dict(flush_interval=1)),
+        ]:
+        seconds = min(timeit.repeat(
+            lambda: write_tests(**kwargs), number=1, repeat=3))
+        sys.stdout.write('%-18s %6.3f s\n' % (label, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Measure the peak memory StreamResultToBytes needs for a 4MiB attachment.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_v2_memory.py
+"""
+
+import struct
+import sys
+import tracemalloc
+import zlib
+
+import subunit
+
+
+SIZE = 4 * 1024 * 1024 - 64
+
+
+class NullStream(object):
+    """A stream that discards what is written to it."""
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def joined_write(stream, fragments):
+    """How StreamResultToBytes wrote a packet before writing fragments."""
+    content = b''.join(fragments)
+    data = content + struct.pack('>I', zlib.crc32(content) & 0xffffffff)
+    stream.write(data)
+
+
+def peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    content = b'\xff' * SIZE
+    result = subunit.StreamResultToBytes(NullStream())
+    fragments = [b'\xb3\x28\x40', b'\xbf\xff\xff', b'\x03log', content]
+    cases = [
+        ('joined', lambda: joined_write(NullStream(), fragments)),
+        ('fragments', lambda: result.status(
+            test_id='foo', file_name='log', file_bytes=content)),
+        ]
+    sys.stdout.write('attachment     %8.2f MiB\n' % (SIZE / 1048576.0))
+    for label, case in cases:
+        sys.stdout.write('%-14s %8.2f MiB peak\n' % (
+            label, peak(case) / 1048576.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare byte-at-a-time and block reading of a mixed v2 stream.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_v2_parse.py
+"""
+
+from io import BytesIO
+import os
+import sys
+import tempfile
+import time
+
+from testtools import StreamResult
+
+from subunit import ByteStreamToStreamResult, StreamResultToBytes
+
+
+def make_stream(tests=2000, noise=b'captured output from a test run\n' * 8):
+    """Make a v2 stream with non subunit content between every packet."""
+    stream = BytesIO()
+    result = StreamResultToBytes(stream)
+    for i in range(tests):
+        test_id = 'bench.module.TestCase.test_%d' % i
+        stream.write(noise)
+        result.status(test_id=test_id, test_status='inprogress')
+        stream.write(noise)
+        result.status(test_id=test_id, test_status='success')
+    return stream.getvalue()
+
+
+def time_parse(path, block_size):
+    with open(path, 'rb') as source:
+        start = time.time()
+        ByteStreamToStreamResult(source, non_subunit_name='stdout',
+            block_size=block_size).run(StreamResult())
+        return time.time() - start
+
+
+def main():
+    data = make_stream()
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        megabytes = len(data) / 1048576.0
+        for label, block_size in [
+            ('read(1)', None), ('block 64KiB', 65536)]:
+            elapsed = time_parse(path, block_size)
+            sys.stdout.write('%-12s %8.3fs %8.2f MiB/s\n' % (
+                label, elapsed, megabytes / elapsed))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare datetime and integer timestamps when writing and reading v2.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_v2_timestamps.py
+"""
+
+from io import BytesIO
+import sys
+import time
+
+from testtools import StreamResult
+
+from subunit import ByteStreamToStreamResult, StreamResultToBytes
+from subunit.v2 import timestamp_to_datetime
+
+
+def write_stream(timestamps):
+    stream = BytesIO()
+    result = StreamResultToBytes(stream)
+    start = time.time()
+    for i, timestamp in enumerate(timestamps):
+        result.status(test_id='bench.test_%d' % i, test_status='success',
+            timestamp=timestamp)
+    return time.time() - start, stream.getvalue()
+
+
+def read_stream(data, raw_timestamps):
+    start = time.time()
+    ByteStreamToStreamResult(BytesIO(data), block_size=65536,
+        raw_timestamps=raw_timestamps).run(StreamResult())
+    return time.time() - start
+
+
+def main():
+    packets = 200000
+    nanoseconds = [1577836800000000000 + i * 1234567 for i in range(packets)]
+    pairs = [divmod(ns, 1000000000) for ns in nanoseconds]
+    datetimes = [timestamp_to_datetime(pair) for pair in pairs]
+    for label, timestamps in [('datetime', datetimes), ('pair', pairs),
+        ('nanoseconds', nanoseconds)]:
+        elapsed, data = write_stream(timestamps)
+        sys.stdout.write('write %-12s %6.3fs %8.0f packets/s\n' % (
+            label, elapsed, packets / elapsed))
+    for label, raw_timestamps in [('datetime', False), ('raw', True)]:
+        elapsed = read_stream(data, raw_timestamps)
+        sys.stdout.write('read  %-12s %6.3fs %8.0f packets/s\n' % (
+            label, elapsed, packets / elapsed))
+
+
+if __name__ == '__main__':
+    main()
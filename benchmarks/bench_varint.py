@@ -0,0 +1,87 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Compare the table driven varint codec with the previous struct code.
+
+Run with the python directory on the path::
+
+  $ PYTHONPATH=python python benchmarks/bench_varint.py
+"""
+
+import struct
+import sys
+import timeit
+
+from subunit import _varint
+
+
+def struct_encode(value):
+    """The encoder StreamResultToBytes used before subunit._varint."""
+    if value < 64:
+        return [struct.pack('>B', value)]
+    elif value < 16384:
+        return [struct.pack('>H', value | 0x4000)]
+    elif value < 4194304:
+        value = value | 0x800000
+        return [struct.pack('>H', value >> 8), struct.pack('>B', value & 0xff)]
+    else:
+        return [struct.pack('>I', value | 0xc0000000)]
+
+
+def struct_decode(data, pos):
+    """The decoder ByteStreamToStreamResult used before subunit._varint."""
+    data_0 = struct.unpack('>B', data[pos:pos+1].tobytes())[0]
+    typeenum = data_0 & 0xc0
+    value_0 = data_0 & 0x3f
+    if typeenum == 0x00:
+        return value_0, 1
+    elif typeenum == 0x40:
+        data_1 = struct.unpack('>B', data[pos+1:pos+2].tobytes())[0]
+        return (value_0 << 8) | data_1, 2
+    elif typeenum == 0x80:
+        data_1 = struct.unpack('>H', data[pos+1:pos+3].tobytes())[0]
+        return (value_0 << 16) | data_1, 3
+    else:
+        data_1, data_2 = struct.unpack('>HB', data[pos+1:pos+4].tobytes())
+        return (value_0 << 24) | data_1 << 8 | data_2, 4
+
+
+# Typical values: short string lengths, file lengths, nanoseconds.
+VALUES = [3, 40, 62, 100, 900, 16000, 70000, 999999000]
+
+
+def main():
+    encoded = memoryview(b''.join(_varint.encode(value) for value in VALUES))
+    offsets = []
+    pos = 0
+    for value in VALUES:
+        offsets.append(pos)
+        pos += len(_varint.encode(value))
+    runs = 20000
+    cases = [
+        ('encode struct', lambda: [struct_encode(v) for v in VALUES]),
+        ('encode table', lambda: [_varint.encode(v) for v in VALUES]),
+        ('decode struct', lambda: [struct_decode(encoded, p) for p in offsets]),
+        ('decode table', lambda: [_varint.decode(encoded, p) for p in offsets]),
+        ]
+    for label, case in cases:
+        elapsed = min(timeit.repeat(case, number=runs, repeat=3))
+        sys.stdout.write('%-14s %8.1f ns/number\n' % (
+            label, elapsed / (runs * len(VALUES)) * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -139,7 +139,12 @@ except ImportError:
 from testtools import testresult, CopyStreamResult
 
 from subunit import chunked, details, iso8601, test_results
-from subunit.v2 import ByteStreamToStreamResult, StreamResultToBytes
+from subunit.v2 import (
+    INPUT_BLOCK_SIZE,
+    ByteStreamToStreamResult,
+    StreamResultToBytes,
+    _BatchingStream,
+    )
 
 # same format as sys.version_info: "A tuple containing the five components of
 # the version number: major, minor, micro, releaselevel, and serial. All
@@ -205,24 +210,52 @@ class DiscardStream(object):
         return _b('')
 
 
+_EMPTY = _b('')
+_NEWLINE = _b('\n')
+_CR = _b('\r')
+
+
+def _split_lines(data):
+    """Split data into lines ending with b'\\n', as readline() would."""
+    if _CR not in data:
+        return data.splitlines(True)
+    # splitlines() would also end lines at a bare carriage return.
+    lines = data.split(_NEWLINE)
+    last = lines.pop()
+    lines = [line + _NEWLINE for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
 class _ParserState(object):
     """State for the subunit parser."""
 
+    # A directive: a command, optionally followed by colons, then whitespace
+    # and the rest of the directive.
+    _command_re = re.compile(_b(
+        '(test|testing|error|failure|progress|skip|success|successful|tags'
+        '|time|xfail|uxsuccess)(:*)\\s+\\S'))
+    # The method that handles each command.
+    _commands = {
+        _b('test'): 'startTest',
+        _b('testing'): 'startTest',
+        _b('error'): 'addError',
+        _b('failure'): 'addFailure',
+        _b('progress'): '_progress',
+        _b('skip'): 'addSkip',
+        _b('success'): 'addSuccess',
+        _b('successful'): 'addSuccess',
+        _b('tags'): '_tags',
+        _b('time'): '_time',
+        _b('xfail'): 'addExpectedFail',
+        _b('uxsuccess'): 'addUnexpectedSuccess',
+        }
+    _start_simple = _u(" [")
+    _start_multipart = _u(" [ multipart")
+
     def __init__(self, parser):
         self.parser = parser
-        self._test_sym = (_b('test'), _b('testing'))
-        self._colon_sym = _b(':')
-        self._error_sym = (_b('error'),)
-        self._failure_sym = (_b('failure'),)
-        self._progress_sym = (_b('progress'),)
-        self._skip_sym = _b('skip')
-        self._success_sym = (_b('success'), _b('successful'))
-        self._tags_sym = (_b('tags'),)
-        self._time_sym = (_b('time'),)
-        self._xfail_sym = (_b('xfail'),)
-        self._uxsuccess_sym = (_b('uxsuccess'),)
-        self._start_simple = _u(" [")
-        self._start_multipart = _u(" [ multipart")
 
     def addError(self, offset, line):
         """An 'error:' directive has been read."""
@@ -244,39 +277,31 @@ class _ParserState(object):
         """A 'success:' directive has been read."""
         self.parser.stdOutLineReceived(line)
 
+    def addUnexpectedSuccess(self, offset, line):
+        """A 'uxsuccess:' directive has been read."""
+        self.parser.stdOutLineReceived(line)
+
     def lineReceived(self, line):
         """a line has been received."""
-        parts = line.split(None, 1)
-        if len(parts) == 2 and line.startswith(parts[0]):
-            cmd, rest = parts
-            offset = len(cmd) + 1
-            cmd = cmd.rstrip(self._colon_sym)
-            if cmd in self._test_sym:
-                self.startTest(offset, line)
-            elif cmd in self._error_sym:
-                self.addError(offset, line)
-            elif cmd in self._failure_sym:
-                self.addFailure(offset, line)
-            elif cmd in self._progress_sym:
-                self.parser._handleProgress(offset, line)
-            elif cmd in self._skip_sym:
-                self.addSkip(offset, line)
-            elif cmd in self._success_sym:
-                self.addSuccess(offset, line)
-            elif cmd in self._tags_sym:
-                self.parser._handleTags(offset, line)
-                self.parser.subunitLineReceived(line)
-            elif cmd in self._time_sym:
-                self.parser._handleTime(offset, line)
-                self.parser.subunitLineReceived(line)
-            elif cmd in self._xfail_sym:
-                self.addExpectedFail(offset, line)
-            elif cmd in self._uxsuccess_sym:
-                self.addUnexpectedSuccess(offset, line)
-            else:
-                self.parser.stdOutLineReceived(line)
-        else:
+        match = self._command_re.match(line)
+        if match is None:
             self.parser.stdOutLineReceived(line)
+            return
+        getattr(self, self._commands[match.group(1)])(match.end(2) + 1, line)
+
+    def _progress(self, offset, line):
+        """A 'progress:' directive has been read."""
+        self.parser._handleProgress(offset, line)
+
+    def _tags(self, offset, line):
+        """A 'tags:' directive has been read."""
+        self.parser._handleTags(offset, line)
+        self.parser.subunitLineReceived(line)
+
+    def _time(self, offset, line):
+        """A 'time:' directive has been read."""
+        self.parser._handleTime(offset, line)
+        self.parser.subunitLineReceived(line)
 
     def lostConnection(self):
         """Connection lost."""
@@ -396,8 +421,12 @@ class _ReadingDetails(_ParserState):
         """The end of a details section has been reached."""
         self.parser._state = self.parser._outside_test
         self.parser.current_test_description = None
-        self._report_outcome()
-        self.parser.client.stopTest(self.parser._current_test)
+        try:
+            self._report_outcome()
+            self.parser.client.stopTest(self.parser._current_test)
+        finally:
+            # Spooled details are only readable until the test stops.
+            self.details_parser.close()
 
     def lineReceived(self, line):
         """a line has been received."""
@@ -406,6 +435,7 @@ class _ReadingDetails(_ParserState):
 
     def lostConnection(self):
         """Connection lost."""
+        self.details_parser.close()
         self.parser._lostConnectionInTest(_u('%s report of ') %
             self._outcome_label())
 
@@ -419,7 +449,8 @@ class _ReadingDetails(_ParserState):
 
     def set_multipart(self):
         """Start a multipart details parser."""
-        self.details_parser = details.MultipartDetailsParser(self)
+        self.details_parser = details.MultipartDetailsParser(
+            self, self.parser._spool_size)
 
 
 class _ReadingFailureDetails(_ReadingDetails):
@@ -494,7 +525,8 @@ class TestProtocolServer(object):
     :ivar tags: The current tags associated with the protocol stream.
     """
 
-    def __init__(self, client, stream=None, forward_stream=None):
+    def __init__(self, client, stream=None, forward_stream=None,
+        spool_size=None):
         """Create a TestProtocolServer instance.
 
         :param client: An object meeting the unittest.TestResult protocol.
@@ -506,6 +538,11 @@ class TestProtocolServer(object):
             allows a filter to forward the entire stream while still parsing
             and acting on it. By default forward_stream is set to
             DiscardStream() and no forwarding happens.
+        :param spool_size: If not None, the content of multipart details is
+            collected in temporary files once it exceeds this many bytes,
+            rather than in memory. See details.MultipartDetailsParser. The
+            files are closed once the client's stopTest returns, so a client
+            must read the details before then.
         """
         self.client = ExtendedToOriginalDecorator(client)
         if stream is None:
@@ -514,6 +551,7 @@ class TestProtocolServer(object):
                 stream = stream.buffer
         self._stream = stream
         self._forward_stream = forward_stream or DiscardStream()
+        self._spool_size = spool_size
         # state objects we can switch too
         self._in_test = _InTest(self)
         self._outside_test = _OutSideTest(self)
@@ -576,16 +614,80 @@ class TestProtocolServer(object):
         """The input connection has finished."""
         self._state.lostConnection()
 
-    def readFrom(self, pipe):
+    def readFrom(self, pipe, block_size=None):
         """Blocking convenience API to parse an entire stream.
 
         :param pipe: A file-like object supporting __iter__.
+        :param block_size: If set to non-None, read pipe in blocks of up to
+            this many bytes (using read1() where pipe supports it) rather
+            than a line at a time, and pass each run of consecutive lines
+            that are not part of the protocol to stdOutLineReceived at once.
         :return: None.
         """
-        for line in pipe:
-            self.lineReceived(line)
+        if block_size is not None:
+            read = getattr(pipe, 'read1', pipe.read)
+            # The chunks of a line not yet ended; they are only joined once
+            # its newline arrives, so a long line is not copied per block.
+            partial = []
+            while True:
+                block = read(block_size)
+                if not block:
+                    break
+                if partial:
+                    end = block.find(_NEWLINE) + 1
+                    if not end:
+                        partial.append(block)
+                        continue
+                    partial.append(block[:end])
+                    lines = [_EMPTY.join(partial)]
+                    lines.extend(_split_lines(block[end:]))
+                    partial = []
+                else:
+                    lines = _split_lines(block)
+                if not lines[-1].endswith(_NEWLINE):
+                    partial.append(lines.pop())
+                if lines:
+                    self.linesReceived(lines)
+            if partial:
+                self.lineReceived(_EMPTY.join(partial))
+        else:
+            for line in pipe:
+                self.lineReceived(line)
         self.lostConnection()
 
+    def linesReceived(self, lines):
+        """Handle several lines, coalescing output that is passed through.
+
+        Consecutive lines that are not part of the protocol are joined and
+        handed to stdOutLineReceived together, so that they are written with
+        one call.
+        """
+        passthrough = []
+        outside_test = self._outside_test
+        in_test = self._in_test
+        match = _ParserState._command_re.match
+        commands = _ParserState._commands
+        for line in lines:
+            state = self._state
+            if state is outside_test or state is in_test:
+                # As _ParserState.lineReceived, but matching each line once.
+                command = match(line)
+                if command is None:
+                    passthrough.append(line)
+                    continue
+                if passthrough:
+                    self.stdOutLineReceived(_EMPTY.join(passthrough))
+                    passthrough = []
+                getattr(state, commands[command.group(1)])(
+                    command.end(2) + 1, line)
+                continue
+            if passthrough:
+                self.stdOutLineReceived(_EMPTY.join(passthrough))
+                passthrough = []
+            state.lineReceived(line)
+        if passthrough:
+            self.stdOutLineReceived(_EMPTY.join(passthrough))
+
     def _startTest(self, offset, line):
         """Internal call to change state machine. Override startTest()."""
         self._state.startTest(offset, line)
@@ -616,10 +718,32 @@ class TestProtocolClient(testresult.TestResult):
     stream.close()
     """
 
-    def __init__(self, stream):
+    def __init__(self, stream, chunk_size=65536, flush_tests=None,
+        flush_interval=None):
+        """Create a TestProtocolClient writing to stream.
+
+        :param stream: A file-like object to write the v1 stream to.
+        :param chunk_size: The number of bytes of attachment content to
+            collect into each chunk of a multipart detail.
+        :param flush_tests: If set to non-None, output is collected in memory
+            and written to stream, and stream flushed, once every this many
+            tests have finished, rather than written as it is produced and
+            flushed at the start and end of every test. 1 writes each test
+            with a single write. Anything collected is written out by
+            stopTestRun and done.
+        :param flush_interval: If set to non-None, output is collected in
+            memory as for flush_tests, and also written out when a test
+            starts or stops at least this many seconds after the oldest of it
+            was collected.
+        """
         testresult.TestResult.__init__(self)
         stream = make_stream_binary(stream)
+        if flush_tests is not None or flush_interval is not None:
+            stream = _BatchingStream(stream, None, flush_interval)
         self._stream = stream
+        self._chunk_size = chunk_size
+        self._flush_tests = flush_tests
+        self._unflushed_tests = 0
         self._progress_fmt = _b("progress: ")
         self._bytes_eol = _b("\n")
         self._progress_plus = _b("+")
@@ -628,6 +752,8 @@ class TestProtocolClient(testresult.TestResult):
         self._empty_bytes = _b("")
         self._start_simple = _b(" [\n")
         self._end_simple = _b("]\n")
+        self._test_prefix = _b("test: ")
+        self._outcome_prefixes = {}
 
     def addError(self, test, error=None, details=None):
         """Report an error in test test.
@@ -696,24 +822,26 @@ class TestProtocolClient(testresult.TestResult):
         :param error_permitted: If True then one and only one of error or
             details must be supplied. If False then error must not be supplied
             and details is still optional.  """
-        self._stream.write(_b("%s: " % outcome) + self._test_id(test))
-        if error_permitted:
-            if error is None and details is None:
-                raise ValueError
-        else:
-            if error is not None:
+        prefix = self._outcome_prefixes.get(outcome)
+        if prefix is None:
+            prefix = self._outcome_prefixes[outcome] = _b("%s: " % outcome)
+        if error is None and details is None:
+            if error_permitted:
+                self._stream.write(prefix + self._test_id(test))
                 raise ValueError
+            self._stream.write(prefix + self._test_id(test) + self._bytes_eol)
+            return
+        self._stream.write(prefix + self._test_id(test))
+        if not error_permitted and error is not None:
+            raise ValueError
         if error is not None:
             self._stream.write(self._start_simple)
             tb_content = TracebackContent(error, test)
             for bytes in tb_content.iter_bytes():
                 self._stream.write(bytes)
-        elif details is not None:
-            self._write_details(details)
         else:
-            self._stream.write(_b("\n"))
-        if details is not None or error is not None:
-            self._stream.write(self._end_simple)
+            self._write_details(details)
+        self._stream.write(self._end_simple)
 
     def addSkip(self, test, reason=None, details=None):
         """Report a skipped test."""
@@ -753,13 +881,30 @@ class TestProtocolClient(testresult.TestResult):
     def startTest(self, test):
         """Mark a test as starting its test run."""
         super(TestProtocolClient, self).startTest(test)
-        self._stream.write(_b("test: ") + self._test_id(test) + _b("\n"))
+        self._stream.write(self._test_prefix + self._test_id(test) +
+            self._bytes_eol)
         self._stream.flush()
 
     def stopTest(self, test):
         super(TestProtocolClient, self).stopTest(test)
+        if self._flush_tests is not None:
+            self._unflushed_tests += 1
+            if self._unflushed_tests >= self._flush_tests:
+                self._flush_all()
+                return
         self._stream.flush()
 
+    def stopTestRun(self):
+        super(TestProtocolClient, self).stopTestRun()
+        self._flush_all()
+
+    def _flush_all(self):
+        """Write out any output collected in memory, and flush the stream."""
+        self._unflushed_tests = 0
+        flush_all = getattr(self._stream, 'flush_all', None)
+        if flush_all is not None:
+            flush_all()
+
     def progress(self, offset, whence):
         """Provide indication about the progress/length of the test run.
 
@@ -809,24 +954,28 @@ class TestProtocolClient(testresult.TestResult):
 
         :param details: An extended details dict for a test outcome.
         """
-        self._stream.write(_b(" [ multipart\n"))
+        header = " [ multipart\n"
         for name, content in sorted(details.items()):
-            self._stream.write(_b("Content-Type: %s/%s" %
-                (content.content_type.type, content.content_type.subtype)))
+            header += "Content-Type: %s/%s" % (
+                content.content_type.type, content.content_type.subtype)
             parameters = content.content_type.parameters
             if parameters:
-                self._stream.write(_b(";"))
                 param_strs = []
                 for param, value in parameters.items():
                     param_strs.append("%s=%s" % (param, value))
-                self._stream.write(_b(",".join(param_strs)))
-            self._stream.write(_b("\n%s\n" % name))
-            encoder = chunked.Encoder(self._stream)
-            list(map(encoder.write, content.iter_bytes()))
+                header += ";" + ",".join(param_strs)
+            self._stream.write(_b(header + "\n%s\n" % name))
+            header = ""
+            encoder = chunked.Encoder(self._stream, self._chunk_size)
+            for bytes in content.iter_bytes():
+                encoder.write(bytes)
             encoder.close()
+        if header:
+            self._stream.write(_b(header))
 
     def done(self):
         """Obey the testtools result.done() interface."""
+        self._flush_all()
 
 
 def RemoteError(description=_u("")):
@@ -1101,7 +1250,8 @@ def TAP2SubUnit(tap, output_stream):
     return 0
 
 
-def tag_stream(original, filtered, tags):
+def tag_stream(original, filtered, tags, buffer_size=None,
+    flush_interval=None):
     """Alter tags on a stream.
 
     :param original: The input stream.
@@ -1122,10 +1272,15 @@ def tag_stream(original, filtered, tags):
         Additionally, any redundant tagging commands (adding a tag globally
         present, or removing a tag globally removed) are stripped as a
         by-product of the filtering.
+    :param buffer_size: Passed to the StreamResultToBytes writing to
+        filtered.
+    :param flush_interval: Passed to the StreamResultToBytes writing to
+        filtered.
     :return: 0
     """
     new_tags, gone_tags = tags_to_new_gone(tags)
-    source = ByteStreamToStreamResult(original, non_subunit_name='stdout')
+    source = ByteStreamToStreamResult(original, non_subunit_name='stdout',
+        block_size=INPUT_BLOCK_SIZE)
     class Tagger(CopyStreamResult):
         def status(self, **kwargs):
             tags = kwargs.get('test_tags')
@@ -1138,8 +1293,11 @@ def tag_stream(original, filtered, tags):
             else:
                 kwargs['test_tags'] = None
             super(Tagger, self).status(**kwargs)
-    output = Tagger([StreamResultToBytes(filtered)])
+    output = Tagger([StreamResultToBytes(filtered, buffer_size=buffer_size,
+        flush_interval=flush_interval)])
+    output.startTestRun()
     source.run(output)
+    output.stopTestRun()
     return 0
 
 
@@ -1168,7 +1326,8 @@ class ProtocolTestCase(object):
     :seealso: TestProtocolServer (the subunit wire protocol parser).
     """
 
-    def __init__(self, stream, passthrough=None, forward=None):
+    def __init__(self, stream, passthrough=None, forward=None,
+        block_size=65536, spool_size=None):
         """Create a ProtocolTestCase reading from stream.
 
         :param stream: A filelike object which a subunit stream can be read
@@ -1177,9 +1336,17 @@ class ProtocolTestCase(object):
             supplied, the TestProtocolServer default is used.
         :param forward: A stream to pass subunit input on to. If not supplied
             subunit input is not forwarded.
+        :param block_size: If stream supports read1(), it is read in blocks
+            of up to this many bytes, as TestProtocolServer.readFrom does.
+            If None, or stream does not support read1(), it is read a line
+            at a time.
+        :param spool_size: Passed to TestProtocolServer, to collect large
+            multipart details in temporary files rather than in memory.
         """
         stream = make_stream_binary(stream)
         self._stream = stream
+        self._block_size = block_size
+        self._spool_size = spool_size
         self._passthrough = passthrough
         if forward is not None:
             forward = make_stream_binary(forward)
@@ -1191,7 +1358,12 @@ class ProtocolTestCase(object):
     def run(self, result=None):
         if result is None:
             result = self.defaultTestResult()
-        protocol = TestProtocolServer(result, self._passthrough, self._forward)
+        protocol = TestProtocolServer(result, self._passthrough, self._forward,
+            spool_size=self._spool_size)
+        if (self._block_size is not None and
+            safe_hasattr(self._stream, 'read1')):
+            protocol.readFrom(self._stream, self._block_size)
+            return
         line = self._stream.readline()
         while line:
             protocol.lineReceived(line)
@@ -1250,19 +1422,29 @@ class TestResultStats(testresult.TestResult):
         return self.failed_tests == 0
 
 
-def read_test_list(path):
-    """Read a list of test ids from a file on disk.
+def iter_test_list(path):
+    """Yield the test ids in a file on disk, one line at a time.
 
-    :param path: Path to the file
-    :return: Sequence of test ids
+    :param path: Path to the file. It is read as UTF8.
+    :return: An iterator of test ids.
     """
     f = open(path, 'rb')
     try:
-        return [l.rstrip("\n") for l in f.readlines()]
+        for l in f:
+            yield l.decode('utf8').rstrip("\n")
     finally:
         f.close()
 
 
+def read_test_list(path):
+    """Read a list of test ids from a file on disk.
+
+    :param path: Path to the file
+    :return: Sequence of test ids
+    """
+    return list(iter_test_list(path))
+
+
 def make_stream_binary(stream):
     """Ensure that a stream will be binary safe. See _make_binary_on_windows.
     
@@ -1287,7 +1469,8 @@ def _make_binary_on_windows(fileno):
 
 def _unwrap_text(stream):
     """Unwrap stream if it is a text stream to get the original buffer."""
-    exceptions = (_UnsupportedOperation, IOError)
+    # AttributeError: write-only streams have no read method.
+    exceptions = (_UnsupportedOperation, IOError, AttributeError)
     if sys.version_info > (3, 0):
         unicode_type = str
     else:
@@ -0,0 +1,263 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+
+"""Filter the tests in a v2 stream a packet at a time."""
+
+from collections import OrderedDict
+import re
+
+from testtools.content import Content
+from testtools.testcase import PlaceHolder
+
+from subunit import make_stream_binary
+from subunit._to_v1 import _content_type
+from subunit.test_results import _filtered_outcomes, _tags_compat
+from subunit.v2 import ByteStreamDecoder, _write_all
+
+
+# The TestResultFilter outcome for each final status; unexpected successes
+# are never filtered, as _PredicateFilter never filters them. Tests that
+# never got a final status count as failures, as StreamToExtendedDecorator
+# reports them.
+_outcomes = {
+    'success': 'success',
+    'fail': 'failure',
+    'skip': 'skip',
+    'xfail': 'expectedfailure',
+    'uxsuccess': None,
+    'unknown': 'failure',
+    }
+# The status a test expected to fail is given instead of its own.
+_fixups = {
+    'success': 'uxsuccess',
+    'fail': 'xfail',
+    'unknown': 'xfail',
+    }
+_INTERIM = frozenset([None, 'inprogress'])
+
+
+class Renamer(object):
+    """Apply regexp substitutions to test ids.
+
+    The patterns are compiled once, and the most recently renamed ids are
+    remembered, as the same ids come round again in every run of a suite.
+    """
+
+    def __init__(self, patterns, cache_size=65536):
+        """Create a Renamer.
+
+        :param patterns: A list of (from_pattern, to_pattern) pairs, applied
+            in order with re.sub.
+        :param cache_size: How many ids to remember the new ids of.
+        """
+        self._patterns = [(re.compile(from_pattern), to_pattern)
+            for from_pattern, to_pattern in patterns]
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __call__(self, name):
+        cache = self._cache
+        try:
+            new_name = cache.pop(name)
+        except KeyError:
+            new_name = name
+            for pattern, to_pattern in self._patterns:
+                new_name = pattern.sub(to_pattern, new_name)
+            if len(cache) >= self._cache_size:
+                cache.popitem(last=False)
+        # Reinsert so the most recently used ids are evicted last.
+        cache[name] = new_name
+        return new_name
+
+
+class _Test(object):
+    """The events of a test that has not finished, and their packets."""
+
+    __slots__ = ('events', 'packets')
+
+    def __init__(self):
+        self.events = []
+        self.packets = []
+
+    def tags(self):
+        """Return the most recent tags the test was given, as testtools."""
+        for event in reversed(self.events):
+            test_tags = event.get('test_tags')
+            if test_tags is not None:
+                return test_tags
+        return set()
+
+    def details(self):
+        """Return the test's file content as a details dict.
+
+        Each Content reads the file bytes only when iterated.
+        """
+        files = {}
+        for event in self.events:
+            file_name = event.get('file_name')
+            file_bytes = event.get('file_bytes')
+            if file_name is not None and file_bytes:
+                mime_type, chunks = files.setdefault(
+                    file_name, (event.get('mime_type'), []))
+                chunks.append(file_bytes)
+        details = {}
+        for name, (mime_type, chunks) in files.items():
+            # bytes() of a memoryview is its repr on Python 2.
+            details[name] = Content(_content_type(mime_type),
+                lambda chunks=chunks: [
+                    memoryview(chunk).tobytes() for chunk in chunks])
+        return details
+
+
+class PacketFilter(object):
+    """Filter the tests in a v2 stream without re-encoding them.
+
+    This does what TestResultFilter does in subunit-filter, but on status
+    events rather than test objects: the packets of each test in progress
+    are held, keyed by test id and route code, until its final status
+    decides whether they are written out as they were read or dropped.
+    Packets are only encoded again when a test is renamed or its status is
+    changed by fixup_expected_failures. 'exists' events are dropped, as is
+    everything without a test id unless passthrough is set.
+    """
+
+    def __init__(self, output, filter_error=False, filter_failure=False,
+        filter_success=True, filter_skip=False, filter_xfail=False,
+        filter_predicate=None, fixup_expected_failures=None, rename=None,
+        passthrough=True):
+        """Create a PacketFilter.
+
+        :param output: The StreamResultToBytes to write to. Packets passed
+            on unchanged are written to its output_stream.
+        :param passthrough: If True, events without a test id, including
+            non subunit content, are written to output.
+        The other parameters are those of TestResultFilter.
+        """
+        self.output = output
+        self._filtered = _filtered_outcomes(filter_error, filter_failure,
+            filter_success, filter_skip, filter_xfail)
+        if filter_predicate is None:
+            self._predicate = None
+        else:
+            self._predicate = _tags_compat(filter_predicate)
+        self._fixup_expected_failures = fixup_expected_failures or frozenset()
+        self._rename = rename
+        self._passthrough = passthrough
+        self._tests = {}
+
+    def run(self, source, block_size=65536):
+        """Filter the v2 stream read from source into output.
+
+        :param source: A file-like object. It is passed through
+            make_stream_binary, to handle regular cases such as stdin.
+        """
+        source = make_stream_binary(source)
+        decoder = ByteStreamDecoder(non_subunit_name='stdout',
+            zero_copy=True, raw_timestamps=True)
+        read = getattr(source, 'read1', source.read)
+        while True:
+            data = read(block_size)
+            if not data:
+                break
+            for event, packet in decoder.feed_packets(data):
+                self.packet(event, packet)
+        for event in decoder.close():
+            self.packet(event, None)
+        self.stop()
+
+    def packet(self, event, packet):
+        """Handle one status event.
+
+        :param event: A dict of keyword arguments for StreamResult.status.
+        :param packet: The bytes event was decoded from, or None if it
+            needs encoding.
+        """
+        test_id = event.get('test_id')
+        if test_id is None:
+            if self._passthrough:
+                self._write(event, packet)
+            return
+        test_status = event.get('test_status')
+        if test_status == 'exists':
+            return
+        key = (test_id, event.get('route_code'))
+        test = self._tests.get(key)
+        if test is None:
+            test = self._tests[key] = _Test()
+        test.events.append(event)
+        test.packets.append(packet)
+        if test_status not in _INTERIM:
+            del self._tests[key]
+            self._finish(test_id, test, test_status)
+
+    def stop(self):
+        """Fail the tests that never finished, and flush output."""
+        tests, self._tests = self._tests, {}
+        for (test_id, route_code), test in tests.items():
+            self._finish(test_id, test, None)
+        self.output.stopTestRun()
+
+    def _finish(self, test_id, test, test_status):
+        """Write test out, or drop it, now that its status is known."""
+        if self._rename is not None:
+            new_id = self._rename(test_id)
+        else:
+            new_id = test_id
+        # A test that never finished is failed, as the decorators that
+        # converted the stream to test objects did.
+        new_status = test_status or 'fail'
+        if new_id in self._fixup_expected_failures:
+            new_status = _fixups.get(new_status, new_status)
+        outcome = _outcomes.get(new_status, 'failure')
+        if outcome is not None:
+            if outcome in self._filtered:
+                return
+            if self._predicate is not None:
+                details = test.details()
+                tags = test.tags()
+                test_case = PlaceHolder(new_id, details=details, tags=tags)
+                if not self._predicate(
+                    test_case, outcome, None, details, tags):
+                    return
+        if new_id == test_id and new_status == test_status and (
+            None not in test.packets):
+            _write_all(self.output.output_stream, b''.join(test.packets))
+            self.output.output_stream.flush()
+            return
+        last = len(test.events) - 1
+        for index, (event, packet) in enumerate(
+            zip(test.events, test.packets)):
+            if new_id != test_id:
+                event['test_id'] = new_id
+                packet = None
+            if index == last and test_status is not None and (
+                new_status != test_status):
+                event['test_status'] = new_status
+                packet = None
+            self._write(event, packet)
+        if test_status is None:
+            # It never finished: finish it with the fixed up status.
+            self.output.status(test_id=new_id, test_status=new_status,
+                route_code=test.events[-1].get('route_code'),
+                timestamp=test.events[-1].get('timestamp'))
+
+    def _write(self, event, packet):
+        if packet is None:
+            self.output.status(**event)
+        else:
+            _write_all(self.output.output_stream, packet)
+            self.output.output_stream.flush()
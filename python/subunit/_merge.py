@@ -0,0 +1,124 @@
+#  subunit: extensions to python unittest to get test results from subprocesses.
+#  Copyright (C) 2009  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#  
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+
+
+"""Merge several v2 streams into one, ordered by packet timestamp."""
+
+import datetime
+import heapq
+import io
+import optparse
+import sys
+
+from subunit import iso8601
+from subunit.filters import output_buffering
+from subunit.v2 import ByteStreamDecoder, StreamResultToBytes
+
+
+# Packets with no timestamp before any that have one sort first.
+_START = datetime.datetime.min.replace(tzinfo=iso8601.Utc())
+
+
+def iter_events(source, block_size=65536):
+    """Yield the status events in a v2 stream, reading it a block at a time.
+
+    Non subunit content is reported as 'stdout' file events, as
+    run_tests_from_stream does.
+
+    :param source: A binary file-like object.
+    :return: An iterator of dicts of keyword arguments for
+        StreamResult.status.
+    """
+    decoder = ByteStreamDecoder(non_subunit_name='stdout')
+    read = getattr(source, 'read1', source.read)
+    while True:
+        data = read(block_size)
+        if not data:
+            break
+        for event in decoder.feed(data):
+            yield event
+    for event in decoder.close():
+        yield event
+
+
+def merge_streams(sources, result, route_codes=False):
+    """Merge the events in several v2 streams into result.
+
+    This is a k-way merge: each stream is held at its next event, on a heap
+    ordered by timestamp, so only one block of each stream is in memory at
+    a time. Each stream's own order is kept; an event without a timestamp
+    sorts as if it had the timestamp of the event before it in its stream.
+
+    :param sources: A list of binary file-like objects.
+    :param result: A StreamResult to send the merged events to.
+    :param route_codes: If True, prefix each event's route code with the
+        index of the stream it came from, so that '0/1' is route code '1' in
+        the first stream, and events with no route code get just the index.
+    """
+    streams = [iter_events(source) for source in sources]
+    heap = []
+    for index, events in enumerate(streams):
+        _push(heap, index, events, _START)
+    while heap:
+        timestamp, index, event = heapq.heappop(heap)
+        if route_codes:
+            if event.get('route_code') is None:
+                event['route_code'] = str(index)
+            else:
+                event['route_code'] = '%d/%s' % (index, event['route_code'])
+        result.status(**event)
+        _push(heap, index, streams[index], timestamp)
+
+
+def _push(heap, index, events, timestamp):
+    """Put the next event from a stream on the heap, if it has one.
+
+    :param timestamp: The timestamp of the stream's previous event.
+    """
+    for event in events:
+        if event.get('timestamp') is not None:
+            timestamp = event['timestamp']
+        # index is unique on the heap, so events are never compared.
+        heapq.heappush(heap, (timestamp, index, event))
+        return
+
+
+def merge(argv=None, stdin=None, stdout=None):
+    if stdout is None:
+        stdout = sys.stdout
+    if stdin is None:
+        stdin = sys.stdin
+    parser = optparse.OptionParser(
+        usage="%prog [options] [FILE...]",
+        description="Merge subunit v2 streams into one stream, interleaving "
+            "their packets by timestamp. Reads stdin if no files are given.")
+    parser.add_option(
+        "-r", "--route-codes", action="store_true", default=False,
+        help="Prefix each packet's route code with the number (from 0) of "
+            "the stream it came from.")
+    options, args = parser.parse_args(argv)
+    if args:
+        sources = [io.open(path, 'rb') for path in args]
+    else:
+        sources = [getattr(stdin, 'buffer', stdin)]
+    try:
+        output = StreamResultToBytes(stdout, **output_buffering(stdout))
+        output.startTestRun()
+        merge_streams(sources, output, route_codes=options.route_codes)
+        output.stopTestRun()
+    finally:
+        if args:
+            for source in sources:
+                source.close()
+    return 0
@@ -0,0 +1,212 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Transcode StreamResult events to a v1 subunit stream as they arrive.
+
+subunit-2to1 used to send events through StreamToExtendedDecorator, which
+holds every attachment of a test in memory until the test completes, and
+writes nothing about a test before then. StreamResultToV1 writes a test's
+``test:`` line as soon as it starts, spools its attachments to temporary
+files, and streams them out with the outcome.
+"""
+
+import tempfile
+
+from testtools import StreamResult
+from testtools.content import Content
+from testtools.content_type import ContentType
+
+from subunit import RemotedTestCase, TestProtocolClient, make_stream_binary
+from subunit.details import _iter_spooled
+from subunit.v2 import timestamp_to_datetime
+
+
+# The TestProtocolClient method for each final status. Tests that never got
+# one are reported as failures, as StreamToExtendedDecorator does.
+_outcomes = {
+    'success': 'addSuccess',
+    'fail': 'addFailure',
+    'skip': 'addSkip',
+    'xfail': 'addExpectedFailure',
+    'uxsuccess': 'addUnexpectedSuccess',
+    'inprogress': 'addFailure',
+    'unknown': 'addFailure',
+    }
+
+
+def _content_type(mime_type):
+    """Return a ContentType for a v2 MIME type, as StreamToExtendedDecorator.
+
+    Only the first of several comma separated charsets is kept.
+    """
+    if mime_type is None:
+        mime_type = 'application/octet-stream'
+    parts = mime_type.split(';')
+    primary, sub = parts[0].strip().split('/', 1)
+    parameters = {}
+    for part in parts[1:]:
+        if '=' in part:
+            name, value = part.split('=', 1)
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            parameters[name.strip().lower()] = value
+    if ',' in parameters.get('charset', ''):
+        parameters['charset'] = parameters['charset'].split(',', 1)[0]
+    return ContentType(primary.strip(), sub.strip(), parameters)
+
+
+class _Test(object):
+    """What is known about a test that has not finished."""
+
+    def __init__(self, test_id, route_code, timestamp):
+        self.id = test_id
+        self.key = (test_id, route_code)
+        self.case = RemotedTestCase(test_id)
+        self.started = timestamp
+        self.finished = None
+        self.status = 'unknown'
+        self.tags = None
+        self.files = {}
+        self.opened = False
+
+    def add_file(self, name, file_bytes, mime_type, spool_size):
+        if name not in self.files:
+            self.files[name] = (_content_type(mime_type),
+                tempfile.SpooledTemporaryFile(spool_size))
+        self.files[name][1].write(file_bytes)
+
+    def details(self):
+        details = {}
+        for name, (content_type, body) in self.files.items():
+            details[name] = Content(content_type,
+                lambda body=body: _iter_spooled(body))
+        return details
+
+    def close(self):
+        for content_type, body in self.files.values():
+            body.close()
+        self.files = {}
+
+
+class StreamResultToV1(StreamResult):
+    """Write StreamResult events to a stream as v1 subunit.
+
+    v1 cannot interleave tests, so one test at a time is open in the
+    output: its ``time:`` and ``test:`` lines are written when it starts, and
+    its tags and outcome when it finishes. Tests that start while another is
+    open are written whole once they have finished and the open test has
+    too. File events without a test id are written to the stream as they
+    arrive, and 'exists' events are dropped. Tests still in progress at
+    stopTestRun are reported as failures. Timestamps may be in any form
+    StreamResultToBytes accepts; they are only turned into datetimes as
+    ``time:`` lines are written.
+    """
+
+    def __init__(self, stream, spool_size=1024 * 1024):
+        """Create a StreamResultToV1.
+
+        :param stream: A file-like object to write the v1 stream to.
+        :param spool_size: Each attachment is kept in memory until it is
+            larger than this many bytes, and in a temporary file after that.
+        """
+        super(StreamResultToV1, self).__init__()
+        self._stream = make_stream_binary(stream)
+        self._client = TestProtocolClient(self._stream)
+        self._spool_size = spool_size
+        self._tests = {}
+        self._open = None
+        self._waiting = []
+
+    def status(self, test_id=None, test_status=None, test_tags=None,
+        runnable=True, file_name=None, file_bytes=None, eof=False,
+        mime_type=None, route_code=None, timestamp=None):
+        if test_status == 'exists':
+            return
+        if test_id is None:
+            if file_name is not None:
+                self._stream.write(file_bytes)
+                self._flush()
+            return
+        key = (test_id, route_code)
+        test = self._tests.get(key)
+        if test is None:
+            test = self._tests[key] = _Test(test_id, route_code, timestamp)
+            if self._open is None:
+                self._start(test)
+                self._open = test
+        test.finished = timestamp
+        if test_status is not None:
+            test.status = test_status
+        if file_name is not None and file_bytes:
+            test.add_file(file_name, file_bytes, mime_type, self._spool_size)
+        if test_tags is not None:
+            test.tags = test_tags
+        if test_status not in (None, 'inprogress'):
+            del self._tests[key]
+            self._finish(test)
+
+    def stopTestRun(self):
+        super(StreamResultToV1, self).stopTestRun()
+        while self._tests:
+            if self._open is not None:
+                key = self._open.key
+            else:
+                key = next(iter(self._tests))
+            test = self._tests.pop(key)
+            test.finished = None
+            self._finish(test)
+
+    def _flush(self):
+        flush = getattr(self._stream, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def _start(self, test):
+        """Write the time and test lines that start test."""
+        if test.started is not None:
+            self._client.time(timestamp_to_datetime(test.started))
+        self._client.startTest(test.case)
+        test.opened = True
+        self._flush()
+
+    def _finish(self, test):
+        """Write the end of test, or queue it if another test is open."""
+        if self._open is not None and self._open is not test:
+            self._waiting.append(test)
+            return
+        self._write_outcome(test)
+        self._open = None
+        waiting, self._waiting = self._waiting, []
+        for test in waiting:
+            self._write_outcome(test)
+        if self._tests:
+            # Open the longest running of the remaining tests.
+            self._open = next(iter(self._tests.values()))
+            self._start(self._open)
+        self._flush()
+
+    def _write_outcome(self, test):
+        if not test.opened:
+            self._start(test)
+        if test.tags:
+            self._client.tags(test.tags, set())
+        if test.finished is not None:
+            self._client.time(timestamp_to_datetime(test.finished))
+        getattr(self._client, _outcomes[test.status])(
+            test.case, details=test.details())
+        self._client.stopTest(test.case)
+        test.close()
@@ -0,0 +1,285 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Transcode v1 subunit streams straight to StreamResult events.
+
+subunit-1to2 used to parse v1 with TestProtocolServer into an
+ExtendedToStreamDecorator, which builds a RemotedTestCase, a details dict of
+Content objects and a tag context for every test only to turn them back into
+status events. The parser here reuses TestProtocolServer's state machine but
+calls StreamResult.status directly from its states, and writes multipart
+detail bodies out as file events while they are being decoded.
+"""
+
+import datetime
+
+from testtools.content import TracebackContent
+
+from subunit import (
+    _InTest,
+    _OutSideTest,
+    _ReadingDetails,
+    RemoteError,
+    RemotedTestCase,
+    TestProtocolServer,
+    chunked,
+    details,
+    iso8601,
+    make_stream_binary,
+    tags_to_new_gone,
+    )
+
+
+# Multipart detail content is written in file events of about this size.
+_FILE_EVENT_SIZE = 1024 * 1024
+
+
+class _OutSideTestToV2(_OutSideTest):
+    """_OutSideTest, reporting the test start as an inprogress event."""
+
+    def startTest(self, offset, line):
+        """A test start command received."""
+        self.parser._state = self.parser._in_test
+        test_name = line[offset:-1].decode('utf8')
+        self.parser._current_test = test_name
+        self.parser.current_test_description = test_name
+        self.parser._startTest_v2(test_name)
+        self.parser.subunitLineReceived(line)
+
+
+class _InTestToV2(_InTest):
+    """_InTest, reporting outcomes without details as status events."""
+
+    def _outcome(self, offset, line, no_details, details_state):
+        """An outcome directive has been read.
+
+        As _InTest._outcome, but no_details reports the whole outcome, so
+        there is no stopTest call to make.
+        """
+        test_name = line[offset:-1].decode('utf8')
+        if self.parser.current_test_description == test_name:
+            self.parser._state = self.parser._outside_test
+            self.parser.current_test_description = None
+            no_details()
+            self.parser.subunitLineReceived(line)
+        else:
+            super(_InTestToV2, self)._outcome(
+                offset, line, no_details, details_state)
+
+    def _error(self):
+        self.parser._outcome_v2('fail')
+
+    _failure = _error
+
+    def _xfail(self):
+        self.parser._outcome_v2('xfail')
+
+    def _uxsuccess(self):
+        self.parser._outcome_v2('uxsuccess')
+
+    def _skip(self):
+        self.parser._outcome_v2('skip')
+
+    def _succeed(self):
+        self.parser._outcome_v2('success')
+
+
+class _FileEvents(object):
+    """A file-like object writing what it is given as file events."""
+
+    def __init__(self, parser, name, mime_type):
+        self.parser = parser
+        self.name = name
+        self.mime_type = mime_type
+        self._pending = bytearray()
+
+    def write(self, data):
+        self._pending += data
+        if len(self._pending) >= _FILE_EVENT_SIZE:
+            self.parser._file_v2(self.name, bytes(self._pending),
+                self.mime_type)
+            del self._pending[:]
+
+    def close(self):
+        """Write whatever is left as the last event of the file."""
+        self.parser._file_v2(self.name, bytes(self._pending), self.mime_type,
+            eof=True)
+        del self._pending[:]
+
+
+class _MultipartDetailsToV2(details.MultipartDetailsParser):
+    """A MultipartDetailsParser writing each detail out as it is decoded."""
+
+    def _get_name(self, line):
+        name = line[:-1].decode('utf8')
+        mime_type = '%s/%s' % (
+            self._content_type.type, self._content_type.subtype)
+        self._body = _FileEvents(self._state.parser, name, mime_type)
+        self._chunk_parser = chunked.Decoder(self._body)
+        self._parse_state = self._feed_chunks
+
+    def _feed_chunks(self, line):
+        residue = self._chunk_parser.write(line)
+        if residue is not None:
+            # Line based use always ends on no residue.
+            assert residue == details.empty, 'residue: %r' % (residue,)
+            self._body.close()
+            self._chunk_parser.close()
+            self._parse_state = self._look_for_content
+
+
+class _ReadingDetailsToV2(_ReadingDetails):
+    """Reading the details of an outcome, for V1ToStreamResult.
+
+    One class serves every outcome, as the v2 status, the name and MIME type
+    of simple details, and the label for lost connections are all it needs.
+    """
+
+    def __init__(self, parser, status, name, mime_type, label):
+        super(_ReadingDetailsToV2, self).__init__(parser)
+        self._status = status
+        self._name = name
+        self._mime_type = mime_type
+        self._label = label
+
+    def endDetails(self):
+        """The end of a details section has been reached."""
+        self.parser._state = self.parser._outside_test
+        self.parser.current_test_description = None
+        if self.details_parser.get_message() is not None:
+            self.parser._file_v2(self._name,
+                self.details_parser.get_message(), self._mime_type, eof=True)
+        self.parser._outcome_v2(self._status)
+
+    def _outcome_label(self):
+        return self._label
+
+    def set_multipart(self):
+        """Start a multipart details parser."""
+        self.details_parser = _MultipartDetailsToV2(self)
+
+
+_traceback_mime = 'text/x-traceback; charset="utf8"'
+
+
+class V1ToStreamResult(TestProtocolServer):
+    """Parse a v1 stream, reporting it to a StreamResult.
+
+    The events are those ExtendedToStreamDecorator would report for the
+    same stream, except that multipart details are reported in file events
+    of up to 1MiB as they are decoded rather than all at once. Progress
+    directives are dropped, as v2 has no equivalent.
+    """
+
+    def __init__(self, result, stream=None, forward_stream=None):
+        """Create a V1ToStreamResult.
+
+        :param result: A StreamResult to report the tests to.
+        :param stream: As for TestProtocolServer.
+        :param forward_stream: As for TestProtocolServer.
+        """
+        super(V1ToStreamResult, self).__init__(result, stream, forward_stream)
+        self.result = result
+        self._in_test = _InTestToV2(self)
+        self._outside_test = _OutSideTestToV2(self)
+        self._reading_error_details = _ReadingDetailsToV2(
+            self, 'fail', 'traceback', _traceback_mime, 'error')
+        self._reading_failure_details = _ReadingDetailsToV2(
+            self, 'fail', 'traceback', _traceback_mime, 'failure')
+        self._reading_skip_details = _ReadingDetailsToV2(
+            self, 'skip', 'reason', 'text/plain', 'skip')
+        self._reading_success_details = _ReadingDetailsToV2(
+            self, 'success', 'message', 'text/plain', 'success')
+        self._reading_xfail_details = _ReadingDetailsToV2(
+            self, 'xfail', 'traceback', _traceback_mime, 'xfail')
+        self._reading_uxsuccess_details = _ReadingDetailsToV2(
+            self, 'uxsuccess', 'traceback', _traceback_mime, 'uxsuccess')
+        self._state = self._outside_test
+        self._time = None
+        self._global_tags = set()
+        self._test_tags = None
+
+    def _timestamp(self):
+        """The time of the last time directive, or now if there was none."""
+        if self._time is None:
+            return datetime.datetime.now(iso8601.UTC)
+        return self._time
+
+    def _startTest_v2(self, test_id):
+        self.result.status(test_id=test_id, test_status='inprogress',
+            timestamp=self._timestamp())
+        self._test_tags = set(self._global_tags)
+
+    def _file_v2(self, name, file_bytes, mime_type, eof=False):
+        self.result.status(test_id=self._current_test, file_name=name,
+            file_bytes=file_bytes, eof=eof, mime_type=mime_type,
+            timestamp=self._timestamp())
+
+    def _outcome_v2(self, test_status):
+        self.result.status(test_id=self._current_test,
+            test_status=test_status, test_tags=self._test_tags,
+            timestamp=self._timestamp())
+        self._current_test = None
+        self._test_tags = None
+
+    def _handleProgress(self, offset, line):
+        """Progress has no v2 equivalent, so is dropped."""
+
+    def _handleTags(self, offset, line):
+        """Process a tags command."""
+        tags = line[offset:].decode('utf8').split()
+        new_tags, gone_tags = tags_to_new_gone(tags)
+        if self._test_tags is None:
+            tags = self._global_tags
+        else:
+            tags = self._test_tags
+        tags.update(new_tags)
+        tags.difference_update(gone_tags)
+
+    def _handleTime(self, offset, line):
+        self._time = iso8601.parse_date(line[offset:-1])
+
+    def _lostConnectionInTest(self, state_string):
+        error_string = "lost connection during %stest '%s'" % (
+            state_string, self.current_test_description)
+        content = TracebackContent(RemoteError(error_string),
+            RemotedTestCase(self._current_test))
+        mime_type = repr(content.content_type)
+        chunks = list(content.iter_bytes()) or [b'']
+        for chunk in chunks[:-1]:
+            self._file_v2('traceback', chunk, mime_type)
+        self._file_v2('traceback', chunks[-1], mime_type, eof=True)
+        self._outcome_v2('fail')
+
+
+def v1_to_v2(input_stream, result, passthrough=None, block_size=65536):
+    """Report the v1 stream read from input_stream to result.
+
+    :param input_stream: A file-like object to read a v1 stream from.
+    :param result: A StreamResult, such as StreamResultToBytes. Its
+        startTestRun and stopTestRun methods are called.
+    :param passthrough: A stream to write non-subunit input to. If not
+        supplied, the TestProtocolServer default is used.
+    :param block_size: As for ProtocolTestCase.
+    """
+    input_stream = make_stream_binary(input_stream)
+    parser = V1ToStreamResult(result, passthrough)
+    result.startTestRun()
+    if getattr(input_stream, 'read1', None) is not None:
+        parser.readFrom(input_stream, block_size)
+    else:
+        parser.readFrom(input_stream)
+    result.stopTestRun()
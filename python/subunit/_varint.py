@@ -0,0 +1,79 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Encoder/decoder for the variable length numbers in v2 packets.
+
+The top two bits of the first byte give the number of bytes used (1-4), and
+the remaining 6, 14, 22 or 30 bits hold the value in network byte order.
+"""
+
+import struct
+
+# Every number below 16384 - which covers nearly all string lengths - is
+# encoded by table lookup.
+_TABLE_LIMIT = 16384
+_ENCODED = tuple(
+    [struct.pack('>B', value) for value in range(64)] +
+    [struct.pack('>H', value | 0x4000) for value in range(64, _TABLE_LIMIT)])
+# Indexed by the first byte of an encoded number.
+_WIDTHS = tuple(1 + (byte >> 6) for byte in range(256))
+# struct rather than int.to_bytes/from_bytes, which Python 2 lacks; these
+# also read bytes, bytearray and memoryview alike on every version.
+_pack_3 = struct.Struct('>BH').pack
+_pack_4 = struct.Struct('>I').pack
+_unpack_1 = struct.Struct('>B').unpack_from
+_unpack_2 = struct.Struct('>H').unpack_from
+_unpack_3 = struct.Struct('>BH').unpack_from
+_unpack_4 = struct.Struct('>I').unpack_from
+
+
+def encode(value):
+    """Return the bytes encoding value.
+
+    :raises ValueError: If value is negative or too large to encode.
+    """
+    if 0 <= value < _TABLE_LIMIT:
+        return _ENCODED[value]
+    elif _TABLE_LIMIT <= value < 4194304:
+        return _pack_3(0x80 | value >> 16, value & 0xffff)
+    elif 4194304 <= value < 1073741824:
+        return _pack_4(value | 0xc0000000)
+    raise ValueError('value too large to encode: %r' % (value,))
+
+
+def decode(data, pos):
+    """Decode the number starting at pos in data.
+
+    :param data: A bytes, bytearray or memoryview object.
+    :return: A tuple (value, bytes_consumed).
+    :raises ValueError: If data ends before the number does.
+    """
+    try:
+        first = _unpack_1(data, pos)[0]
+    except struct.error:
+        raise ValueError('no number at offset %d' % (pos,))
+    if first < 0x40:
+        return first, 1
+    width = _WIDTHS[first]
+    try:
+        if width == 2:
+            return _unpack_2(data, pos)[0] & 0x3fff, 2
+        elif width == 3:
+            high, low = _unpack_3(data, pos)
+            return (high & 0x3f) << 16 | low, 3
+        return _unpack_4(data, pos)[0] & 0x3fffffff, 4
+    except struct.error:
+        raise ValueError('number at offset %d is truncated' % (pos,))
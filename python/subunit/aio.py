@@ -0,0 +1,132 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Subunit v2 streams over asyncio streams.
+
+The rest of subunit does blocking IO; this module lets one event loop read
+and write many streams at once.
+"""
+
+from subunit.v2 import ByteStreamDecoder, StreamResultToBytes
+
+__all__ = [
+    'StreamReaderToStreamResult',
+    'StreamResultToStreamWriter',
+    ]
+
+
+class StreamReaderToStreamResult(object):
+    """Parse a subunit byte stream read from an asyncio StreamReader.
+
+    This is ByteStreamToStreamResult for asyncio: it reads with
+    ByteStreamDecoder rather than blocking, so one event loop can gather
+    results from many streams, for instance one per worker connection:
+
+       >>> await asyncio.gather(*[
+       ...     StreamReaderToStreamResult(reader).run(result)
+       ...     for reader in readers])
+    """
+
+    def __init__(self, reader, non_subunit_name=None, zero_copy=False,
+        read_size=65536):
+        """Create a StreamReaderToStreamResult.
+
+        :param reader: An asyncio.StreamReader to read bytes from.
+        :param non_subunit_name: If set to non-None, non subunit content
+            encountered in the stream will be converted into file packets
+            labelled with this name.
+        :param zero_copy: As for ByteStreamDecoder.
+        :param read_size: The most bytes to ask reader for at a time.
+        """
+        self.reader = reader
+        self.read_size = read_size
+        self.decoder = ByteStreamDecoder(non_subunit_name, zero_copy)
+
+    async def run(self, result):
+        """Parse the stream and emit events to result, until EOF."""
+        while True:
+            data = await self.reader.read(self.read_size)
+            if not data:
+                break
+            for event in self.decoder.feed(data):
+                result.status(**event)
+        for event in self.decoder.close():
+            result.status(**event)
+
+
+class _WriterStream(object):
+    """Present an asyncio.StreamWriter as the stream StreamResultToBytes
+    writes to.
+
+    Writes are buffered by the writer's transport, so they never block and
+    are never partial; flushing is left to StreamResultToStreamWriter.drain.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class StreamResultToStreamWriter(StreamResultToBytes):
+    """Write a subunit v2 stream to an asyncio StreamWriter.
+
+    Packets are encoded exactly as StreamResultToBytes encodes them. status()
+    is the usual synchronous StreamResult method and only adds to the
+    transport's buffer; for backpressure, await astatus() instead, or await
+    drain() now and then:
+
+       >>> result = StreamResultToStreamWriter(writer)
+       >>> await result.astatus(test_id='foo', test_status='success')
+       >>> await result.drain()
+    """
+
+    def __init__(self, writer, high_water=65536):
+        """Create a StreamResultToStreamWriter.
+
+        :param writer: An asyncio.StreamWriter to write the stream to.
+        :param high_water: drain() waits for the writer to drain whenever at
+            least this many bytes are waiting in its transport's buffer.
+        """
+        self.writer = writer
+        self.high_water = high_water
+        self.output_stream = _WriterStream(writer)
+
+    async def astatus(self, test_id=None, test_status=None, test_tags=None,
+        runnable=True, file_name=None, file_bytes=None, eof=False,
+        mime_type=None, route_code=None, timestamp=None):
+        """Write a status event, draining the writer as needed.
+
+        This takes the same arguments as status(), and calls drain() after
+        each packet, so that large file content read from a file-like or
+        iterable source is not all buffered at once.
+        """
+        for packet in self._packets(test_id=test_id, test_status=test_status,
+            test_tags=test_tags, runnable=runnable, file_name=file_name,
+            file_bytes=file_bytes, eof=eof, mime_type=mime_type,
+            route_code=route_code, timestamp=timestamp):
+            self._write_packet(**packet)
+            await self.drain()
+
+    async def drain(self):
+        """Wait for the writer to drain if high_water bytes are buffered."""
+        if self.writer.transport.get_write_buffer_size() >= self.high_water:
+            await self.writer.drain()
@@ -17,9 +17,17 @@
 
 """Encoder/decoder for http style chunked encoding."""
 
+import sys
+
 from testtools.compat import _b
 
 empty = _b('')
+_slash_n = _b('\n')
+_slash_r = _b('\r')
+_slash_rn = _b('\r\n')
+_slash_nr = _b('\n\r')
+_hex_digits = _b('0123456789abcdefABCDEF')
+_PY3 = (sys.version_info >= (3,))
 
 class Decoder(object):
     """Decode chunked content to a byte stream."""
@@ -29,11 +37,14 @@ class Decoder(object):
 
         :param output: A file-like object. Bytes written to the Decoder are
             decoded to strip off the chunking and written to the output.
-            Up to a full write worth of data or a single control line may be
-            buffered (whichever is larger). The close method should be called
-            when no more data is available, to detect short streams; the
-            write method will return none-None when the end of a stream is
-            detected. The output object must accept bytes objects.
+            Only an incomplete control line is buffered; body bytes are
+            passed to the output as they arrive, either as the object given
+            to write or as a slice of it (a memoryview on Python 3, so not
+            copied there). The close method should be called when no more
+            data is available, to detect short streams; the write method
+            will return none-None when the end of a stream is detected. The
+            output object must accept bytes-like objects and must not keep
+            them after its write method returns.
 
         :param strict: If True (the default), the decoder will not knowingly
             accept input that is not conformant to the HTTP specification.
@@ -42,15 +53,10 @@ class Decoder(object):
             unambiguous.
         """
         self.output = output
-        self.buffered_bytes = []
         self.state = self._read_length
         self.body_length = 0
         self.strict = strict
-        self._match_chars = _b("0123456789abcdefABCDEF\r\n")
-        self._slash_n = _b('\n')
-        self._slash_r = _b('\r')
-        self._slash_rn = _b('\r\n')
-        self._slash_nr = _b('\n\r')
+        self._header = bytearray()
 
     def close(self):
         """Close the decoder.
@@ -60,71 +66,53 @@ class Decoder(object):
         if self.state != self._finished:
             raise ValueError("incomplete stream")
 
-    def _finished(self):
-        """Finished reading, return any remaining bytes."""
-        if self.buffered_bytes:
-            buffered_bytes = self.buffered_bytes
-            self.buffered_bytes = []
-            return empty.join(buffered_bytes)
-        else:
-            raise ValueError("stream is finished")
+    def _finished(self, data, view, pos):
+        """Finished reading, nothing more is consumed."""
+        return pos
 
-    def _read_body(self):
+    def _read_body(self, data, view, pos):
         """Pass body bytes to the output."""
-        while self.body_length and self.buffered_bytes:
-            if self.body_length >= len(self.buffered_bytes[0]):
-                self.output.write(self.buffered_bytes[0])
-                self.body_length -= len(self.buffered_bytes[0])
-                del self.buffered_bytes[0]
-                # No more data available.
-                if not self.body_length:
-                    self.state = self._read_length
-            else:
-                self.output.write(self.buffered_bytes[0][:self.body_length])
-                self.buffered_bytes[0] = \
-                    self.buffered_bytes[0][self.body_length:]
-                self.body_length = 0
-                self.state = self._read_length
-                return self.state()
-
-    def _read_length(self):
+        length = min(self.body_length, len(data) - pos)
+        if length == len(data):
+            self.output.write(data)
+        elif _PY3:
+            self.output.write(view[pos:pos + length])
+        else:
+            # Python 2 file-likes can write the repr of a memoryview.
+            self.output.write(data[pos:pos + length])
+        self.body_length -= length
+        if not self.body_length:
+            self.state = self._read_length
+        return pos + length
+
+    def _read_length(self, data, view, pos):
         """Try to decode a length from the bytes."""
-        count_chars = []
-        for bytes in self.buffered_bytes:
-            for pos in range(len(bytes)):
-                byte = bytes[pos:pos+1]
-                if byte not in self._match_chars:
-                    break
-                count_chars.append(byte)
-                if byte == self._slash_n:
-                    break
-        if not count_chars:
-            return
-        if count_chars[-1] != self._slash_n:
-            return
-        count_str = empty.join(count_chars)
+        end = data.find(_slash_n, pos)
+        if end == -1:
+            self._header += view[pos:]
+            return len(data)
+        end += 1
+        if self._header:
+            self._header += view[pos:end]
+            count_str = bytes(self._header)
+            del self._header[:]
+        else:
+            count_str = data[pos:end]
         if self.strict:
-            if count_str[-2:] != self._slash_rn:
+            if count_str[-2:] != _slash_rn:
                 raise ValueError("chunk header invalid: %r" % count_str)
-            if self._slash_r in count_str[:-2]:
+            if _slash_r in count_str[:-2]:
                 raise ValueError("too many CRs in chunk header %r" % count_str)
-        self.body_length = int(count_str.rstrip(self._slash_nr), 16)
-        excess_bytes = len(count_str)
-        while excess_bytes:
-            if excess_bytes >= len(self.buffered_bytes[0]):
-                excess_bytes -= len(self.buffered_bytes[0])
-                del self.buffered_bytes[0]
-            else:
-                self.buffered_bytes[0] = self.buffered_bytes[0][excess_bytes:]
-                excess_bytes = 0
+        digits = count_str.rstrip(_slash_nr)
+        if not digits or digits.translate(None, _hex_digits):
+            raise ValueError("chunk header invalid: %r" % count_str)
+        # Python 2's int() cannot parse a bytearray.
+        self.body_length = int(bytes(digits), 16)
         if not self.body_length:
             self.state = self._finished
-            if not self.buffered_bytes:
-                # May not call into self._finished with no buffered data.
-                return empty
         else:
             self.state = self._read_body
-        return self.state()
+        return end
 
     def write(self, bytes):
         """Decode bytes to the output stream.
@@ -133,53 +121,80 @@ class Decoder(object):
             marker.
         :returns: None, or the excess bytes beyond the end of file marker.
         """
-        if bytes:
-            self.buffered_bytes.append(bytes)
-        return self.state()
+        if self.state == self._finished:
+            if not bytes:
+                raise ValueError("stream is finished")
+            return bytes
+        if self.state == self._read_body and 0 < len(bytes) < self.body_length:
+            # The common case of a write within a chunk body.
+            self.output.write(bytes)
+            self.body_length -= len(bytes)
+            return None
+        view = memoryview(bytes)
+        pos = 0
+        while pos < len(bytes):
+            pos = self.state(bytes, view, pos)
+            if self.state == self._finished:
+                return view[pos:].tobytes()
 
 
 class Encoder(object):
     """Encode content to a stream using HTTP Chunked coding."""
 
-    def __init__(self, output):
+    def __init__(self, output, chunk_size=65536):
         """Create an encoder encoding to output.
 
         :param output: A file-like object. Bytes written to the Encoder
             will be encoded using HTTP chunking. Small writes may be buffered
             and the ``close`` method must be called to finish the stream.
+        :param chunk_size: Writes are collected until they total at least
+            this many bytes, and then written as one chunk. A single write
+            at least this large is always written as a chunk of its own.
         """
         self.output = output
+        self.chunk_size = chunk_size
         self.buffered_bytes = []
         self.buffer_size = 0
 
+    def _take_chunk(self, extra_len=0):
+        """Return the header and buffered bytes of a chunk, and reset."""
+        chunk = [_b("%X\r\n" % (self.buffer_size + extra_len))]
+        chunk.extend(self.buffered_bytes)
+        self.buffered_bytes = []
+        self.buffer_size = 0
+        return chunk
+
     def flush(self, extra_len=0):
         """Flush the encoder to the output stream.
 
+        The chunk header and the buffered bytes are written together.
+
         :param extra_len: Increase the size of the chunk by this many bytes
             to allow for a subsequent write.
         """
         if not self.buffer_size and not extra_len:
             return
-        buffered_bytes = self.buffered_bytes
-        buffer_size = self.buffer_size
-        self.buffered_bytes = []
-        self.buffer_size = 0
-        self.output.write(_b("%X\r\n" % (buffer_size + extra_len)))
-        if buffer_size:
-            self.output.write(empty.join(buffered_bytes))
+        self.output.write(empty.join(self._take_chunk(extra_len)))
         return True
 
     def write(self, bytes):
         """Encode bytes to the output stream."""
         bytes_len = len(bytes)
-        if self.buffer_size + bytes_len >= 65536:
+        if bytes_len >= self.chunk_size:
+            # Large enough to write without copying it into a chunk.
             self.flush(bytes_len)
             self.output.write(bytes)
-        else:
+        elif bytes_len:
             self.buffered_bytes.append(bytes)
             self.buffer_size += bytes_len
+            if self.buffer_size >= self.chunk_size:
+                self.flush()
 
     def close(self):
         """Finish the stream. This does not close the output stream."""
-        self.flush()
-        self.output.write(_b("0\r\n"))
+        if self.buffer_size:
+            chunk = self._take_chunk()
+        else:
+            chunk = []
+        chunk.append(_b("0\r\n"))
+        self.output.write(empty.join(chunk))
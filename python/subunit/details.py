@@ -16,6 +16,8 @@
 
 """Handlers for outcome details."""
 
+import tempfile
+
 from testtools import content, content_type
 from testtools.compat import _b, BytesIO
 
@@ -26,9 +28,28 @@ quoted_marker = _b(" ]")
 empty = _b('')
 
 
+def _iter_spooled(body, read_size=65536):
+    """Yield the content of a spooled detail body, read_size bytes at a time.
+
+    The position is sought before each read, so the content may be iterated
+    more than once.
+    """
+    pos = 0
+    while True:
+        body.seek(pos)
+        data = body.read(read_size)
+        if not data:
+            return
+        pos += len(data)
+        yield data
+
+
 class DetailsParser(object):
     """Base class/API reference for details parsing."""
 
+    def close(self):
+        """Release anything held for the details once they are reported."""
+
 
 class SimpleDetailsParser(DetailsParser):
     """Parser for single-part [] delimited details."""
@@ -74,9 +95,21 @@ class SimpleDetailsParser(DetailsParser):
 class MultipartDetailsParser(DetailsParser):
     """Parser for multi-part [] surrounded MIME typed chunked details."""
 
-    def __init__(self, state):
+    def __init__(self, state, spool_size=None):
+        """Create a MultipartDetailsParser.
+
+        :param state: The parser state to call endDetails on.
+        :param spool_size: If None (the default) each detail is collected in
+            memory. Otherwise details are collected in a
+            ``tempfile.SpooledTemporaryFile`` which moves to disk once it
+            holds more than spool_size bytes, and are read back from it a
+            block at a time when the content is iterated - until close() is
+            called.
+        """
         self._state = state
+        self._spool_size = spool_size
         self._details = {}
+        self._spooled = []
         self._parse_state = self._look_for_content
 
     def _look_for_content(self, line):
@@ -94,7 +127,11 @@ class MultipartDetailsParser(DetailsParser):
 
     def _get_name(self, line):
         self._name = line[:-1].decode('utf8')
-        self._body = BytesIO()
+        if self._spool_size is None:
+            self._body = BytesIO()
+        else:
+            self._body = tempfile.SpooledTemporaryFile(self._spool_size)
+            self._spooled.append(self._body)
         self._chunk_parser = chunked.Decoder(self._body)
         self._parse_state = self._feed_chunks
 
@@ -104,14 +141,24 @@ class MultipartDetailsParser(DetailsParser):
             # Line based use always ends on no residue.
             assert residue == empty, 'residue: %r' % (residue,)
             body = self._body
+            if self._spool_size is None:
+                get_bytes = lambda:[body.getvalue()]
+            else:
+                get_bytes = lambda:_iter_spooled(body)
             self._details[self._name] = content.Content(
-                self._content_type, lambda:[body.getvalue()])
+                self._content_type, get_bytes)
             self._chunk_parser.close()
             self._parse_state = self._look_for_content
 
     def get_details(self, for_skip=False):
         return self._details
 
+    def close(self):
+        """Close the files details were spooled to."""
+        spooled, self._spooled = self._spooled, []
+        for body in spooled:
+            body.close()
+
     def get_message(self):
         return None
 
@@ -15,6 +15,8 @@
 
 
 from optparse import OptionParser
+import os
+import stat
 import sys
 
 from extras import safe_hasattr
@@ -25,6 +27,7 @@ from subunit import (
     StreamResultToBytes,
     )
 from subunit.test_results import CatFiles
+from subunit.v2 import INPUT_BLOCK_SIZE
 
 
 def make_options(description):
@@ -43,8 +46,32 @@ def make_options(description):
     return parser
 
 
+# Batching used for v2 output written to regular files.
+OUTPUT_BUFFER_SIZE = 65536
+OUTPUT_FLUSH_INTERVAL = 0.5
+
+
+def output_buffering(stream):
+    """Choose StreamResultToBytes buffering arguments for an output stream.
+
+    Regular files are written in batches. Anything else - a terminal, or a
+    pipe that someone may be watching - is flushed after every packet.
+
+    :return: A dict of keyword arguments for StreamResultToBytes.
+    """
+    try:
+        mode = os.fstat(stream.fileno()).st_mode
+    except (AttributeError, EnvironmentError, ValueError):
+        return {}
+    if not stat.S_ISREG(mode):
+        return {}
+    return dict(
+        buffer_size=OUTPUT_BUFFER_SIZE, flush_interval=OUTPUT_FLUSH_INTERVAL)
+
+
 def run_tests_from_stream(input_stream, result, passthrough_stream=None,
-    forward_stream=None, protocol_version=1, passthrough_subunit=True):
+    forward_stream=None, protocol_version=1, passthrough_subunit=True,
+    spool_size=None):
     """Run tests from a subunit input stream through 'result'.
 
     Non-test events - top level file attachments - are expected to be
@@ -68,11 +95,14 @@ def run_tests_from_stream(input_stream, result, passthrough_stream=None,
         otherwise unwrap it. Only has effect when forward_stream is None.
         (when forwarding as subunit non-subunit input is always turned into
         subunit)
+    :param spool_size: For version 1 input, collect multipart details larger
+        than this many bytes in temporary files rather than in memory. They
+        are closed when each test stops, so result must read them by then.
     """
     if 1==protocol_version:
         test = ProtocolTestCase(
             input_stream, passthrough=passthrough_stream,
-            forward=forward_stream)
+            forward=forward_stream, spool_size=spool_size)
     elif 2==protocol_version:
         # In all cases we encapsulate unknown inputs.
         if forward_stream is not None:
@@ -97,7 +127,7 @@ def run_tests_from_stream(input_stream, result, passthrough_stream=None,
             result = StreamResultRouter(result)
             result.add_rule(passthrough_result, 'test_id', test_id=None)
         test = ByteStreamToStreamResult(input_stream,
-            non_subunit_name='stdout')
+            non_subunit_name='stdout', block_size=INPUT_BLOCK_SIZE)
     else:
         raise Exception("Unknown protocol version.")
     result.startTestRun()
@@ -107,7 +137,7 @@ def run_tests_from_stream(input_stream, result, passthrough_stream=None,
 
 def filter_by_result(result_factory, output_path, passthrough, forward,
                      input_stream=sys.stdin, protocol_version=1,
-                     passthrough_subunit=True):
+                     passthrough_subunit=True, spool_size=None):
     """Filter an input stream using a test result.
 
     :param result_factory: A callable that when passed an output stream
@@ -123,6 +153,7 @@ def filter_by_result(result_factory, output_path, passthrough, forward,
         ``sys.stdin``.
     :param protocol_version: The subunit protocol version to expect.
     :param passthrough_subunit: If True, passthrough should be as subunit.
+    :param spool_size: As for run_tests_from_stream.
     :return: A test result with the results of the run.
     """
     if passthrough:
@@ -150,7 +181,7 @@ def filter_by_result(result_factory, output_path, passthrough, forward,
         run_tests_from_stream(
             input_stream, result, passthrough_stream, forward_stream,
             protocol_version=protocol_version,
-            passthrough_subunit=passthrough_subunit)
+            passthrough_subunit=passthrough_subunit, spool_size=spool_size)
     finally:
         if output_path:
             output_to.close()
@@ -158,7 +189,7 @@ def filter_by_result(result_factory, output_path, passthrough, forward,
 
 
 def run_filter_script(result_factory, description, post_run_hook=None,
-    protocol_version=1, passthrough_subunit=True):
+    protocol_version=1, passthrough_subunit=True, spool_size=None):
     """Main function for simple subunit filter scripts.
 
     Many subunit filter scripts take a stream of subunit input and use a
@@ -173,6 +204,7 @@ def run_filter_script(result_factory, description, post_run_hook=None,
     :param description: A description of the filter script.
     :param protocol_version: What protocol version to consume/emit.
     :param passthrough_subunit: If True, passthrough should be as subunit.
+    :param spool_size: As for run_tests_from_stream.
     """
     parser = make_options(description)
     (options, args) = parser.parse_args()
@@ -180,7 +212,7 @@ def run_filter_script(result_factory, description, post_run_hook=None,
         result_factory, options.output_to, not options.no_passthrough,
         options.forward, protocol_version=protocol_version,
         passthrough_subunit=passthrough_subunit,
-        input_stream=find_stream(sys.stdin, args))
+        input_stream=find_stream(sys.stdin, args), spool_size=spool_size)
     if post_run_hook:
         post_run_hook(result)
     if not safe_hasattr(result, 'wasSuccessful'):
@@ -0,0 +1,324 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+"""Random access to the tests in a v2 stream stored in a file.
+
+build_index() scans a stream once and writes a sidecar index recording,
+for each test, its status and the offsets of its packets - those with a
+status and those holding each of its attachments. StreamIndex loads that
+index and memory maps the stream, so that a test's packets can be decoded
+without reading the rest of the stream.
+
+The index is a text file of JSON lines: a header giving the format version
+and the size and modification time of the stream it was built from, then
+one line per test, in the order the tests finished:
+
+  {"id": "foo", "route_code": "0", "status": "fail",
+   "packets": [[offset, length], ...], "statuses": [0, 3],
+   "files": {"traceback": [1, 2]}}
+
+where statuses and files are positions in packets. A test id reported under
+several route codes - by different workers, say - has an entry for each.
+"""
+
+import io
+import json
+import mmap
+import os
+
+from subunit.v2 import _PY3, ParseError, SIGNATURE, _PacketDecoder
+
+__all__ = [
+    'StaleIndexError',
+    'StreamIndex',
+    'build_index',
+    'index_path',
+    'load_index',
+    ]
+
+INDEX_VERSION = 2
+
+
+class StaleIndexError(Exception):
+    """An index does not match the stream it is for."""
+
+
+def index_path(stream_path):
+    """Return the path of the sidecar index for stream_path."""
+    return stream_path + '.index'
+
+
+def _stream_stamp(stream_path):
+    stat = os.stat(stream_path)
+    return stat.st_size, stat.st_mtime
+
+
+class _PacketScanner(_PacketDecoder):
+    """Find and decode the packets in a stream held in memory."""
+
+    def __init__(self, zero_copy):
+        self.zero_copy = zero_copy
+        self.raw_timestamps = False
+
+    def decode_at(self, view, offset, length):
+        """Decode the packet at offset, raising ParseError if it is bad."""
+        if length < 6 or offset + length > len(view):
+            raise ParseError('Packet extends past end of stream')
+        length_from_packet, consumed = self._parse_varint(
+            view, offset + 3, max_3_bytes=True)
+        if length_from_packet != length:
+            raise ParseError('Packet length changed')
+        return self._decode_packet(view[offset:offset + length], consumed)
+
+    def scan(self, data, view):
+        """Yield (offset, length, event) for each good packet in data.
+
+        Anything that is not a good packet - non subunit content or a
+        damaged packet - is skipped, a byte at a time until the next
+        signature.
+        """
+        pos = 0
+        end = len(data)
+        while True:
+            pos = data.find(SIGNATURE, pos)
+            if pos == -1 or end - pos < 6:
+                return
+            try:
+                length = self._parse_varint(view, pos + 3, max_3_bytes=True)[0]
+                event = self.decode_at(view, pos, length)
+            except ParseError:
+                pos += 1
+                continue
+            yield pos, length, event
+            pos += length
+
+
+class _Map(object):
+    """A read only memory map of a file; empty files get an empty buffer."""
+
+    def __init__(self, path):
+        self._file = io.open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self.data = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b''
+        if _PY3:
+            self.view = memoryview(self.data)
+        else:
+            # Python 2 cannot make a memoryview of a map, but slicing one
+            # copies just the slice.
+            self.view = self.data
+
+    def close(self):
+        if _PY3:
+            self.view.release()
+        if not isinstance(self.data, bytes):
+            try:
+                self.data.close()
+            except BufferError:
+                # A slice of the map is still alive - perhaps in the
+                # traceback of an exception being raised, which this must
+                # not mask. The map is unmapped once the slice is collected.
+                pass
+        self._file.close()
+
+
+def _scan_tests(stream_path):
+    """Return the index entries of the tests in a stream, in index order."""
+    tests = {}
+    stream = _Map(stream_path)
+    try:
+        for offset, length, event in _PacketScanner(True).scan(
+            stream.data, stream.view):
+            # Drop the view of any file content before unmapping.
+            event['file_bytes'] = None
+            test_id = event['test_id']
+            if test_id is None:
+                continue
+            key = event['route_code'], test_id
+            entry = tests.get(key)
+            if entry is None:
+                entry = tests[key] = dict(id=test_id,
+                    route_code=event['route_code'], status=None,
+                    packets=[], statuses=[], files={})
+            position = len(entry['packets'])
+            entry['packets'].append([offset, length])
+            if event['file_name'] is not None:
+                entry['files'].setdefault(event['file_name'], []).append(
+                    position)
+            if (event['test_status'] is not None or
+                event['file_name'] is None):
+                entry['statuses'].append(position)
+                if event['test_status'] is not None:
+                    entry['status'] = event['test_status']
+    finally:
+        stream.close()
+    return sorted(tests.values(), key=lambda entry: entry['packets'][-1][0])
+
+
+def build_index(stream_path, path=None):
+    """Index the tests in a v2 stream stored in a file.
+
+    :param stream_path: The path of the stream.
+    :param path: Where to write the index; defaults to index_path().
+    :return: The path of the index written.
+    """
+    if path is None:
+        path = index_path(stream_path)
+    size, mtime = _stream_stamp(stream_path)
+    entries = _scan_tests(stream_path)
+    with io.open(path, 'w', encoding='utf8') as index:
+        index.write(u'%s\n' % json.dumps(
+            dict(version=INDEX_VERSION, size=size, mtime=mtime)))
+        for entry in entries:
+            index.write(u'%s\n' % json.dumps(entry))
+    return path
+
+
+def load_index(stream_path, path=None):
+    """Return a StreamIndex for a stream, building the index if needed.
+
+    The index is (re)built when it is missing or stale.
+    """
+    if path is None:
+        path = index_path(stream_path)
+    if os.path.exists(path):
+        try:
+            return StreamIndex(stream_path, path)
+        except StaleIndexError:
+            pass
+    build_index(stream_path, path)
+    return StreamIndex(stream_path, path)
+
+
+class StreamIndex(object):
+    """Look up tests in a v2 stream stored in a file, using its index.
+
+    Typical use:
+
+       >>> with load_index('run.subunit') as index:
+       ...     index.file_bytes('test_foo', 'traceback')
+    """
+
+    def __init__(self, stream_path, path=None):
+        """Load an index.
+
+        :param stream_path: The path of the stream.
+        :param path: The path of the index; defaults to index_path().
+        :raises StaleIndexError: If the index was not built from the stream
+            as it is now.
+        """
+        if path is None:
+            path = index_path(stream_path)
+        with io.open(path, 'r', encoding='utf8') as index:
+            header = json.loads(index.readline())
+            if (header.get('version') != INDEX_VERSION or
+                (header['size'], header['mtime']) !=
+                _stream_stamp(stream_path)):
+                raise StaleIndexError(path)
+            self._tests = {}
+            self._entries = []
+            for line in index:
+                entry = json.loads(line)
+                self._tests.setdefault(entry['id'], {})[
+                    entry['route_code']] = entry
+                self._entries.append(entry)
+        # The ids of the tests in index order; an id run under several
+        # route codes appears once for each.
+        self.test_ids = [entry['id'] for entry in self._entries]
+        self._stream = _Map(stream_path)
+        self._scanner = _PacketScanner(False)
+
+    def close(self):
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, test_id):
+        return test_id in self._tests
+
+    def route_codes(self, test_id):
+        """Return the route codes test_id was reported under."""
+        return sorted(self._tests[test_id],
+            key=lambda route_code: (route_code is not None, route_code))
+
+    def _entry(self, test_id, route_code):
+        by_route = self._tests[test_id]
+        if route_code is None and len(by_route) == 1:
+            return next(iter(by_route.values()))
+        try:
+            return by_route[route_code]
+        except KeyError:
+            raise KeyError('%s was not reported under route code %r' % (
+                test_id, route_code))
+
+    def status(self, test_id, route_code=None):
+        """Return the last status reported for test_id.
+
+        This and the other lookups take the route code of the test when it
+        was reported under several; otherwise it may be left out.
+        """
+        return self._entry(test_id, route_code)['status']
+
+    def file_names(self, test_id, route_code=None):
+        """Return the names of the attachments of test_id."""
+        return sorted(self._entry(test_id, route_code)['files'])
+
+    def events(self, test_id, statuses_only=False, route_code=None):
+        """Decode the packets of test_id.
+
+        :param statuses_only: If True, skip packets that only hold
+            attachment content.
+        :return: A list of dicts of keyword arguments for
+            StreamResult.status.
+        """
+        return self._events(
+            self._entry(test_id, route_code), statuses_only)
+
+    def file_bytes(self, test_id, file_name, route_code=None):
+        """Return the content of one attachment of test_id."""
+        entry = self._entry(test_id, route_code)
+        return b''.join(
+            self._decode(*entry['packets'][position])['file_bytes']
+            for position in entry['files'][file_name])
+
+    def replay(self, result, statuses_only=False):
+        """Send the events of every test to result, a test at a time.
+
+        :param result: A StreamResult.
+        :param statuses_only: As for events().
+        """
+        for entry in self._entries:
+            for event in self._events(entry, statuses_only):
+                result.status(**event)
+
+    def _events(self, entry, statuses_only):
+        packets = entry['packets']
+        if statuses_only:
+            packets = [packets[position] for position in entry['statuses']]
+        return [self._decode(offset, length) for offset, length in packets]
+
+    def _decode(self, offset, length):
+        try:
+            return self._scanner.decode_at(self._stream.view, offset, length)
+        except ParseError:
+            raise StaleIndexError(
+                'No packet at offset %d of the stream' % offset)
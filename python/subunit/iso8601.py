@@ -29,6 +29,7 @@ datetime.datetime(2007, 1, 25, 12, 0, tzinfo=<iso8601.iso8601.Utc ...>)
 
 """
 
+from collections import OrderedDict
 from datetime import datetime, timedelta, tzinfo
 import re
 import sys
@@ -43,6 +44,14 @@ ISO8601_REGEX_PATTERN = (r"(?P<year>[0-9]{4})(-(?P<month>[0-9]{1,2})(-(?P<day>[0
 TIMEZONE_REGEX_PATTERN = "(?P<prefix>[+-])(?P<hours>[0-9]{2}).(?P<minutes>[0-9]{2})"
 ISO8601_REGEX = re.compile(ISO8601_REGEX_PATTERN.encode('utf8'))
 TIMEZONE_REGEX = re.compile(TIMEZONE_REGEX_PATTERN.encode('utf8'))
+# The exact form TestProtocolClient.time emits: checked before the general
+# regex, as nearly every timestamp in a subunit stream looks like this.
+_FAST_REGEX = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2})[ T]([0-9]{2}):([0-9]{2}):([0-9]{2})"
+    r"\.([0-9]{6})Z\Z".encode('utf8'))
+# How many distinct non-UTC offsets parse_timezone remembers.
+_TIMEZONE_CACHE_SIZE = 64
+_timezone_cache = OrderedDict()
 
 zulu = "Z".encode('latin-1')
 minus = "-".encode('latin-1')
@@ -101,13 +110,21 @@ def parse_timezone(tzstring, default_timezone=UTC):
     # Addresses issue 4.
     if tzstring is None:
         return default_timezone
-    m = TIMEZONE_REGEX.match(tzstring)
-    prefix, hours, minutes = m.groups()
-    hours, minutes = int(hours), int(minutes)
-    if prefix == minus:
-        hours = -hours
-        minutes = -minutes
-    return FixedOffset(hours, minutes, tzstring)
+    try:
+        tz = _timezone_cache.pop(tzstring)
+    except KeyError:
+        m = TIMEZONE_REGEX.match(tzstring)
+        prefix, hours, minutes = m.groups()
+        hours, minutes = int(hours), int(minutes)
+        if prefix == minus:
+            hours = -hours
+            minutes = -minutes
+        tz = FixedOffset(hours, minutes, tzstring)
+        if len(_timezone_cache) >= _TIMEZONE_CACHE_SIZE:
+            _timezone_cache.popitem(last=False)
+    # Reinsert so the most recently used offsets are evicted last.
+    _timezone_cache[tzstring] = tz
+    return tz
 
 def parse_date(datestring, default_timezone=UTC):
     """Parses ISO 8601 dates into datetime objects
@@ -119,6 +136,9 @@ def parse_date(datestring, default_timezone=UTC):
     """
     if not isinstance(datestring, bytes):
         raise ParseError("Expecting bytes %r" % datestring)
+    m = _FAST_REGEX.match(datestring)
+    if m is not None:
+        return datetime(*map(int, m.groups()), tzinfo=default_timezone)
     m = ISO8601_REGEX.match(datestring)
     if not m:
         raise ParseError("Unable to parse date string %r" % datestring)
@@ -127,7 +147,9 @@ def parse_date(datestring, default_timezone=UTC):
     if groups["fraction"] is None:
         groups["fraction"] = 0
     else:
-        groups["fraction"] = int(float("0.%s" % groups["fraction"].decode()) * 1e6)
+        # Truncate or pad to microseconds without a float round trip, which
+        # can lose a microsecond.
+        groups["fraction"] = int(groups["fraction"][:6].ljust(6, b"0"))
     return datetime(int(groups["year"]), int(groups["month"]), int(groups["day"]),
         int(groups["hour"]), int(groups["minute"]), int(groups["second"]),
         int(groups["fraction"]), tz)
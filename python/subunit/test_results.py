@@ -16,8 +16,12 @@
 
 """TestResult helper classes used to by subunit."""
 
+from bisect import bisect_right
+from collections import OrderedDict
 import csv
 import datetime
+from fnmatch import translate
+import re
 
 import testtools
 from testtools.content import (
@@ -334,66 +338,242 @@ def make_tag_filter(with_tags, without_tags):
     return check_tags
 
 
-class _PredicateFilter(TestResultDecorator, TagsMixin):
+def _compile_re_from_list(l):
+    return re.compile("|".join(l), re.MULTILINE)
+
+
+def _detail_texts(err, details):
+    """Yield the error and the text attachments of a test, one at a time.
+
+    Attachments are only read as they are reached, so a match on an early
+    one saves decoding the rest.
+    """
+    if err is not None:
+        yield str(err)
+    for content in (details or {}).values():
+        content_type = content.content_type
+        if content_type.type != 'text':
+            continue
+        charset = content_type.parameters.get('charset', 'utf8')
+        data = b''.join(content.iter_bytes())
+        try:
+            text = data.decode(charset, 'replace')
+        except LookupError:
+            # An unknown charset: fall back to the default.
+            text = data.decode('utf8', 'replace')
+        yield text
+
+
+# Constructs that look past the end of what they match, so that a match in
+# a string is not necessarily a match in a longer string starting with it.
+_LOOKS_AHEAD = re.compile(r'\$|\\[ZbB]|\(\?[=!]')
+
+
+def make_regexp_filter(with_regexps, without_regexps, with_id_regexps=None,
+    with_detail_regexps=None):
+    """Make a callback that checks tests against regexps.
+
+    Each argument is either a list of regexp strings or None. A test passes
+    if it matches none of without_regexps and, when any of the others are
+    given, at least one of them. with_regexps and without_regexps are
+    searched for in the test name, outcome, error and details together.
+    with_id_regexps match only the test id and with_detail_regexps only the
+    error and text attachments.
+
+    The details are only rendered when the test id and outcome do not
+    already decide the match. with_regexps and without_regexps are tried
+    against the name and outcome on their own first, unless they use '$',
+    '\\Z', '\\b', '\\B' or a lookahead, which can match differently once the
+    details follow.
+    """
+    with_re = with_regexps and _compile_re_from_list(with_regexps)
+    without_re = without_regexps and _compile_re_from_list(without_regexps)
+    with_id_re = with_id_regexps and _compile_re_from_list(with_id_regexps)
+    with_detail_re = with_detail_regexps and _compile_re_from_list(
+        with_detail_regexps)
+    including = with_re or with_id_re or with_detail_re
+    with_early = with_re and not _LOOKS_AHEAD.search(with_re.pattern)
+    without_early = without_re and not _LOOKS_AHEAD.search(without_re.pattern)
+
+    def check_regexps(test, outcome, err, details, tags):
+        """Check if this test and error match the regexp filters."""
+        test_str = str(test) + outcome
+        if without_early and without_re.search(test_str):
+            return False
+        rendered = []
+        def full_str():
+            if not rendered:
+                rendered.append(test_str + str(err) + str(details))
+            return rendered[0]
+        if including and not (
+            (with_id_re and with_id_re.search(test.id())) or
+            (with_early and with_re.search(test_str))):
+            # Only the checks that read the details are left.
+            if not (
+                (with_re and with_re.search(full_str())) or
+                (with_detail_re and any(with_detail_re.search(text)
+                    for text in _detail_texts(err, details)))):
+                return False
+        return not (without_re and without_re.search(full_str()))
+    return check_regexps
+
+
+def _filtered_outcomes(filter_error, filter_failure, filter_success,
+    filter_skip, filter_xfail):
+    """Return the set of outcome names the filter_* arguments exclude."""
+    flags = [(filter_error, 'error'), (filter_failure, 'failure'),
+        (filter_success, 'success'), (filter_skip, 'skip'),
+        (filter_xfail, 'expectedfailure')]
+    return frozenset(outcome for flag, outcome in flags if flag)
+
+
+def _tags_compat(filter_predicate):
+    """Wrap filter_predicate so it may leave out the tags parameter."""
+    def compat(test, outcome, error, details, tags):
+        # 0.0.7 and earlier did not support the 'tags' parameter.
+        try:
+            return filter_predicate(
+                test, outcome, error, details, tags)
+        except TypeError:
+            return filter_predicate(test, outcome, error, details)
+    return compat
+
+
+def _update_tags(current_new, current_gone, new_tags, gone_tags):
+    """Apply a tags call to a (new, gone) scope, as TagsMixin.tags does."""
+    current_new.update(new_tags)
+    current_new.difference_update(gone_tags)
+    current_gone.update(gone_tags)
+    current_gone.difference_update(new_tags)
+
+
+# Marks an outcome whose method takes no err or reason argument.
+_NO_ERR = object()
+
+
+class _FilteredTest(object):
+    """What _PredicateFilter holds back of the test in progress.
+
+    One of these is reused for every test, along with its outcome list and
+    the sets of tags given before the first outcome. Tags given after an
+    outcome are kept by that outcome's position in late_tags, as they are
+    sent after it.
+    """
+
+    __slots__ = ('test', 'filtered', 'new_tags', 'gone_tags', 'outcomes',
+        'late_tags')
+
+    def __init__(self):
+        self.new_tags = set()
+        self.gone_tags = set()
+        self.outcomes = []
+        self.late_tags = {}
+        self.reset(None)
+
+    def reset(self, test):
+        self.test = test
+        self.filtered = False
+        self.new_tags.clear()
+        self.gone_tags.clear()
+        del self.outcomes[:]
+        self.late_tags.clear()
+
+
+class _PredicateFilter(TestResultDecorator):
+    """Pass on the tests that a predicate accepts.
+
+    Each test is held in a _FilteredTest until stopTest, and passed on then
+    with all of its outcomes if none of them was filtered. Consecutive time
+    calls are collapsed to the first and last, and consecutive tags calls to
+    one, as TimeCollapsingDecorator over TagCollapsingDecorator would: tags
+    held back are sent ahead of the next event, times included.
+    """
 
     def __init__(self, result, predicate):
         super(_PredicateFilter, self).__init__(result)
-        self._clear_tags()
-        self.decorated = TimeCollapsingDecorator(
-            TagCollapsingDecorator(self.decorated))
         self._predicate = predicate
-        # The current test (for filtering tags)
-        self._current_test = None
-        # Has the current test been filtered (for outputting test tags)
-        self._current_test_filtered = None
-        # Calls to this result that we don't know whether to forward on yet.
-        self._buffered_calls = []
+        # The tags the predicate is given, outside of any test.
+        self._global_new_tags = set()
+        self._global_gone_tags = set()
+        # Tags and time not yet sent on.
+        self._pending_new_tags = set()
+        self._pending_gone_tags = set()
+        self._last_received_time = None
+        self._last_sent_time = None
+        self._test = _FilteredTest()
+        self._in_test = False
+
+    def _flush_tags(self):
+        if self._pending_new_tags or self._pending_gone_tags:
+            self.decorated.tags(
+                set(self._pending_new_tags), set(self._pending_gone_tags))
+            self._pending_new_tags.clear()
+            self._pending_gone_tags.clear()
+
+    def _send_time(self, a_time):
+        self._flush_tags()
+        self.decorated.time(a_time)
+        self._last_sent_time = a_time
+
+    def _before_event(self):
+        """Send on any time and tags held back, ahead of another event."""
+        if self._last_received_time is not None:
+            if self._last_received_time != self._last_sent_time:
+                self._send_time(self._last_received_time)
+            self._last_received_time = None
+        self._flush_tags()
+
+    def _get_active_tags(self):
+        if not self._in_test:
+            return set(self._global_new_tags)
+        current = self._test
+        if not current.late_tags:
+            return self._global_new_tags.difference(
+                current.gone_tags).union(current.new_tags)
+        new_tags = set(current.new_tags)
+        gone_tags = set(current.gone_tags)
+        for position in sorted(current.late_tags):
+            _update_tags(new_tags, gone_tags, *current.late_tags[position])
+        return self._global_new_tags.difference(gone_tags).union(new_tags)
 
     def filter_predicate(self, test, outcome, error, details):
         return self._predicate(
             test, outcome, error, details, self._get_active_tags())
 
+    def _add_outcome(self, test, outcome, name, err, details):
+        if name is not None and not self.filter_predicate(
+            test, name, None if err is _NO_ERR else err, details):
+            self._test.filtered = True
+            return
+        if not self._in_test:
+            self._before_event()
+            self._call_outcome(test, outcome, err, details)
+            return
+        self._test.outcomes.append((outcome, err, details))
+
     def addError(self, test, err=None, details=None):
-        if (self.filter_predicate(test, 'error', err, details)):
-            self._buffered_calls.append(
-                ('addError', [test, err], {'details': details}))
-        else:
-            self._filtered()
+        self._add_outcome(test, self.decorated.addError, 'error', err,
+            details)
 
     def addFailure(self, test, err=None, details=None):
-        if (self.filter_predicate(test, 'failure', err, details)):
-            self._buffered_calls.append(
-                ('addFailure', [test, err], {'details': details}))
-        else:
-            self._filtered()
+        self._add_outcome(test, self.decorated.addFailure, 'failure', err,
+            details)
 
     def addSkip(self, test, reason=None, details=None):
-        if (self.filter_predicate(test, 'skip', reason, details)):
-            self._buffered_calls.append(
-                ('addSkip', [test, reason], {'details': details}))
-        else:
-            self._filtered()
+        self._add_outcome(test, self.decorated.addSkip, 'skip', reason,
+            details)
 
     def addExpectedFailure(self, test, err=None, details=None):
-        if self.filter_predicate(test, 'expectedfailure', err, details):
-            self._buffered_calls.append(
-                ('addExpectedFailure', [test, err], {'details': details}))
-        else:
-            self._filtered()
+        self._add_outcome(test, self.decorated.addExpectedFailure,
+            'expectedfailure', err, details)
 
     def addUnexpectedSuccess(self, test, details=None):
-        self._buffered_calls.append(
-            ('addUnexpectedSuccess', [test], {'details': details}))
+        self._add_outcome(test, self.decorated.addUnexpectedSuccess, None,
+            _NO_ERR, details)
 
     def addSuccess(self, test, details=None):
-        if (self.filter_predicate(test, 'success', None, details)):
-            self._buffered_calls.append(
-                ('addSuccess', [test], {'details': details}))
-        else:
-            self._filtered()
-
-    def _filtered(self):
-        self._current_test_filtered = True
+        self._add_outcome(test, self.decorated.addSuccess, 'success',
+            _NO_ERR, details)
 
     def startTest(self, test):
         """Start a test.
@@ -401,10 +581,8 @@ class _PredicateFilter(TestResultDecorator, TagsMixin):
         Not directly passed to the client, but used for handling of tags
         correctly.
         """
-        TagsMixin.startTest(self, test)
-        self._current_test = test
-        self._current_test_filtered = False
-        self._buffered_calls.append(('startTest', [test], {}))
+        self._test.reset(test)
+        self._in_test = True
 
     def stopTest(self, test):
         """Stop a test.
@@ -412,24 +590,80 @@ class _PredicateFilter(TestResultDecorator, TagsMixin):
         Not directly passed to the client, but used for handling of tags
         correctly.
         """
-        if not self._current_test_filtered:
-            for method, args, kwargs in self._buffered_calls:
-                getattr(self.decorated, method)(*args, **kwargs)
+        current = self._test
+        if not current.filtered:
+            self._before_event()
+            if self._in_test:
+                self.decorated.startTest(current.test)
+                self._send_tags(current.new_tags, current.gone_tags)
+                late_tags = current.late_tags
+                for position, (outcome, err, details) in enumerate(
+                    current.outcomes):
+                    self._before_event()
+                    self._call_outcome(current.test, outcome, err, details)
+                    if position in late_tags:
+                        self._send_tags(*late_tags[position])
+                self._before_event()
             self.decorated.stopTest(test)
-        self._current_test = None
-        self._current_test_filtered = None
-        self._buffered_calls = []
-        TagsMixin.stopTest(self, test)
+        current.reset(None)
+        self._in_test = False
+
+    def _send_tags(self, new_tags, gone_tags):
+        _update_tags(self._pending_new_tags, self._pending_gone_tags,
+            new_tags, gone_tags)
+
+    def _call_outcome(self, test, outcome, err, details):
+        if err is _NO_ERR:
+            outcome(test, details=details)
+        else:
+            outcome(test, err, details=details)
 
     def tags(self, new_tags, gone_tags):
-        TagsMixin.tags(self, new_tags, gone_tags)
-        if self._current_test is not None:
-            self._buffered_calls.append(('tags', [new_tags, gone_tags], {}))
+        if self._in_test:
+            current = self._test
+            if not current.outcomes:
+                _update_tags(
+                    current.new_tags, current.gone_tags, new_tags, gone_tags)
+            else:
+                position = len(current.outcomes) - 1
+                scope = current.late_tags.get(position)
+                if scope is None:
+                    scope = current.late_tags[position] = set(), set()
+                _update_tags(scope[0], scope[1], new_tags, gone_tags)
         else:
-            return super(_PredicateFilter, self).tags(new_tags, gone_tags)
+            _update_tags(self._global_new_tags, self._global_gone_tags,
+                new_tags, gone_tags)
+            self._send_tags(new_tags, gone_tags)
 
     def time(self, a_time):
-        return self.decorated.time(a_time)
+        if self._last_received_time is None:
+            self._send_time(a_time)
+        self._last_received_time = a_time
+
+    def startTestRun(self):
+        self._before_event()
+        return self.decorated.startTestRun()
+
+    def stopTestRun(self):
+        self._before_event()
+        return self.decorated.stopTestRun()
+
+    def progress(self, offset, whence):
+        self._before_event()
+        return self.decorated.progress(offset, whence)
+
+    def wasSuccessful(self):
+        self._before_event()
+        return self.decorated.wasSuccessful()
+
+    @property
+    def shouldStop(self):
+        self._before_event()
+        return self.decorated.shouldStop
+
+    def stop(self):
+        self._before_event()
+        return self.decorated.stop()
 
     def id_to_orig_id(self, id):
         if id.startswith("subunit.RemotedTestCase."):
@@ -437,6 +671,94 @@ class _PredicateFilter(TestResultDecorator, TagsMixin):
         return id
 
 
+class TestIdSet(object):
+    """A set of test ids that may also hold prefixes and globs.
+
+    An entry ending in a single '*', such as 'pkg.module.*', matches every
+    id starting with what comes before it; other entries containing '*' or
+    '?' are matched as fnmatch globs, and the rest as exact ids, so that
+    parametrised ids such as 'pkg.test_x[1]' match only themselves. Prefixes
+    are kept in a sorted index searched with bisect, and the answers for the
+    most recently looked up ids not held exactly are remembered, so lookups
+    stay cheap for lists of tens of thousands of entries.
+    """
+
+    def __init__(self, entries=(), cache_size=65536):
+        """Create a TestIdSet.
+
+        :param entries: An iterable of entries to add.
+        :param cache_size: How many ids to remember the answers for.
+        """
+        self._ids = set()
+        self._prefixes = set()
+        self._globs = set()
+        self._index = None
+        self._glob_re = None
+        self._cache_size = cache_size
+        self._answers = OrderedDict()
+        self.update(entries)
+
+    def add(self, entry):
+        if '*' not in entry and '?' not in entry:
+            self._ids.add(entry)
+        elif '*' not in entry[:-1] and '?' not in entry[:-1]:
+            self._prefixes.add(entry[:-1])
+        else:
+            self._globs.add(entry)
+        self._index = None
+        self._answers.clear()
+
+    def update(self, entries):
+        """Add entries, which may be any iterable such as iter_test_list."""
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self._ids) + len(self._prefixes) + len(self._globs)
+
+    def __contains__(self, test_id):
+        if test_id in self._ids:
+            # As cheap as the cache, so not remembered.
+            return True
+        answers = self._answers
+        try:
+            found = answers.pop(test_id)
+        except KeyError:
+            found = self._search(test_id)
+            if len(answers) >= self._cache_size:
+                answers.popitem(last=False)
+        # Reinsert so the most recently used ids are evicted last.
+        answers[test_id] = found
+        return found
+
+    def _search(self, test_id):
+        """Return whether a prefix or glob matches test_id."""
+        if self._index is None:
+            self._build_index()
+        found = False
+        if self._index:
+            # The index holds no prefix of another, so only the greatest
+            # prefix sorting before test_id can be a prefix of it.
+            position = bisect_right(self._index, test_id)
+            found = position > 0 and test_id.startswith(
+                self._index[position - 1])
+        if not found and self._glob_re is not None:
+            found = self._glob_re.match(test_id) is not None
+        return found
+
+    def _build_index(self):
+        index = []
+        for prefix in sorted(self._prefixes):
+            if not index or not prefix.startswith(index[-1]):
+                index.append(prefix)
+        self._index = index
+        if self._globs:
+            self._glob_re = re.compile(
+                '|'.join(translate(glob) for glob in sorted(self._globs)))
+        else:
+            self._glob_re = None
+
+
 class TestResultFilter(TestResultDecorator):
     """A pyunit TestResult interface implementation which filters tests.
 
@@ -468,34 +790,19 @@ class TestResultFilter(TestResultDecorator):
             are still supported but should be updated to accept the tags
             parameter for efficiency.
         :param fixup_expected_failures: Set of test ids to consider known
-            failing.
-        :param rename: Optional function to rename test ids
+            failing, such as a TestIdSet.
+        :param rename: Optional function to rename test ids, such as a
+            subunit._filter.Renamer. Tests are passed on as stand-ins with
+            the new ids; the tests given are not changed.
         """
+        filtered = _filtered_outcomes(filter_error, filter_failure,
+            filter_success, filter_skip, filter_xfail)
         predicates = []
-        if filter_error:
-            predicates.append(
-                lambda t, outcome, e, d, tags: outcome != 'error')
-        if filter_failure:
+        if filtered:
             predicates.append(
-                lambda t, outcome, e, d, tags: outcome != 'failure')
-        if filter_success:
-            predicates.append(
-                lambda t, outcome, e, d, tags: outcome != 'success')
-        if filter_skip:
-            predicates.append(
-                lambda t, outcome, e, d, tags: outcome != 'skip')
-        if filter_xfail:
-            predicates.append(
-                lambda t, outcome, e, d, tags: outcome != 'expectedfailure')
+                lambda t, outcome, e, d, tags: outcome not in filtered)
         if filter_predicate is not None:
-            def compat(test, outcome, error, details, tags):
-                # 0.0.7 and earlier did not support the 'tags' parameter.
-                try:
-                    return filter_predicate(
-                        test, outcome, error, details, tags)
-                except TypeError:
-                    return filter_predicate(test, outcome, error, details)
-            predicates.append(compat)
+            predicates.append(_tags_compat(filter_predicate))
         predicate = and_predicates(predicates)
         super(TestResultFilter, self).__init__(
             _PredicateFilter(result, predicate))
@@ -504,11 +811,20 @@ class TestResultFilter(TestResultDecorator):
         else:
             self._fixup_expected_failures = fixup_expected_failures
         self._rename_fn = rename
+        # The stand-in for the test most recently renamed.
+        self._renamed = None
+
+    def startTest(self, test):
+        super(TestResultFilter, self).startTest(self._apply_renames(test))
+
+    def stopTest(self, test):
+        super(TestResultFilter, self).stopTest(self._apply_renames(test))
 
     def addError(self, test, err=None, details=None):
         test = self._apply_renames(test)
         if self._failure_expected(test):
-            self.addExpectedFailure(test, err=err, details=details)
+            super(TestResultFilter, self).addExpectedFailure(
+                test, err=err, details=details)
         else:
             super(TestResultFilter, self).addError(
                 test, err=err, details=details)
@@ -516,7 +832,8 @@ class TestResultFilter(TestResultDecorator):
     def addFailure(self, test, err=None, details=None):
         test = self._apply_renames(test)
         if self._failure_expected(test):
-            self.addExpectedFailure(test, err=err, details=details)
+            super(TestResultFilter, self).addExpectedFailure(
+                test, err=err, details=details)
         else:
             super(TestResultFilter, self).addFailure(
                 test, err=err, details=details)
@@ -524,20 +841,56 @@ class TestResultFilter(TestResultDecorator):
     def addSuccess(self, test, details=None):
         test = self._apply_renames(test)
         if self._failure_expected(test):
-            self.addUnexpectedSuccess(test, details=details)
+            super(TestResultFilter, self).addUnexpectedSuccess(
+                test, details=details)
         else:
             super(TestResultFilter, self).addSuccess(test, details=details)
 
+    def addSkip(self, test, reason=None, details=None):
+        super(TestResultFilter, self).addSkip(
+            self._apply_renames(test), reason=reason, details=details)
+
+    def addExpectedFailure(self, test, err=None, details=None):
+        super(TestResultFilter, self).addExpectedFailure(
+            self._apply_renames(test), err=err, details=details)
+
+    def addUnexpectedSuccess(self, test, details=None):
+        super(TestResultFilter, self).addUnexpectedSuccess(
+            self._apply_renames(test), details=details)
+
     def _failure_expected(self, test):
         return (test.id() in self._fixup_expected_failures)
 
     def _apply_renames(self, test):
+        """Return a stand-in for test with its renamed id.
+
+        test itself is left alone. The stand-in is reused for every event
+        of the test, so the results decorated see one object throughout.
+        """
         if self._rename_fn is None:
             return test
-        new_id = self._rename_fn(test.id())
-        # TODO(jelmer): Isn't there a cleaner way of doing this?
-        setattr(test, "id", lambda: new_id)
-        return test
+        renamed = self._renamed
+        if renamed is None or renamed.test is not test:
+            renamed = self._renamed = _RenamedTest(
+                test, self._rename_fn(test.id()))
+        return renamed
+
+
+class _RenamedTest(object):
+    """A test seen under a new id, passing everything else to the test."""
+
+    def __init__(self, test, test_id):
+        self.test = test
+        self._id = test_id
+
+    def id(self):
+        return self._id
+
+    def __getattr__(self, name):
+        return getattr(self.test, name)
+
+    def __str__(self):
+        return str(self.test)
 
 
 class TestIdPrintingResult(testtools.TestResult):
@@ -30,8 +30,12 @@ _remote_exception_str_chunked = "57\r\n" + _remote_exception_str + ": boo qux\n0
 from subunit.tests import (
     test_chunked,
     test_details,
+    test_filter,
     test_filters,
     test_filter_to_disk,
+    test_index,
+    test_iso8601,
+    test_merge,
     test_output_filter,
     test_progress_model,
     test_run,
@@ -42,7 +46,15 @@ from subunit.tests import (
     test_test_protocol,
     test_test_protocol2,
     test_test_results,
+    test_to_v1,
+    test_to_v2,
+    test_varint,
     )
+if sys.version_info >= (3, 5):
+    # test_aio uses async and await, which are syntax errors before 3.5.
+    from subunit.tests import test_aio
+else:
+    test_aio = None
 
 
 def test_suite():
@@ -56,10 +68,19 @@ def test_suite():
     result.addTest(loader.loadTestsFromModule(test_test_protocol2))
     result.addTest(loader.loadTestsFromModule(test_tap2subunit))
     result.addTest(loader.loadTestsFromModule(test_filter_to_disk))
+    result.addTest(loader.loadTestsFromModule(test_merge))
+    result.addTest(loader.loadTestsFromModule(test_index))
     result.addTest(loader.loadTestsFromModule(test_subunit_filter))
     result.addTest(loader.loadTestsFromModule(test_subunit_tags))
     result.addTest(loader.loadTestsFromModule(test_subunit_stats))
     result.addTest(loader.loadTestsFromModule(test_run))
+    result.addTest(loader.loadTestsFromModule(test_varint))
+    if test_aio is not None:
+        result.addTest(loader.loadTestsFromModule(test_aio))
+    result.addTest(loader.loadTestsFromModule(test_to_v1))
+    result.addTest(loader.loadTestsFromModule(test_to_v2))
+    result.addTest(loader.loadTestsFromModule(test_iso8601))
+    result.addTest(loader.loadTestsFromModule(test_filter))
     result.addTests(
         generate_scenarios(loader.loadTestsFromModule(test_output_filter))
     )
@@ -0,0 +1,190 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+import asyncio
+from io import BytesIO
+import socket
+
+from testtools import TestCase
+from testtools.testresult.doubles import StreamResult
+
+import subunit
+from subunit.aio import (
+    StreamReaderToStreamResult,
+    StreamResultToStreamWriter,
+    )
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestStreamReaderToStreamResult(TestCase):
+
+    def make_stream(self):
+        output = BytesIO()
+        writer = subunit.StreamResultToBytes(output)
+        writer.status(test_id='foo', test_status='inprogress')
+        writer.status(test_id='foo', file_name='log', file_bytes=b'x' * 100,
+            eof=True)
+        writer.status(test_id='foo', test_status='success')
+        return output.getvalue()
+
+    def expected_events(self, source_bytes, non_subunit_name=None):
+        result = StreamResult()
+        subunit.ByteStreamToStreamResult(
+            BytesIO(source_bytes), non_subunit_name).run(result)
+        return result._events
+
+    def test_run(self):
+        source_bytes = b'hello\n' + self.make_stream()
+        result = StreamResult()
+        async def run():
+            reader = asyncio.StreamReader()
+            # Data arriving in pieces, as from a socket.
+            for offset in range(0, len(source_bytes), 5):
+                reader.feed_data(source_bytes[offset:offset + 5])
+            reader.feed_eof()
+            await StreamReaderToStreamResult(
+                reader, non_subunit_name='stdout', read_size=5).run(result)
+        run_async(run())
+        events = self.expected_events(self.make_stream())
+        self.assertEqual(events, result._events[-len(events):])
+        self.assertEqual(b'hello\n',
+            b''.join(event[6] for event in result._events[:-len(events)]))
+
+    def test_many_streams_one_loop(self):
+        source_bytes = self.make_stream()
+        results = [StreamResult(), StreamResult()]
+        async def feed(reader):
+            for offset in range(len(source_bytes)):
+                reader.feed_data(source_bytes[offset:offset + 1])
+                await asyncio.sleep(0)
+            reader.feed_eof()
+        async def run():
+            readers = [asyncio.StreamReader(), asyncio.StreamReader()]
+            await asyncio.gather(
+                *([feed(reader) for reader in readers] +
+                [StreamReaderToStreamResult(reader).run(result)
+                for reader, result in zip(readers, results)]))
+        run_async(run())
+        for result in results:
+            self.assertEqual(
+                self.expected_events(source_bytes), result._events)
+
+    def test_truncated_stream(self):
+        source_bytes = self.make_stream()[:-3]
+        result = StreamResult()
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(source_bytes)
+            reader.feed_eof()
+            await StreamReaderToStreamResult(reader).run(result)
+        run_async(run())
+        self.assertEqual(self.expected_events(source_bytes), result._events)
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.buffered = 0
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter(object):
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.output = BytesIO()
+        self.drains = 0
+
+    def write(self, data):
+        self.output.write(data)
+        self.transport.buffered += len(data)
+
+    async def drain(self):
+        self.drains += 1
+        self.transport.buffered = 0
+
+
+class TestStreamResultToStreamWriter(TestCase):
+
+    def test_same_bytes_as_StreamResultToBytes(self):
+        expected = BytesIO()
+        subunit.StreamResultToBytes(expected).status(test_id='foo',
+            test_status='success', test_tags=set(['a']), file_name='log',
+            file_bytes=b'bar', eof=True, mime_type='text/plain',
+            route_code='0')
+        writer = FakeWriter()
+        result = StreamResultToStreamWriter(writer)
+        result.status(test_id='foo', test_status='success',
+            test_tags=set(['a']), file_name='log', file_bytes=b'bar',
+            eof=True, mime_type='text/plain', route_code='0')
+        self.assertEqual(expected.getvalue(), writer.output.getvalue())
+        self.assertEqual(0, writer.drains)
+
+    def test_astatus_drains_over_high_water(self):
+        writer = FakeWriter()
+        result = StreamResultToStreamWriter(writer, high_water=100)
+        async def run():
+            await result.astatus(test_id='foo', test_status='inprogress')
+            self.assertEqual(0, writer.drains)
+            await result.astatus(test_id='foo', file_name='log',
+                file_bytes=b'x' * 200)
+            self.assertEqual(1, writer.drains)
+        run_async(run())
+
+    def test_astatus_drains_between_chunks(self):
+        writer = FakeWriter()
+        result = StreamResultToStreamWriter(writer)
+        async def run():
+            await result.astatus(test_id='foo', file_name='log',
+                file_bytes=BytesIO(b'x' * 5000000), eof=True)
+        run_async(run())
+        self.assertEqual(2, writer.drains)
+
+    def test_round_trip_over_socket(self):
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        content = b'y' * 1000000
+        received = StreamResult()
+        async def send():
+            _, writer = await asyncio.open_connection(sock=left)
+            result = StreamResultToStreamWriter(writer, high_water=4096)
+            result.startTestRun()
+            await result.astatus(test_id='foo', test_status='inprogress')
+            await result.astatus(test_id='foo', file_name='log',
+                file_bytes=content, eof=True)
+            await result.astatus(test_id='foo', test_status='success')
+            result.stopTestRun()
+            writer.close()
+        async def receive():
+            reader, _ = await asyncio.open_connection(sock=right)
+            await StreamReaderToStreamResult(reader).run(received)
+        async def run():
+            await asyncio.gather(send(), receive())
+        run_async(run())
+        self.assertEqual(
+            [('foo', 'inprogress', None), ('foo', None, content),
+            ('foo', 'success', None)],
+            [(event[1], event[2], event[6]) for event in received._events])
@@ -105,6 +105,44 @@ class TestDecode(unittest.TestCase):
         self.assertRaises(ValueError,
             self.decoder.write, _b('\n'))
 
+    def test_decode_header_split_across_writes(self):
+        self.assertEqual(None, self.decoder.write(_b('1')))
+        self.assertEqual(None, self.decoder.write(_b('0\r')))
+        self.assertEqual(None, self.decoder.write(_b('\n' + 'a' * 15)))
+        self.assertEqual(_b(''), self.decoder.write(_b('b0\r\n')))
+        self.assertEqual(_b('a' * 15 + 'b'), self.output.getvalue())
+
+    def test_decode_many_chunks_in_one_write(self):
+        self.assertEqual(_b('z'), self.decoder.write(
+            _b('1\r\na2\r\nbc3\r\ndef0\r\nz')))
+        self.assertEqual(_b('abcdef'), self.output.getvalue())
+
+    def test_decode_whole_write_passed_through(self):
+        writes = []
+        class Output(object):
+            def write(self, bytes):
+                writes.append(bytes)
+        decoder = subunit.chunked.Decoder(Output())
+        body = _b('1' * 65536)
+        decoder.write(_b('10000\r\n'))
+        decoder.write(body)
+        self.assertEqual([body], writes)
+        self.assertTrue(writes[0] is body)
+
+    def test_decode_bytearray(self):
+        self.assertEqual(_b(''),
+            self.decoder.write(bytearray(_b('3\r\nabc0\r\n'))))
+        self.assertEqual(_b('abc'), self.output.getvalue())
+
+    def test_decode_invalid_header(self):
+        self.assertRaises(ValueError,
+            self.decoder.write, _b('x\r\n'))
+
+    def test_decode_invalid_header_nonstrict(self):
+        self.decoder = subunit.chunked.Decoder(self.output, strict=False)
+        self.assertRaises(ValueError,
+            self.decoder.write, _b('0x1\n'))
+
 
 class TestEncode(unittest.TestCase):
 
@@ -144,3 +182,24 @@ class TestEncode(unittest.TestCase):
         self.encoder.close()
         self.assertEqual(_b('10000\r\n' + '1' * 65536 + '10000\r\n' +
             '2' * 65536 + '0\r\n'), self.output.getvalue())
+
+    def test_encode_chunk_size(self):
+        self.encoder = subunit.chunked.Encoder(self.output, chunk_size=4)
+        data = _b('abcdefghij')
+        for offset in range(len(data)):
+            self.encoder.write(data[offset:offset + 1])
+        self.encoder.close()
+        self.assertEqual(_b('4\r\nabcd4\r\nefgh2\r\nij0\r\n'),
+            self.output.getvalue())
+
+    def test_encode_writes_header_with_body(self):
+        writes = []
+        class Output(object):
+            def write(self, bytes):
+                writes.append(bytes)
+        self.encoder = subunit.chunked.Encoder(Output(), chunk_size=4)
+        self.encoder.write(_b('ab'))
+        self.encoder.write(_b('cd'))
+        self.encoder.write(_b('e'))
+        self.encoder.close()
+        self.assertEqual([_b('4\r\nabcd'), _b('1\r\ne0\r\n')], writes)
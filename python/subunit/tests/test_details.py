@@ -104,3 +104,41 @@ class TestMultipartDetails(unittest.TestCase):
             found['something'].content_type)
         self.assertEqual(_b('').join(expected['something'].iter_bytes()),
             _b('').join(found['something'].iter_bytes()))
+
+    def test_parts_spooled(self):
+        parser = details.MultipartDetailsParser(None, spool_size=4)
+        parser.lineReceived(_b("Content-Type: text/plain\n"))
+        parser.lineReceived(_b("something\n"))
+        parser.lineReceived(_b("F\r\n"))
+        parser.lineReceived(_b("serialised\n"))
+        parser.lineReceived(_b("form0\r\n"))
+        self.assertTrue(parser._body._rolled)
+        found = parser.get_details()['something']
+        self.assertEqual(content_type.ContentType("text", "plain"),
+            found.content_type)
+        self.assertEqual(_b("serialised\nform"),
+            _b('').join(found.iter_bytes()))
+        # Iterating again reads from the start.
+        self.assertEqual(_b("serialised\nform"),
+            _b('').join(found.iter_bytes()))
+
+    def test_close_closes_spooled_parts(self):
+        parser = details.MultipartDetailsParser(None, spool_size=4)
+        parser.lineReceived(_b("Content-Type: text/plain\n"))
+        parser.lineReceived(_b("something\n"))
+        parser.lineReceived(_b("F\r\n"))
+        parser.lineReceived(_b("serialised\n"))
+        parser.lineReceived(_b("form0\r\n"))
+        body = parser._body
+        parser.close()
+        self.assertTrue(body.closed)
+
+    def test_parts_spooled_in_memory(self):
+        parser = details.MultipartDetailsParser(None, spool_size=1024)
+        parser.lineReceived(_b("Content-Type: text/plain\n"))
+        parser.lineReceived(_b("something\n"))
+        parser.lineReceived(_b("3\r\n"))
+        parser.lineReceived(_b("abc0\r\n"))
+        self.assertFalse(parser._body._rolled)
+        found = parser.get_details()['something']
+        self.assertEqual([_b("abc")], list(found.iter_bytes()))
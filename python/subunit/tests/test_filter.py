@@ -0,0 +1,237 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+import io
+import re
+
+from testtools import (
+    ExtendedToStreamDecorator,
+    StreamToExtendedDecorator,
+    TestCase,
+    )
+from testtools.testresult.doubles import StreamResult
+
+from subunit._filter import PacketFilter, Renamer
+from subunit.test_results import TestResultFilter
+from subunit.v2 import ByteStreamToStreamResult, StreamResultToBytes
+
+
+def make_stream(*events):
+    """Encode events, each a dict of keyword arguments for status."""
+    stream = io.BytesIO()
+    writer = StreamResultToBytes(stream)
+    for event in events:
+        writer.status(**event)
+    return stream.getvalue()
+
+
+def parse(stream_bytes):
+    result = StreamResult()
+    ByteStreamToStreamResult(
+        io.BytesIO(stream_bytes), non_subunit_name='stdout').run(result)
+    return result._events
+
+
+def outcomes(stream_bytes):
+    """Return the (test id, status) of each final status in a stream."""
+    return [(event[1], event[2]) for event in parse(stream_bytes)
+        if event[2] not in (None, 'inprogress')]
+
+
+EVENTS = [
+    dict(test_id='a', test_status='inprogress'),
+    dict(test_id='b', test_status='inprogress', test_tags=set(['slow'])),
+    dict(test_id='a', file_name='log', file_bytes=b'connection refused',
+        mime_type='text/plain; charset=utf8'),
+    dict(test_id='a', test_status='fail'),
+    dict(file_name='stdout', file_bytes=b'noise'),
+    dict(test_id='b', test_status='success', test_tags=set(['slow'])),
+    dict(test_id='c', test_status='exists'),
+    dict(test_id='c', test_status='skip'),
+    dict(test_id='d', test_status='xfail'),
+    dict(test_id='e', test_status='uxsuccess'),
+    dict(test_id='f', test_status='inprogress'),
+    ]
+
+
+class TestPacketFilter(TestCase):
+
+    def filter(self, stream_bytes, **kwargs):
+        output = io.BytesIO()
+        PacketFilter(StreamResultToBytes(output), **kwargs).run(
+            io.BytesIO(stream_bytes))
+        return output.getvalue()
+
+    def decorated(self, stream_bytes, **kwargs):
+        """Filter with the decorators subunit-filter used to."""
+        output = io.BytesIO()
+        result = StreamToExtendedDecorator(TestResultFilter(
+            ExtendedToStreamDecorator(StreamResultToBytes(output)),
+            **kwargs))
+        result.startTestRun()
+        ByteStreamToStreamResult(io.BytesIO(stream_bytes)).run(result)
+        result.stopTestRun()
+        return output.getvalue()
+
+    def test_kept_packets_are_unchanged(self):
+        stream = make_stream(*EVENTS)
+        self.assertEqual(
+            make_stream(*([EVENTS[0]] + EVENTS[2:5] + EVENTS[7:] +
+                [dict(test_id='f', test_status='fail')])),
+            self.filter(stream))
+
+    def test_same_outcomes_as_decorators(self):
+        stream = make_stream(*EVENTS)
+        for kwargs in [
+            dict(), dict(filter_success=False), dict(filter_failure=True),
+            dict(filter_skip=True, filter_xfail=True),
+            dict(fixup_expected_failures=set(['a', 'b']),
+                filter_success=False)]:
+            expected = outcomes(self.decorated(stream, **kwargs))
+            got = outcomes(self.filter(stream, passthrough=False, **kwargs))
+            self.assertEqual(expected, got, kwargs)
+
+    def test_interleaved_tests_are_kept_whole(self):
+        stream = make_stream(
+            dict(test_id='a', test_status='inprogress'),
+            dict(test_id='b', test_status='inprogress'),
+            dict(test_id='b', test_status='success'),
+            dict(test_id='a', test_status='fail'))
+        self.assertEqual([('a', 'inprogress'), ('a', 'fail')],
+            [event[1:3] for event in parse(self.filter(stream))])
+
+    def test_route_codes_are_separate_tests(self):
+        stream = make_stream(
+            dict(test_id='a', test_status='inprogress', route_code='0'),
+            dict(test_id='a', test_status='inprogress', route_code='1'),
+            dict(test_id='a', test_status='fail', route_code='1'),
+            dict(test_id='a', test_status='success', route_code='0'))
+        self.assertEqual([('a', 'inprogress', '1'), ('a', 'fail', '1')],
+            [(event[1], event[2], event[9])
+                for event in parse(self.filter(stream))])
+
+    def test_unfinished_tests_failed_at_end(self):
+        stream = make_stream(dict(test_id='f', test_status='inprogress'))
+        self.assertEqual(
+            stream + make_stream(dict(test_id='f', test_status='fail')),
+            self.filter(stream))
+        self.assertEqual(b'', self.filter(stream, filter_failure=True))
+
+    def test_stream_truncated_mid_test(self):
+        timestamp = (1577836800, 5000)
+        stream = make_stream(
+            dict(test_id='a', test_status='inprogress', route_code='0',
+                timestamp=timestamp),
+            dict(test_id='a', file_name='log', file_bytes=b'partial',
+                route_code='0', timestamp=timestamp),
+            dict(test_id='a', file_name='log', file_bytes=b'more',
+                route_code='0', timestamp=timestamp))
+        # Cut the last packet short; the parser reports that as an error
+        # of its own, and test a is failed with its last timestamp.
+        events = [event for event in parse(self.filter(stream[:-4]))
+            if event[1] == 'a']
+        self.assertEqual(
+            [('a', 'inprogress', None, '0'), ('a', None, 'log', '0'),
+                ('a', 'fail', None, '0')],
+            [(event[1], event[2], event[5], event[9]) for event in events])
+        self.assertEqual(events[0][10], events[-1][10])
+        self.assertIn(('a', 'fail'), outcomes(self.decorated(stream[:-4])))
+
+    def test_passthrough(self):
+        stream = make_stream(dict(file_name='stdout', file_bytes=b'noise'))
+        self.assertEqual(stream, self.filter(stream))
+        self.assertEqual(b'', self.filter(stream + b'more noise',
+            passthrough=False))
+
+    def test_non_subunit_encapsulated(self):
+        self.assertEqual(
+            make_stream(dict(file_name='stdout', file_bytes=b'hi thar')),
+            self.filter(b'hi thar'))
+
+    def test_fixup_changes_final_status(self):
+        stream = make_stream(
+            dict(test_id='a', test_status='inprogress'),
+            dict(test_id='a', test_status='fail'),
+            dict(test_id='b', test_status='success'),
+            dict(test_id='c', test_status='inprogress'))
+        self.assertEqual(
+            [('a', 'inprogress'), ('a', 'xfail'), ('b', 'uxsuccess'),
+                ('c', 'inprogress'), ('c', 'xfail')],
+            [event[1:3] for event in parse(self.filter(stream,
+                fixup_expected_failures=set(['a', 'b', 'c'])))])
+
+    def test_rename(self):
+        stream = make_stream(
+            dict(test_id='a', test_status='inprogress'),
+            dict(test_id='a', test_status='fail'))
+        filtered = self.filter(stream, rename=lambda name: name + '.renamed')
+        self.assertEqual(
+            [('a.renamed', 'inprogress'), ('a.renamed', 'fail')],
+            [event[1:3] for event in parse(filtered)])
+
+    def test_predicate_sees_tags_and_details(self):
+        seen = []
+        def predicate(test, outcome, err, details, tags):
+            seen.append((test.id(), outcome, tags,
+                details['log'].as_text() if 'log' in details else None))
+            return re.search('refused', str(details)) is not None
+        stream = make_stream(*EVENTS)
+        # Unexpected successes are never filtered.
+        self.assertEqual([('a', 'fail'), ('e', 'uxsuccess')], outcomes(
+            self.filter(stream, filter_success=False,
+                filter_predicate=predicate)))
+        self.assertEqual([
+            ('a', 'failure', set(), 'connection refused'),
+            ('b', 'success', set(['slow']), None),
+            ('c', 'skip', set(), None),
+            ('d', 'expectedfailure', set(), None),
+            ('f', 'failure', set(), None),
+            ], seen)
+
+
+class TestRenamer(TestCase):
+
+    def test_patterns_applied_in_order(self):
+        rename = Renamer([('^a', 'b'), ('^b', 'c'), (r'(\d+)', r'<\1>')])
+        self.assertEqual('c.test_<1>', rename('a.test_1'))
+        self.assertEqual('x', rename('x'))
+
+    def test_repeated_ids_are_cached(self):
+        rename = Renamer([('a', 'b')])
+        self.assertEqual('b', rename('a'))
+        rename._patterns = []
+        self.assertEqual('b', rename('a'))
+        self.assertEqual('c', rename('c'))
+
+    def test_cache_is_bounded(self):
+        rename = Renamer([('a', 'b')], cache_size=2)
+        rename('a1')
+        rename('a2')
+        rename('a1')
+        rename('a3')
+        self.assertEqual(['a1', 'a3'], list(rename._cache))
+
+    def test_packet_filter_renames(self):
+        stream = make_stream(
+            dict(test_id='pkg.a', test_status='inprogress'),
+            dict(test_id='pkg.a', test_status='fail'),
+            dict(test_id='other.b', test_status='fail'))
+        output = io.BytesIO()
+        PacketFilter(StreamResultToBytes(output),
+            rename=Renamer([('^pkg', 'renamed')])).run(io.BytesIO(stream))
+        self.assertEqual(
+            [('renamed.a', 'inprogress'), ('renamed.a', 'fail'),
+                ('other.b', 'fail')],
+            [event[1:3] for event in parse(output.getvalue())])
@@ -14,12 +14,16 @@
 #  limitations under that license.
 #
 
+import io
+import os
 import sys
 from tempfile import NamedTemporaryFile
 
 from testtools import TestCase
+from testtools.compat import BytesIO
+from testtools.testresult.doubles import ExtendedTestResult
 
-from subunit.filters import find_stream
+from subunit.filters import filter_by_result, find_stream, output_buffering
 
 
 class TestFindStream(TestCase):
@@ -33,3 +37,43 @@ class TestFindStream(TestCase):
         f.flush()
         stream = find_stream('bar', [f.name])
         self.assertEqual(b'foo', stream.read())
+
+
+class TestOutputBuffering(TestCase):
+
+    def test_regular_file_is_batched(self):
+        f = NamedTemporaryFile()
+        self.assertEqual(['buffer_size', 'flush_interval'],
+            sorted(output_buffering(f)))
+
+    def test_pipe_is_not_batched(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        self.assertEqual({}, output_buffering(io.open(write_fd, 'wb',
+            closefd=False)))
+
+    def test_no_fileno_is_not_batched(self):
+        self.assertEqual({}, output_buffering(BytesIO()))
+
+
+class TestFilterByResult(TestCase):
+
+    def test_spool_size(self):
+        stream = BytesIO(b'test: foo\n'
+            b'success: foo [ multipart\n'
+            b'Content-Type: text/plain\n'
+            b'log\n'
+            b'5\r\n'
+            b'hello0\r\n'
+            b']\n')
+        read = []
+        class Result(ExtendedTestResult):
+            def addSuccess(self, test, details=None):
+                self.log = details['log']
+                read.append(b''.join(self.log.iter_bytes()))
+        result = filter_by_result(lambda output: Result(), None, False,
+            False, input_stream=stream, spool_size=2)
+        self.assertEqual([b'hello'], read)
+        # The spooled file is closed once the test has stopped.
+        self.assertRaises(ValueError, list, result.log.iter_bytes())
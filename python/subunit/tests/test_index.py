@@ -0,0 +1,142 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+import datetime
+import os
+import os.path
+
+from fixtures import TempDir
+from testtools import TestCase
+from testtools.testresult.doubles import StreamResult
+
+import subunit
+from subunit import index, iso8601
+
+
+class TestStreamIndex(TestCase):
+
+    def setUp(self):
+        super(TestStreamIndex, self).setUp()
+        self.root = self.useFixture(TempDir()).path
+        self.stream_path = os.path.join(self.root, 'stream')
+        self.traceback = b'Traceback\n' * 500000
+        with open(self.stream_path, 'wb') as stream:
+            stream.write(b'some output\n')
+            writer = subunit.StreamResultToBytes(stream)
+            writer.status(test_id='a', test_status='inprogress')
+            writer.status(test_id='b', test_status='inprogress')
+            writer.status(test_id='b', test_status='success')
+            writer.status(test_id='a', file_name='traceback',
+                file_bytes=self.traceback, eof=True, mime_type='text/plain')
+            writer.status(test_id='a', file_name='log', file_bytes=b'')
+            writer.status(test_id='a', test_status='fail')
+            writer.status(file_name='stdout', file_bytes=b'global')
+
+    def load(self):
+        loaded = index.load_index(self.stream_path)
+        self.addCleanup(loaded.close)
+        return loaded
+
+    def test_build_writes_sidecar(self):
+        path = index.build_index(self.stream_path)
+        self.assertEqual(self.stream_path + '.index', path)
+        self.assertTrue(os.path.exists(path))
+
+    def test_lookup(self):
+        loaded = self.load()
+        self.assertEqual(['b', 'a'], loaded.test_ids)
+        self.assertIn('a', loaded)
+        self.assertNotIn('c', loaded)
+        self.assertEqual('fail', loaded.status('a'))
+        self.assertEqual('success', loaded.status('b'))
+        self.assertEqual(['log', 'traceback'], loaded.file_names('a'))
+        self.assertEqual([], loaded.file_names('b'))
+        self.assertEqual(self.traceback, loaded.file_bytes('a', 'traceback'))
+        self.assertEqual(b'', loaded.file_bytes('a', 'log'))
+
+    def test_events(self):
+        loaded = self.load()
+        self.assertEqual(
+            [('inprogress', None), (None, 'traceback'), (None, 'traceback'),
+            (None, 'log'), ('fail', None)],
+            [(event['test_status'], event['file_name'])
+            for event in loaded.events('a')])
+        self.assertEqual(['inprogress', 'fail'],
+            [event['test_status']
+            for event in loaded.events('a', statuses_only=True)])
+
+    def test_replay_matches_stream(self):
+        expected = StreamResult()
+        with open(self.stream_path, 'rb') as stream:
+            subunit.ByteStreamToStreamResult(
+                stream, non_subunit_name='stdout').run(expected)
+        by_test = {}
+        for event in expected._events:
+            if event[1] is not None:
+                by_test.setdefault(event[1], []).append(event)
+        result = StreamResult()
+        self.load().replay(result)
+        self.assertEqual(by_test['b'] + by_test['a'], result._events)
+
+    def test_stale_index_rebuilt(self):
+        self.load().close()
+        with open(self.stream_path, 'ab') as stream:
+            subunit.StreamResultToBytes(stream).status(
+                test_id='c', test_status='skip')
+        self.assertRaises(index.StaleIndexError,
+            index.StreamIndex, self.stream_path)
+        self.assertEqual('skip', self.load().status('c'))
+
+    def test_timestamps(self):
+        timestamp = datetime.datetime(2020, 1, 2, 3, 4, 5, 6, iso8601.UTC)
+        with open(self.stream_path, 'wb') as stream:
+            subunit.StreamResultToBytes(stream).status(
+                test_id='c', test_status='success', timestamp=timestamp)
+        loaded = self.load()
+        self.assertEqual('success', loaded.status('c'))
+        self.assertEqual([timestamp],
+            [event['timestamp'] for event in loaded.events('c')])
+
+    def test_same_id_under_route_codes(self):
+        with open(self.stream_path, 'wb') as stream:
+            writer = subunit.StreamResultToBytes(stream)
+            writer.status(test_id='c', test_status='success', route_code='0')
+            writer.status(test_id='c', test_status='fail', route_code='1')
+            writer.status(test_id='d', test_status='skip', route_code='1')
+        loaded = self.load()
+        self.assertEqual(['c', 'c', 'd'], loaded.test_ids)
+        self.assertEqual(['0', '1'], loaded.route_codes('c'))
+        self.assertEqual('success', loaded.status('c', route_code='0'))
+        self.assertEqual('fail', loaded.status('c', route_code='1'))
+        self.assertEqual('skip', loaded.status('d'))
+        self.assertRaises(KeyError, loaded.status, 'c')
+        result = StreamResult()
+        loaded.replay(result)
+        self.assertEqual([('c', '0'), ('c', '1'), ('d', '1')],
+            [(event[1], event[9]) for event in result._events])
+
+    def test_exit_does_not_mask_exception(self):
+        # A slice of the map left alive by the exception stops it being
+        # closed; the exception must still be the one raised.
+        def lookup():
+            with self.load() as loaded:
+                view = loaded._stream.view[0:4]
+                raise ValueError(view)
+        self.assertRaises(ValueError, lookup)
+
+    def test_empty_stream(self):
+        open(self.stream_path, 'wb').close()
+        self.assertEqual([], self.load().test_ids)
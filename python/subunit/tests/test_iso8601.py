@@ -0,0 +1,96 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+from datetime import datetime
+
+from testtools import TestCase
+
+from subunit import iso8601
+
+
+class TestParseDate(TestCase):
+
+    def test_client_form(self):
+        self.assertEqual(
+            datetime(2009, 10, 11, 12, 13, 14, 15, iso8601.UTC),
+            iso8601.parse_date(b"2009-10-11 12:13:14.000015Z"))
+
+    def test_client_form_t_separator(self):
+        self.assertEqual(
+            datetime(2009, 10, 11, 12, 13, 14, 15, iso8601.UTC),
+            iso8601.parse_date(b"2009-10-11T12:13:14.000015Z"))
+
+    def test_client_form_default_timezone(self):
+        tz = iso8601.FixedOffset(1, 0, "+01:00")
+        parsed = iso8601.parse_date(
+            b"2009-10-11 12:13:14.000015Z", default_timezone=tz)
+        self.assertIs(tz, parsed.tzinfo)
+
+    def test_client_form_out_of_range(self):
+        self.assertRaises(
+            ValueError, iso8601.parse_date, b"2009-13-11 12:13:14.000015Z")
+
+    def test_fraction_exact(self):
+        # 0.000291 * 1e6 rounds down to 290 as a float.
+        self.assertEqual(
+            291, iso8601.parse_date(b"2009-10-11 12:13:14.000291Z").microsecond)
+        self.assertEqual(
+            291, iso8601.parse_date(b"2009-10-11 12:13:14.000291").microsecond)
+
+    def test_short_and_long_fractions(self):
+        self.assertEqual(
+            120000, iso8601.parse_date(b"2009-10-11 12:13:14.12Z").microsecond)
+        self.assertEqual(
+            123456,
+            iso8601.parse_date(b"2009-10-11 12:13:14.1234567Z").microsecond)
+
+    def test_offset(self):
+        parsed = iso8601.parse_date(b"2009-10-11 12:13:14.000015+02:30")
+        self.assertEqual(
+            datetime(2009, 10, 11, 9, 43, 14, 15, iso8601.UTC), parsed)
+
+    def test_offsets_are_cached(self):
+        first = iso8601.parse_date(b"2009-10-11 12:13:14-05:00")
+        second = iso8601.parse_date(b"2009-10-12 12:13:14-05:00")
+        self.assertIs(first.tzinfo, second.tzinfo)
+
+    def test_unicode_rejected(self):
+        self.assertRaises(
+            iso8601.ParseError, iso8601.parse_date, u"2009-10-11 12:13:14Z")
+
+    def test_garbage_rejected(self):
+        self.assertRaises(iso8601.ParseError, iso8601.parse_date, b"soon")
+
+
+class TestParseTimezone(TestCase):
+
+    def test_cache_is_bounded(self):
+        self.addCleanup(iso8601._timezone_cache.clear)
+        for minutes in range(iso8601._TIMEZONE_CACHE_SIZE + 10):
+            iso8601.parse_timezone(
+                ("+%02d:%02d" % divmod(minutes, 60)).encode('ascii'))
+        self.assertEqual(
+            iso8601._TIMEZONE_CACHE_SIZE, len(iso8601._timezone_cache))
+        self.assertNotIn(b"+00:00", iso8601._timezone_cache)
+
+    def test_recently_used_offset_kept(self):
+        self.addCleanup(iso8601._timezone_cache.clear)
+        kept = iso8601.parse_timezone(b"-12:00")
+        for minutes in range(iso8601._TIMEZONE_CACHE_SIZE + 10):
+            iso8601.parse_timezone(
+                ("+%02d:%02d" % divmod(minutes, 60)).encode('ascii'))
+            iso8601.parse_timezone(b"-12:00")
+        self.assertIs(kept, iso8601.parse_timezone(b"-12:00"))
@@ -0,0 +1,121 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+import datetime
+import io
+import os.path
+
+from fixtures import TempDir
+from testtools import TestCase
+from testtools.testresult.doubles import StreamResult
+
+from subunit import _merge, iso8601
+from subunit.v2 import ByteStreamToStreamResult, StreamResultToBytes
+
+
+def at(second):
+    return datetime.datetime(2020, 1, 1, 0, 0, second, tzinfo=iso8601.Utc())
+
+
+def make_stream(*events):
+    stream = io.BytesIO()
+    writer = StreamResultToBytes(stream)
+    for test_id, test_status, timestamp in events:
+        writer.status(test_id=test_id, test_status=test_status,
+            timestamp=timestamp)
+    return stream.getvalue()
+
+
+def parse(stream_bytes):
+    result = StreamResult()
+    ByteStreamToStreamResult(io.BytesIO(stream_bytes)).run(result)
+    return [(event[1], event[2], event[9], event[10])
+        for event in result._events]
+
+
+class TestMergeStreams(TestCase):
+
+    def merge(self, streams, route_codes=False):
+        result = StreamResult()
+        _merge.merge_streams([io.BytesIO(stream) for stream in streams],
+            result, route_codes=route_codes)
+        return [(event[1], event[2], event[9], event[10])
+            for event in result._events]
+
+    def test_interleaves_by_timestamp(self):
+        first = make_stream(('a', 'inprogress', at(1)), ('a', 'success', at(4)))
+        second = make_stream(('b', 'inprogress', at(2)), ('b', 'fail', at(3)))
+        self.assertEqual([
+            ('a', 'inprogress', None, at(1)),
+            ('b', 'inprogress', None, at(2)),
+            ('b', 'fail', None, at(3)),
+            ('a', 'success', None, at(4)),
+            ], self.merge([first, second]))
+
+    def test_untimestamped_events_follow_their_stream(self):
+        first = make_stream(('a', 'inprogress', at(1)), ('a', 'success', None),
+            ('c', 'exists', at(5)))
+        second = make_stream(('b', 'exists', None), ('b', 'success', at(3)))
+        self.assertEqual([
+            ('b', 'exists', None, None),
+            ('a', 'inprogress', None, at(1)),
+            ('a', 'success', None, None),
+            ('b', 'success', None, at(3)),
+            ('c', 'exists', None, at(5)),
+            ], self.merge([first, second]))
+
+    def test_stream_order_kept(self):
+        first = make_stream(('a', 'inprogress', at(5)), ('a', 'success', at(1)))
+        second = make_stream(('b', 'success', at(3)))
+        self.assertEqual([
+            ('b', 'success', None, at(3)),
+            ('a', 'inprogress', None, at(5)),
+            ('a', 'success', None, at(1)),
+            ], self.merge([first, second]))
+
+    def test_route_codes(self):
+        first = make_stream(('a', 'success', at(1)))
+        second = io.BytesIO()
+        StreamResultToBytes(second).status(test_id='b', test_status='success',
+            route_code='7', timestamp=at(2))
+        self.assertEqual([
+            ('a', 'success', '0', at(1)),
+            ('b', 'success', '1/7', at(2)),
+            ], self.merge([first, second.getvalue()], route_codes=True))
+
+
+class TestMergeCommand(TestCase):
+
+    def test_merge_files(self):
+        root = self.useFixture(TempDir()).path
+        paths = []
+        for name, second in [('a', 2), ('b', 1)]:
+            path = os.path.join(root, name)
+            with open(path, 'wb') as f:
+                f.write(make_stream((name, 'success', at(second))))
+            paths.append(path)
+        stdout = io.BytesIO()
+        self.assertEqual(0, _merge.merge(['-r'] + paths, stdout=stdout))
+        self.assertEqual([
+            ('b', 'success', '1', at(1)),
+            ('a', 'success', '0', at(2)),
+            ], parse(stdout.getvalue()))
+
+    def test_merge_stdin(self):
+        stdin = io.BytesIO(make_stream(('a', 'success', at(1))))
+        stdout = io.BytesIO()
+        self.assertEqual(0, _merge.merge([], stdin=stdin, stdout=stdout))
+        self.assertEqual(stdin.getvalue(), stdout.getvalue())
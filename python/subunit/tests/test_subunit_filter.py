@@ -20,15 +20,24 @@ from datetime import datetime
 import os
 import subprocess
 import sys
+import tempfile
 from subunit import iso8601
 import unittest
 
 from testtools import TestCase
+from testtools.content import Content, text_content
+from testtools.content_type import ContentType
+from testtools.testcase import PlaceHolder
 from testtools.compat import _b, BytesIO
 from testtools.testresult.doubles import ExtendedTestResult, StreamResult
 
 import subunit
-from subunit.test_results import make_tag_filter, TestResultFilter
+from subunit.test_results import (
+    make_regexp_filter,
+    make_tag_filter,
+    TestIdSet,
+    TestResultFilter,
+    )
 from subunit import ByteStreamToStreamResult, StreamResultToBytes
 
 
@@ -155,6 +164,14 @@ xfail todo
             [passed.id() for passed in filtered_result.unexpectedSuccesses])
         self.assertEqual(5, filtered_result.testsRun)
 
+    def test_fixup_expected_failures_by_prefix(self):
+        filtered_result = unittest.TestResult()
+        result_filter = TestResultFilter(filtered_result,
+            fixup_expected_failures=TestIdSet(["fail*"]))
+        self.run_tests(result_filter)
+        self.assertEqual(['failed', 'todo'],
+            [failure[0].id() for failure in filtered_result.expectedFailures])
+
     def test_exclude_failure(self):
         filtered_result = unittest.TestResult()
         result_filter = TestResultFilter(filtered_result, filter_failure=True)
@@ -280,6 +297,98 @@ xfail todo
              ('addSkip', foo, {}),
              ('stopTest', foo), ], result._events)
 
+    def test_filtered_test_does_not_leak_into_next(self):
+        # The per-test record is reused; a filtered test's tags must not be
+        # replayed with the test that follows it.
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_success=False,
+            filter_predicate=lambda test, outcome, err, details, tags:
+                test.id() != 'foo')
+        input_stream = _b(
+            "test: foo\n"
+            "tags: a\n"
+            "successful: foo\n"
+            "test: bar\n"
+            "successful: bar\n")
+        self.run_tests(result_filter, input_stream)
+        bar = subunit.RemotedTestCase('bar')
+        self.assertEqual(
+            [('startTest', bar),
+             ('addSuccess', bar),
+             ('stopTest', bar)],
+            result._events)
+
+    def test_tags_after_outcome_follow_it(self):
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_success=False)
+        foo = PlaceHolder('foo')
+        result_filter.startTest(foo)
+        result_filter.tags(set(['a']), set())
+        result_filter.addSuccess(foo)
+        result_filter.tags(set(['b']), set(['a']))
+        result_filter.stopTest(foo)
+        self.assertEqual(
+            [('startTest', foo),
+             ('tags', set(['a']), set()),
+             ('addSuccess', foo),
+             ('tags', set(['b']), set(['a'])),
+             ('stopTest', foo)],
+            result._events)
+
+    def test_every_outcome_passed_on(self):
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_xfail=False)
+        foo = PlaceHolder('foo')
+        result_filter.startTest(foo)
+        result_filter.addExpectedFailure(foo, details={})
+        result_filter.tags(set(['late']), set())
+        result_filter.addFailure(foo, details={})
+        result_filter.stopTest(foo)
+        self.assertEqual(
+            [('startTest', foo),
+             ('addExpectedFailure', foo, {}),
+             ('tags', set(['late']), set()),
+             ('addFailure', foo, {}),
+             ('stopTest', foo)],
+            result._events)
+
+    def test_any_filtered_outcome_drops_test(self):
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_xfail=True)
+        foo = PlaceHolder('foo')
+        result_filter.startTest(foo)
+        result_filter.addFailure(foo, details={})
+        result_filter.addExpectedFailure(foo, details={})
+        result_filter.stopTest(foo)
+        self.assertEqual([], result._events)
+
+    def test_global_tags_sent_before_time(self):
+        date_a = datetime(year=2000, month=1, day=1, tzinfo=iso8601.UTC)
+        subunit_stream = _b('\n'.join([
+            "tags: global",
+            "time: %s",
+            "test: foo",
+            "success: foo",
+            ""]) % date_a)
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_success=False)
+        self.run_tests(result_filter, subunit_stream)
+        foo = subunit.RemotedTestCase('foo')
+        self.assertEqual(
+            [('tags', set(['global']), set()),
+             ('time', date_a),
+             ('startTest', foo),
+             ('addSuccess', foo),
+             ('stopTest', foo)],
+            result._events)
+
+    def test_outcome_outside_test_passes_through(self):
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(result, filter_success=False)
+        foo = PlaceHolder('foo')
+        result_filter.addSuccess(foo)
+        self.assertEqual([('addSuccess', foo)], result._events)
+
     def test_renames(self):
         def rename(name):
             return name + " - renamed"
@@ -296,11 +405,166 @@ xfail todo
              ('stopTest', 'foo - renamed')],
             [(ev[0], ev[1].id()) for ev in result._events])
 
+    def test_renames_leave_test_unchanged(self):
+        result = ExtendedTestResult()
+        result_filter = TestResultFilter(
+            result, filter_success=False, rename=lambda name: name + "-x")
+        foo = PlaceHolder('foo')
+        result_filter.startTest(foo)
+        result_filter.addSkip(foo, 'reason')
+        result_filter.stopTest(foo)
+        self.assertEqual('foo', foo.id())
+        self.assertEqual(
+            [('startTest', 'foo-x'), ('addSkip', 'foo-x'),
+             ('stopTest', 'foo-x')],
+            [(ev[0], ev[1].id()) for ev in result._events])
+        self.assertEqual(1, len(set(id(ev[1]) for ev in result._events)))
+
     if sys.version_info < (2, 7):
         # These tests require Python >=2.7.
         del test_fixup_expected_failures, test_fixup_expected_errors, test_fixup_unexpected_success
 
 
+class TestTestIdSet(TestCase):
+
+    def test_exact(self):
+        ids = TestIdSet(['pkg.a', 'pkg.b'])
+        self.assertIn('pkg.a', ids)
+        self.assertNotIn('pkg.c', ids)
+        self.assertNotIn('pkg', ids)
+        self.assertEqual(2, len(ids))
+
+    def test_prefix(self):
+        ids = TestIdSet(['pkg.module.*'])
+        self.assertIn('pkg.module.Test.test_a', ids)
+        self.assertNotIn('pkg.other.Test.test_a', ids)
+        self.assertNotIn('pkg.modul', ids)
+
+    def test_nested_prefixes(self):
+        ids = TestIdSet(['a.*', 'a.b.x*', 'c.d*'])
+        self.assertIn('a.b.y', ids)
+        self.assertIn('a.b.x1', ids)
+        self.assertIn('c.d', ids)
+        self.assertNotIn('b', ids)
+        self.assertNotIn('c.e', ids)
+
+    def test_glob(self):
+        ids = TestIdSet(['pkg.*.test_[ab]', 'x?y'])
+        self.assertIn('pkg.module.test_a', ids)
+        self.assertNotIn('pkg.module.test_c', ids)
+        self.assertIn('x.y', ids)
+        self.assertNotIn('xy', ids)
+
+    def test_bracketed_id_is_exact(self):
+        ids = TestIdSet(['pkg.test_x[1]'])
+        self.assertIn('pkg.test_x[1]', ids)
+        self.assertNotIn('pkg.test_x1', ids)
+        self.assertNotIn('pkg.test_x[2]', ids)
+
+    def test_bracketed_prefix(self):
+        ids = TestIdSet(['pkg.test_x[1-*'])
+        self.assertIn('pkg.test_x[1-a]', ids)
+        self.assertNotIn('pkg.test_x1-a', ids)
+
+    def test_add_after_lookup(self):
+        ids = TestIdSet(['pkg.a'])
+        self.assertNotIn('other.a', ids)
+        ids.add('other.*')
+        self.assertIn('other.a', ids)
+
+    def test_answers_are_bounded(self):
+        ids = TestIdSet(['pkg.a', 'other.*'], cache_size=2)
+        for test_id in ['pkg.a', 'other.a', 'x', 'other.b', 'other.a']:
+            test_id in ids
+        self.assertEqual(['other.b', 'other.a'], list(ids._answers))
+
+
+class TestMakeRegexpFilter(TestCase):
+
+    def check(self, regexp_filter, test_id='pkg.test_a', outcome='failure',
+        details=None):
+        return regexp_filter(PlaceHolder(test_id), outcome, None,
+            details or {}, set())
+
+    def unreadable(self):
+        def fail():
+            raise AssertionError("details were read")
+        return {'log': Content(ContentType('text', 'plain'), fail)}
+
+    def test_with_matches_id_and_outcome(self):
+        self.assertTrue(self.check(make_regexp_filter(['test_a'], None)))
+        self.assertTrue(self.check(make_regexp_filter(['afail'], None)))
+        self.assertFalse(self.check(make_regexp_filter(['test_b'], None)))
+
+    def test_with_matches_details(self):
+        regexp_filter = make_regexp_filter(['refused'], None)
+        self.assertTrue(self.check(regexp_filter,
+            details={'log': text_content('connection refused')}))
+
+    def test_without(self):
+        regexp_filter = make_regexp_filter(None, ['refused'])
+        self.assertTrue(self.check(regexp_filter))
+        self.assertFalse(self.check(regexp_filter,
+            details={'log': text_content('connection refused')}))
+
+    def test_id_match_does_not_read_details(self):
+        self.assertTrue(self.check(make_regexp_filter(['test_a'], None),
+            details=self.unreadable()))
+        self.assertFalse(self.check(make_regexp_filter(None, ['test_a']),
+            details=self.unreadable()))
+        self.assertTrue(self.check(make_regexp_filter(None, None, ['test_a']),
+            details=self.unreadable()))
+
+    def test_without_does_not_read_details_of_rejected_tests(self):
+        regexp_filter = make_regexp_filter(None, ['refused'], ['test_b'])
+        self.assertFalse(self.check(regexp_filter, details=self.unreadable()))
+        regexp_filter = make_regexp_filter(None, ['refused'], ['test_a'])
+        self.assertFalse(self.check(regexp_filter,
+            details={'log': text_content('connection refused')}))
+
+    def test_end_anchor_matches_end_of_details(self):
+        # The name, outcome, error and details are one string, so 'failure$'
+        # does not match a failure: its error and details follow.
+        regexp_filter = make_regexp_filter(['failure$'], None)
+        self.assertFalse(self.check(regexp_filter))
+        regexp_filter = make_regexp_filter(None, ['failure$'])
+        self.assertTrue(self.check(regexp_filter))
+        self.assertTrue(self.check(regexp_filter,
+            details={'log': text_content('connection refused')}))
+
+    def test_lookahead_is_not_matched_early(self):
+        regexp_filter = make_regexp_filter(None, ['failure(?!None)'])
+        self.assertTrue(self.check(regexp_filter))
+
+    def test_with_id_ignores_details(self):
+        regexp_filter = make_regexp_filter(None, None, ['refused'])
+        self.assertFalse(self.check(regexp_filter,
+            details={'log': text_content('connection refused')}))
+        self.assertTrue(self.check(regexp_filter, test_id='pkg.refused'))
+
+    def test_with_detail_ignores_id(self):
+        regexp_filter = make_regexp_filter(None, None, None, ['^refused$'])
+        self.assertFalse(self.check(regexp_filter, test_id='refused'))
+        self.assertTrue(self.check(regexp_filter,
+            details={'log': text_content('connection\nrefused\n')}))
+
+    def test_with_detail_skips_binary_attachments(self):
+        regexp_filter = make_regexp_filter(None, None, None, ['refused'])
+        self.assertFalse(self.check(regexp_filter, details={
+            'core': Content(ContentType('application', 'octet-stream'),
+                lambda: [b'refused'])}))
+
+    def test_with_detail_unknown_charset_decodes_as_utf8(self):
+        regexp_filter = make_regexp_filter(None, None, None, ['refused'])
+        self.assertTrue(self.check(regexp_filter, details={
+            'log': Content(ContentType('text', 'plain', {'charset': 'bogus'}),
+                lambda: [b'refused'])}))
+
+    def test_any_inclusion_matches(self):
+        regexp_filter = make_regexp_filter(['nothing'], None, ['test_a'])
+        self.assertTrue(self.check(regexp_filter))
+
+
 class TestFilterCommand(TestCase):
 
     def run_command(self, args, stream):
@@ -360,3 +624,31 @@ class TestFilterCommand(TestCase):
         stream = StreamResultToBytes(byte_stream)
         stream.status(file_name="stdout", file_bytes=b'hi thar')
         self.assertEqual(byte_stream.getvalue(), output)
+
+    def test_with_id(self):
+        byte_stream = BytesIO()
+        stream = StreamResultToBytes(byte_stream)
+        stream.status(test_id="foo", test_status="fail")
+        stream.status(test_id="bar", test_status="fail", file_name="log",
+            file_bytes=b"foo")
+        output = self.run_command(['--with-id', 'foo'], byte_stream.getvalue())
+        events = StreamResult()
+        ByteStreamToStreamResult(BytesIO(output)).run(events)
+        self.assertEqual(['foo'], [event[1] for event in events._events])
+
+    def test_fixup_expected_failures(self):
+        byte_stream = BytesIO()
+        stream = StreamResultToBytes(byte_stream)
+        stream.status(test_id="pkg.a", test_status="fail")
+        stream.status(test_id="other.b", test_status="fail")
+        fd, list_path = tempfile.mkstemp()
+        self.addCleanup(os.remove, list_path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'pkg.*\n')
+        output = self.run_command(
+            ['--xfail', '--fixup-expected-failures', list_path],
+            byte_stream.getvalue())
+        events = StreamResult()
+        ByteStreamToStreamResult(BytesIO(output)).run(events)
+        self.assertEqual([('pkg.a', 'xfail'), ('other.b', 'fail')],
+            [event[1:3] for event in events._events])
@@ -92,6 +92,14 @@ class TestHelpers(TestCase):
         fake_stream = io.BytesIO()
         self.assertEqual(fake_stream, subunit._unwrap_text(fake_stream))
 
+    def test_read_test_list(self):
+        fd, file_path = tempfile.mkstemp()
+        self.addCleanup(os.remove, file_path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_u('foo.bar\nfoo.baz\u00e9\nfoo.*\n').encode('utf8'))
+        self.assertEqual(['foo.bar', _u('foo.baz\u00e9'), 'foo.*'],
+            subunit.read_test_list(file_path))
+
 
 class TestTestImports(unittest.TestCase):
 
@@ -165,6 +173,69 @@ class TestTestProtocolServerPipe(unittest.TestCase):
         pass
 
 
+class TestTestProtocolServerBlocks(unittest.TestCase):
+
+    story = _b("some output\n"
+        "test old mcdonald\n"
+        "more output\n"
+        "with a\rcarriage return\r\n"
+        "success old mcdonald\n"
+        "test bing crosby\n"
+        "failure bing crosby [\n"
+        "foo.c:53:ERROR invalid state\n"
+        "]\n"
+        "tags: foo\n"
+        "trailing output")
+
+    def read(self, block_size):
+        client = ExtendedTestResult()
+        stdout = BytesIO()
+        forward = BytesIO()
+        protocol = subunit.TestProtocolServer(client, stdout, forward)
+        protocol.readFrom(BytesIO(self.story), block_size=block_size)
+        return client._events, stdout.getvalue(), forward.getvalue()
+
+    def test_same_as_line_at_a_time(self):
+        expected = self.read(None)
+        for block_size in (1, 2, 7, 65536):
+            self.assertEqual(expected, self.read(block_size))
+
+    def test_line_spanning_blocks(self):
+        writes = []
+        class Recorder(object):
+            def write(self, data):
+                writes.append(data)
+        content = _b("a\n") + _b("x") * 1000 + _b("\nb\nc")
+        protocol = subunit.TestProtocolServer(
+            unittest.TestResult(), Recorder())
+        protocol.readFrom(BytesIO(content), block_size=7)
+        self.assertEqual(content, _b("").join(writes))
+
+    def test_passthrough_coalesced(self):
+        writes = []
+        class Recorder(object):
+            def write(self, data):
+                writes.append(data)
+        protocol = subunit.TestProtocolServer(
+            unittest.TestResult(), Recorder())
+        protocol.readFrom(BytesIO(_b("a\nb\nc\ntest: foo\nd\ne\n"
+            "success: foo\nf\n")), block_size=65536)
+        self.assertEqual([_b("a\nb\nc\n"), _b("d\ne\n"), _b("f\n")],
+            writes)
+
+    def test_protocol_test_case_without_read1(self):
+        class NoRead1(object):
+            def __init__(self, content):
+                source = BytesIO(content)
+                self.read = source.read
+                self.readline = source.readline
+        client = unittest.TestResult()
+        stdout = BytesIO()
+        subunit.ProtocolTestCase(NoRead1(self.story), stdout).run(client)
+        self.assertEqual(2, client.testsRun)
+        self.assertEqual(self.read(None)[1], stdout.getvalue())
+
+
 class TestTestProtocolServerStartTest(unittest.TestCase):
 
     def setUp(self):
@@ -193,6 +264,11 @@ class TestTestProtocolServerStartTest(unittest.TestCase):
         self.assertEqual([], self.client._events)
         self.assertEqual(self.stream.getvalue(), ignored_line)
 
+    def test_start_test_colons(self):
+        self.protocol.lineReceived(_b("test:: old mcdonald\n"))
+        self.assertEqual(self.client._events,
+            [('startTest', subunit.RemotedTestCase("old mcdonald"))])
+
     def test_start_testing_colon(self):
         self.protocol.lineReceived(_b("testing: old mcdonald\n"))
         self.assertEqual(self.client._events,
@@ -335,6 +411,21 @@ class TestTestProtocolServerPassThrough(unittest.TestCase):
         self.protocol.lineReceived(bytes)
         self.assertEqual(self.stdout.getvalue(), bytes)
 
+    def test_command_prefixes_passthrough(self):
+        # Only whole command names are directives.
+        lines = [_b("s: a\n"), _b("ski: a\n"), _b("tes: a\n"),
+            _b("tests: a\n"), _b("test:a b\n"), _b("test: \n"),
+            _b(": a\n"), _b(" test: a\n")]
+        for line in lines:
+            self.protocol.lineReceived(line)
+        self.assertEqual(_b("").join(lines), self.stdout.getvalue())
+        self.assertEqual([], self.client._events)
+
+    def test_uxsuccess_before_test(self):
+        self.protocol.lineReceived(_b("uxsuccess: a\n"))
+        self.assertEqual(_b("uxsuccess: a\n"), self.stdout.getvalue())
+        self.assertEqual([], self.client._events)
+
 
 class TestTestProtocolServerLostConnection(unittest.TestCase):
 
@@ -900,6 +991,27 @@ class TestTestProtocolServerAddSuccess(unittest.TestCase):
     def test_success_colon_quoted_bracket(self):
         self.success_quoted_bracket("success:")
 
+    def test_success_multipart_spooled(self):
+        read = []
+        class Client(ExtendedTestResult):
+            def addSuccess(self, test, details=None):
+                self.log = details['log']
+                read.append(_b('').join(self.log.iter_bytes()))
+            def stopTest(self, test):
+                read.append(_b('').join(self.log.iter_bytes()))
+        self.client = Client()
+        self.protocol = subunit.TestProtocolServer(self.client, spool_size=2)
+        self.protocol.lineReceived(_b("test mcdonalds farm\n"))
+        self.protocol.lineReceived(_b("success mcdonalds farm [ multipart\n"))
+        self.protocol.lineReceived(_b("Content-Type: text/plain\n"))
+        self.protocol.lineReceived(_b("log\n"))
+        self.protocol.lineReceived(_b("5\r\n"))
+        self.protocol.lineReceived(_b("hello0\r\n"))
+        self.protocol.lineReceived(_b("]\n"))
+        self.assertEqual([_b("hello"), _b("hello")], read)
+        # The spooled file is closed once the test has stopped.
+        self.assertRaises(ValueError, list, self.client.log.iter_bytes())
+
 
 class TestTestProtocolServerProgress(unittest.TestCase):
     """Test receipt of progress: directives."""
@@ -1229,6 +1341,18 @@ class TestTestProtocolClient(TestCase):
                 "something\n"
                 "F\r\nserialised\nform0\r\n]\n" % self.test.id()))
 
+    def test_add_success_details_chunk_size(self):
+        """Small pieces of content are collected into chunk_size chunks."""
+        self.protocol = subunit.TestProtocolClient(self.io, chunk_size=8)
+        details = {'something': Content(
+            ContentType('text', 'plain'), lambda: [_b('ab')] * 5)}
+        self.protocol.addSuccess(self.test, details=details)
+        self.assertEqual(
+            self.io.getvalue(), _b("successful: %s [ multipart\n"
+                "Content-Type: text/plain\n"
+                "something\n"
+                "8\r\nabababab2\r\nab0\r\n]\n" % self.test.id()))
+
     def test_add_failure(self):
         """Test addFailure on a TestProtocolClient."""
         self.protocol.addFailure(
@@ -1405,3 +1529,69 @@ class TestTestProtocolClient(TestCase):
     def test_tags_gone(self):
         self.protocol.tags(set(), set(['bar']))
         self.assertEqual(_b("tags: -bar\n"), self.io.getvalue())
+
+
+class TestTestProtocolClientBuffered(TestCase):
+
+    def setUp(self):
+        super(TestTestProtocolClientBuffered, self).setUp()
+        self.writes = []
+        self.flushes = []
+        class Recorder(object):
+            def write(inner, data):
+                self.writes.append(bytes(data))
+                return len(data)
+            def flush(inner):
+                self.flushes.append(len(self.writes))
+        self.stream = Recorder()
+
+    def make_protocol(self, **kwargs):
+        protocol = subunit.TestProtocolClient(self.stream, **kwargs)
+        # make_stream_binary may write to the stream to probe it.
+        del self.writes[:]
+        return protocol
+
+    def run_tests(self, protocol, count):
+        for index in range(count):
+            test = PlaceHolder('test%d' % index)
+            protocol.startTest(test)
+            protocol.addSuccess(test)
+            protocol.stopTest(test)
+
+    def test_unbuffered_writes_as_produced(self):
+        protocol = self.make_protocol()
+        self.run_tests(protocol, 1)
+        self.assertEqual([_b("test: test0\n"), _b("successful: test0\n")],
+            self.writes)
+        self.assertEqual([1, 2], self.flushes)
+
+    def test_flush_each_test(self):
+        protocol = self.make_protocol(flush_tests=1)
+        self.run_tests(protocol, 2)
+        self.assertEqual([_b("test: test0\nsuccessful: test0\n"),
+            _b("test: test1\nsuccessful: test1\n")], self.writes)
+        self.assertEqual([1, 2], self.flushes)
+
+    def test_flush_every_n_tests(self):
+        protocol = self.make_protocol(flush_tests=2)
+        self.run_tests(protocol, 3)
+        self.assertEqual([_b("test: test0\nsuccessful: test0\n"
+            "test: test1\nsuccessful: test1\n")], self.writes)
+        protocol.stopTestRun()
+        self.assertEqual(_b("test: test2\nsuccessful: test2\n"),
+            self.writes[-1])
+
+    def test_flush_interval(self):
+        protocol = self.make_protocol(flush_interval=0)
+        self.run_tests(protocol, 1)
+        # The first write is at startTest, once the test line is collected.
+        self.assertEqual([_b("test: test0\n"), _b("successful: test0\n")],
+            self.writes)
+
+    def test_done_writes_out(self):
+        protocol = self.make_protocol(flush_interval=3600)
+        self.run_tests(protocol, 2)
+        self.assertEqual([], self.writes)
+        protocol.done()
+        self.assertEqual([_b("test: test0\nsuccessful: test0\n"
+            "test: test1\nsuccessful: test1\n")], self.writes)
@@ -26,6 +26,7 @@ try:
 except ImportError:
     given = None
     st = None
+from fixtures import TempDir
 from testtools import TestCase
 from testtools.matchers import Contains, HasLength
 from testtools.tests.test_testresult import TestStreamResultContract
@@ -84,10 +85,10 @@ class TestStreamResultToBytes(TestCase):
         self.assertEqual([b'\x7f\xff'], packet)
         del packet[:]
         result._write_number(16384, packet)
-        self.assertEqual([b'\x80\x40', b'\x00'], packet)
+        self.assertEqual([b'\x80\x40\x00'], packet)
         del packet[:]
         result._write_number(4194303, packet)
-        self.assertEqual([b'\xbf\xff', b'\xff'], packet)
+        self.assertEqual([b'\xbf\xff\xff'], packet)
         del packet[:]
         result._write_number(4194304, packet)
         self.assertEqual([b'\xc0\x40\x00\x00'], packet)
@@ -142,8 +143,9 @@ class TestStreamResultToBytes(TestCase):
         self.assertEqual(b'\xbf\xff\xff', output.getvalue()[3:6])
         output.seek(0)
         output.truncate()
-        self.assertRaises(Exception, result.status, file_name="",
-            file_bytes=b'\xff'*4194290)
+        # Too long for one packet: chunked.
+        result.status(file_name="", file_bytes=b'\xff'*4194290)
+        self.assertEqual(4194303 + 11, len(output.getvalue()))
 
     def test_trivial_enumeration(self):
         result, output = self._make_result()
@@ -223,9 +225,141 @@ class TestStreamResultToBytes(TestCase):
         result.status(test_id="bar", test_status='success', timestamp=timestamp)
         self.assertEqual(CONSTANT_TIMESTAMP, output.getvalue())
 
+    def test_timestamp_pair(self):
+        result, output = self._make_result()
+        result.status(test_id="bar", test_status='success',
+            timestamp=(1008161999, 45000))
+        self.assertEqual(CONSTANT_TIMESTAMP, output.getvalue())
+
+    def test_timestamp_nanoseconds(self):
+        result, output = self._make_result()
+        result.status(test_id="bar", test_status='success',
+            timestamp=1008161999000045000)
+        self.assertEqual(CONSTANT_TIMESTAMP, output.getvalue())
+
+    def test_buffered_writes_in_batches(self):
+        output = BytesIO()
+        result = subunit.StreamResultToBytes(output, buffer_size=30)
+        result.startTestRun()
+        result.status("foo", 'exists')
+        result.status("foo", 'inprogress')
+        self.assertEqual(b'', output.getvalue())
+        result.status("foo", 'success')
+        self.assertEqual(CONSTANT_ENUM + CONSTANT_INPROGRESS + CONSTANT_SUCCESS,
+            output.getvalue())
+        result.status("foo", 'fail')
+        self.assertThat(output.getvalue(), HasLength(36))
+        result.stopTestRun()
+        self.assertEqual(CONSTANT_ENUM + CONSTANT_INPROGRESS +
+            CONSTANT_SUCCESS + CONSTANT_FAIL, output.getvalue())
+
+    def test_buffered_flush_interval(self):
+        output = BytesIO()
+        result = subunit.StreamResultToBytes(
+            output, buffer_size=65536, flush_interval=0)
+        result.status("foo", 'exists')
+        self.assertEqual(CONSTANT_ENUM, output.getvalue())
+
+    def test_buffered_shared_output_stream(self):
+        output = BytesIO()
+        result = subunit.StreamResultToBytes(output, buffer_size=65536)
+        result.output_stream.write(b'before\n')
+        result.status("foo", 'exists')
+        result.output_stream.write(b'after\n')
+        result.stopTestRun()
+        self.assertEqual(b'before\n' + CONSTANT_ENUM + b'after\n',
+            output.getvalue())
+
+    def test_large_file_bytes_written_without_joining(self):
+        writes = []
+        class Recorder(object):
+            def write(self, data):
+                writes.append(bytes(data))
+                return len(data)
+            def flush(self):
+                pass
+        result = subunit.StreamResultToBytes(Recorder())
+        del writes[:]
+        content = b'z' * 100000
+        result.status(test_id="foo", file_name="log", file_bytes=content)
+        self.assertEqual([17, 100000, 4], list(map(len, writes)))
+        self.assertEqual(content, writes[1])
+        events = self._parse_events(BytesIO(b''.join(writes)))
+        self.assertEqual(content, events[0][6])
+
+    def test_buffer_file_bytes(self):
+        for file_bytes in (bytearray(b'abc'), memoryview(b'xabc')[1:]):
+            result, output = self._make_result()
+            result.status(test_id="foo", file_name="log",
+                file_bytes=file_bytes)
+            self.assertEqual(b'abc', self._parse_events(output)[0][6])
+
+    def _parse_events(self, output):
+        result = StreamResult()
+        subunit.ByteStreamToStreamResult(BytesIO(output.getvalue())).run(
+            result)
+        return result._events
+
+    def test_large_file_bytes_chunked(self):
+        result, output = self._make_result()
+        content = b'abcdefgh' * 1048576
+        result.status(test_id="foo", test_status='fail', test_tags=set(['t']),
+            file_name="log", file_bytes=content, eof=True,
+            mime_type="text/plain", route_code="0")
+        events = self._parse_events(output)
+        self.assertThat(events, HasLength(3))
+        for event in events[:-1]:
+            self.assertEqual(('status', 'foo', None, None, True, 'log'),
+                event[:6])
+            self.assertEqual((False, 'text/plain', '0', None), event[7:])
+        self.assertEqual(('status', 'foo', 'fail', set(['t']), True, 'log'),
+            events[-1][:6])
+        self.assertEqual((True, 'text/plain', '0', None), events[-1][7:])
+        self.assertEqual(content, b''.join(event[6] for event in events))
+        self.assertTrue(all(len(event[6]) < 4194303 for event in events))
+
+    def test_file_like_file_bytes(self):
+        result, output = self._make_result()
+        content = b'x' * 5000000
+        result.status(test_id="foo", file_name="log",
+            file_bytes=BytesIO(content), eof=True)
+        events = self._parse_events(output)
+        self.assertThat(events, HasLength(2))
+        self.assertEqual([False, True], [event[7] for event in events])
+        self.assertEqual(content, events[0][6] + events[1][6])
+
+    def test_small_file_like_file_bytes(self):
+        result, output = self._make_result()
+        result.status(file_name="barney", file_bytes=BytesIO(b"woo"))
+        self.assertEqual(CONSTANT_FILE_CONTENT, output.getvalue())
+
+    def test_empty_file_like_file_bytes(self):
+        result, output = self._make_result()
+        result.status(test_id="foo", file_name="log", file_bytes=BytesIO(),
+            eof=True)
+        self.assertEqual(
+            [('status', 'foo', None, None, True, 'log', b'', True, None,
+            None, None)], self._parse_events(output))
+
+    def test_iterator_file_bytes(self):
+        result, output = self._make_result()
+        pieces = [b'y' * 1000000] * 9
+        result.status(test_id="foo", file_name="log",
+            file_bytes=iter(pieces), eof=True)
+        events = self._parse_events(output)
+        self.assertThat(events, HasLength(3))
+        self.assertEqual([False, False, True],
+            [event[7] for event in events])
+        self.assertEqual(b''.join(pieces),
+            b''.join(event[6] for event in events))
+
 
 class TestByteStreamToStreamResult(TestCase):
 
+    def _make_parser(self, source, non_subunit_name=None):
+        return subunit.ByteStreamToStreamResult(
+            source, non_subunit_name=non_subunit_name)
+
     def test_non_subunit_encapsulated(self):
         source = BytesIO(b"foo\nbar\n")
         result = StreamResult()
@@ -269,7 +403,7 @@ class TestByteStreamToStreamResult(TestCase):
     def test_trivial_enumeration(self):
         source = BytesIO(CONSTANT_ENUM)
         result = StreamResult()
-        subunit.ByteStreamToStreamResult(
+        self._make_parser(
             source, non_subunit_name="stdout").run(result)
         self.assertEqual(b'', source.read())
         self.assertEqual([
@@ -279,7 +413,7 @@ class TestByteStreamToStreamResult(TestCase):
     def test_multiple_events(self):
         source = BytesIO(CONSTANT_ENUM + CONSTANT_ENUM)
         result = StreamResult()
-        subunit.ByteStreamToStreamResult(
+        self._make_parser(
             source, non_subunit_name="stdout").run(result)
         self.assertEqual(b'', source.read())
         self.assertEqual([
@@ -308,7 +442,7 @@ class TestByteStreamToStreamResult(TestCase):
     def check_events(self, source_bytes, events):
         source = BytesIO(source_bytes)
         result = StreamResult()
-        subunit.ByteStreamToStreamResult(
+        self._make_parser(
             source, non_subunit_name="stdout").run(result)
         self.assertEqual(b'', source.read())
         self.assertEqual(events, result._events)
@@ -364,6 +498,20 @@ class TestByteStreamToStreamResult(TestCase):
                 mime_type="text/plain;charset=utf8"),
             ])
 
+    def test_packet_length_1_to_3_byte_varints(self):
+        # Packet lengths under 64, under 16384 and over it, so every
+        # reader checks the first byte of each varint width.
+        for size in (1, 100, 20000):
+            content = BytesIO()
+            subunit.StreamResultToBytes(content).status(
+                test_id='foo', file_name='log', file_bytes=b'x' * size)
+            result = StreamResult()
+            self._make_parser(BytesIO(content.getvalue())).run(result)
+            self.assertEqual([
+                ('status', 'foo', None, None, True, 'log', b'x' * size,
+                 False, None, None, None),
+                ], result._events)
+
     def test_mime(self):
         self.check_event(CONSTANT_MIME,
             test_id=None, mime_type='application/foo; charset=1')
@@ -386,6 +534,24 @@ class TestByteStreamToStreamResult(TestCase):
         self.check_event(CONSTANT_TIMESTAMP,
             'success', test_id='bar', timestamp=timestamp)
 
+    def test_raw_timestamp(self):
+        source = BytesIO(CONSTANT_TIMESTAMP)
+        result = StreamResult()
+        parser = self._make_parser(source)
+        parser.raw_timestamps = True
+        parser.run(result)
+        self.assertEqual([self._event(test_status='success', test_id='bar',
+            timestamp=(1008161999, 45000))], result._events)
+
+    def test_timestamp_nanoseconds_truncated(self):
+        content = BytesIO()
+        subunit.StreamResultToBytes(content).status(
+            test_id='bar', timestamp=(1008161999, 45999))
+        timestamp = datetime.datetime(2001, 12, 12, 12, 59, 59, 45,
+            iso8601.Utc())
+        self.check_event(content.getvalue(), test_id='bar',
+            timestamp=timestamp)
+
     def test_bad_crc_errors_via_status(self):
         file_bytes = CONSTANT_MIME[:-1] + b'\x00'
         self.check_events( file_bytes, [
@@ -444,12 +610,235 @@ class TestByteStreamToStreamResult(TestCase):
         self.check_event(content.getvalue(), test_id=None, file_name='bar',
             route_code='0', mime_type='text/plain', file_bytes=b'foo')
 
+    def test_zero_copy_file_bytes(self):
+        source = BytesIO(CONSTANT_FILE_CONTENT)
+        result = StreamResult()
+        parser = self._make_parser(source, non_subunit_name="stdout")
+        parser.zero_copy = True
+        parser.run(result)
+        file_bytes = result._events[0][6]
+        self.assertIsInstance(file_bytes, memoryview)
+        self.assertEqual(b"woo", file_bytes.tobytes())
+
+    def test_source_without_readinto(self):
+        class ReadOnly(object):
+            def __init__(self, content):
+                self.read = BytesIO(content).read
+        result = StreamResult()
+        self._make_parser(
+            ReadOnly(CONSTANT_ROUTE_CODE), non_subunit_name="stdout").run(
+            result)
+        self.assertEqual([self._event(test_status='success', test_id='bar',
+            route_code='source')], result._events)
+
+    def test_packet_length_shorter_than_header(self):
+        packet_data = b'\xb3!@\x02'
+        self.check_events(packet_data + b'\x00\x00' + CONSTANT_EOF, [
+            self._event(test_id="subunit.parser", eof=True,
+                file_name="Packet data", file_bytes=packet_data + b'\x00\x00',
+                mime_type="application/octet-stream"),
+            self._event(test_id="subunit.parser", test_status="fail", eof=True,
+                file_name="Parser Error",
+                file_bytes=b"Packet length 2 is shorter than its header",
+                mime_type="text/plain;charset=utf8"),
+            self._event(eof=True),
+            ])
+
     if st is not None:
         @given(st.binary())
         def test_hypothesis_decoding(self, code_bytes):
             source = BytesIO(code_bytes)
             result = StreamResult()
-            stream = subunit.ByteStreamToStreamResult(
+            stream = self._make_parser(
                 source, non_subunit_name="stdout")
             stream.run(result)
             self.assertEqual(b'', source.read())
+
+
+class TestByteStreamToStreamResultBlocks(TestByteStreamToStreamResult):
+    """Run the parser tests against the block reading mode."""
+
+    def _make_parser(self, source, non_subunit_name=None, block_size=7):
+        # A tiny block size forces packets to span several blocks.
+        return subunit.ByteStreamToStreamResult(
+            source, non_subunit_name=non_subunit_name, block_size=block_size)
+
+    def test_non_subunit_encapsulated(self):
+        source = BytesIO(b"foo\nbar\n")
+        result = StreamResult()
+        self._make_parser(
+            source, non_subunit_name="stdout", block_size=4).run(result)
+        self.assertEqual([
+            ('status', None, None, None, True, 'stdout', b'foo\n', False, None, None, None),
+            ('status', None, None, None, True, 'stdout', b'bar\n', False, None, None, None),
+            ], result._events)
+        self.assertEqual(b'', source.read())
+
+    def test_signature_middle_utf8_char(self):
+        utf8_bytes = b'\xe3\xb3\x8a'
+        source = BytesIO(utf8_bytes)
+        result = StreamResult()
+        self._make_parser(source, non_subunit_name="stdout").run(result)
+        self.assertEqual([
+            ('status', None, None, None, True, 'stdout', b'\xe3\xb3\x8a', False, None, None, None),
+            ], result._events)
+
+    def test_signature_middle_utf8_char_across_blocks(self):
+        source = BytesIO(b'a\xe3\xb3\x8a' + CONSTANT_ENUM)
+        result = StreamResult()
+        self._make_parser(
+            source, non_subunit_name="stdout", block_size=2).run(result)
+        self.assertEqual([
+            ('status', None, None, None, True, 'stdout', b'a\xe3', False, None, None, None),
+            ('status', None, None, None, True, 'stdout', b'\xb3\x8a', False, None, None, None),
+            ('status', 'foo', 'exists', None, True, None, None, False, None, None, None),
+            ], result._events)
+
+    def test_non_subunit_disabled_raises(self):
+        source = BytesIO(b"foo\nbar\n")
+        result = StreamResult()
+        case = self._make_parser(source)
+        e = self.assertRaises(Exception, case.run, result)
+        self.assertEqual(b'f', e.args[1])
+        self.assertEqual([], result._events)
+
+    if st is not None:
+        @given(st.binary())
+        def test_hypothesis_decoding(self, code_bytes):
+            source = BytesIO(code_bytes)
+            result = StreamResult()
+            stream = self._make_parser(
+                source, non_subunit_name="stdout")
+            stream.run(result)
+            self.assertEqual(b'', source.read())
+
+    def test_non_subunit_split_at_1MiB(self):
+        source = BytesIO(b'x' * 1048577 + CONSTANT_ENUM)
+        result = StreamResult()
+        self._make_parser(
+            source, non_subunit_name="stdout", block_size=2097152).run(result)
+        self.assertEqual(
+            [1048576, 1, None], [event[6] and len(event[6])
+            for event in result._events])
+
+    def test_same_events_as_byte_at_a_time_from_file(self):
+        # With a real file select always reports more to read, so the
+        # byte-at-a-time parser emits non subunit content up to each packet.
+        content = BytesIO()
+        content.write(b'some output\n\xe3\xb3\x8a\n')
+        subunit.StreamResultToBytes(content).status(
+            test_id='foo', test_status='inprogress')
+        content.write(b'more\n')
+        subunit.StreamResultToBytes(content).status(
+            test_id='foo', test_status='success', file_name='log',
+            file_bytes=b'\xb3' * 100)
+        content.write(CONSTANT_MIME[:-1] + b'\x00')
+        content.write(b'trailing')
+        path = self.useFixture(TempDir()).join('stream')
+        with open(path, 'wb') as f:
+            f.write(content.getvalue())
+        expected = StreamResult()
+        with open(path, 'rb') as f:
+            subunit.ByteStreamToStreamResult(
+                f, non_subunit_name="stdout").run(expected)
+        result = StreamResult()
+        with open(path, 'rb') as f:
+            self._make_parser(f, non_subunit_name="stdout").run(result)
+        self.assertEqual(expected._events, result._events)
+
+
+class _FeedingParser(object):
+    """Feed a source to a ByteStreamDecoder a block at a time."""
+
+    def __init__(self, source, non_subunit_name, block_size):
+        self.source = source
+        self.non_subunit_name = non_subunit_name
+        self.block_size = block_size
+        self.zero_copy = False
+        self.raw_timestamps = False
+
+    def run(self, result):
+        decoder = subunit.v2.ByteStreamDecoder(
+            self.non_subunit_name, zero_copy=self.zero_copy,
+            raw_timestamps=self.raw_timestamps)
+        while True:
+            data = self.source.read(self.block_size)
+            if not data:
+                break
+            for event in decoder.feed(data):
+                result.status(**event)
+        for event in decoder.close():
+            result.status(**event)
+
+
+class TestByteStreamDecoder(TestByteStreamToStreamResultBlocks):
+    """Run the parser tests against the push based decoder."""
+
+    def _make_parser(self, source, non_subunit_name=None, block_size=7):
+        return _FeedingParser(source, non_subunit_name, block_size)
+
+    if st is not None:
+        @given(st.binary())
+        def test_hypothesis_decoding(self, code_bytes):
+            source = BytesIO(code_bytes)
+            result = StreamResult()
+            stream = self._make_parser(
+                source, non_subunit_name="stdout")
+            stream.run(result)
+            self.assertEqual(b'', source.read())
+
+    def test_same_events_as_byte_at_a_time_from_file(self):
+        # Non subunit content is emitted a feed at a time, so feed it all.
+        content = BytesIO()
+        content.write(b'some output\n\xe3\xb3\x8a\n')
+        subunit.StreamResultToBytes(content).status(
+            test_id='foo', test_status='inprogress')
+        content.write(b'more\n')
+        subunit.StreamResultToBytes(content).status(
+            test_id='foo', test_status='success', file_name='log',
+            file_bytes=b'\xb3' * 100)
+        content.write(CONSTANT_MIME[:-1] + b'\x00')
+        content.write(b'trailing')
+        path = self.useFixture(TempDir()).join('stream')
+        with open(path, 'wb') as f:
+            f.write(content.getvalue())
+        expected = StreamResult()
+        with open(path, 'rb') as f:
+            subunit.ByteStreamToStreamResult(
+                f, non_subunit_name="stdout").run(expected)
+        result = StreamResult()
+        self._make_parser(BytesIO(content.getvalue()),
+            non_subunit_name="stdout", block_size=65536).run(result)
+        self.assertEqual(expected._events, result._events)
+
+    def test_packet_waits_for_more_data(self):
+        decoder = subunit.v2.ByteStreamDecoder()
+        self.assertEqual([], decoder.feed(CONSTANT_SUCCESS[:3]))
+        self.assertEqual([], decoder.feed(CONSTANT_SUCCESS[3:-1]))
+        self.assertEqual([dict(test_id='foo', test_status='success',
+            test_tags=None, runnable=True, file_name=None, file_bytes=None,
+            eof=False, mime_type=None, route_code=None, timestamp=None)],
+            decoder.feed(CONSTANT_SUCCESS[-1:]))
+        self.assertEqual([], decoder.close())
+
+    def test_feed_packets(self):
+        decoder = subunit.v2.ByteStreamDecoder(non_subunit_name='stdout')
+        pairs = decoder.feed_packets(b'hi' + CONSTANT_SUCCESS)
+        self.assertEqual([b'hi', None],
+            [event.get('file_bytes') for event, packet in pairs])
+        self.assertEqual([None, CONSTANT_SUCCESS],
+            [packet for event, packet in pairs])
+
+    def check_truncated(self, source_bytes):
+        expected = StreamResult()
+        subunit.ByteStreamToStreamResult(BytesIO(source_bytes)).run(expected)
+        result = StreamResult()
+        self._make_parser(BytesIO(source_bytes)).run(result)
+        self.assertEqual(expected._events, result._events)
+        self.assertThat(result._events, HasLength(2))
+
+    def test_close_reports_short_header(self):
+        self.check_truncated(CONSTANT_ROUTE_CODE[:4])
+
+    def test_close_reports_short_packet(self):
+        self.check_truncated(CONSTANT_ROUTE_CODE[:-2])
@@ -0,0 +1,159 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+import datetime
+import io
+
+from testtools import (
+    StreamResultRouter,
+    StreamToExtendedDecorator,
+    TestCase,
+    )
+from testtools.compat import _b
+from testtools.testresult.doubles import StreamResult
+
+from subunit import TestProtocolClient, iso8601
+from subunit._to_v1 import StreamResultToV1
+from subunit._to_v2 import v1_to_v2
+from subunit.test_results import CatFiles
+
+
+def at(second):
+    return datetime.datetime(2020, 1, 1, 0, 0, second, tzinfo=iso8601.UTC)
+
+
+# (test_id, test_status, test_tags, file_name, file_bytes, mime_type,
+#  timestamp) for each event.
+EVENTS = [
+    ('a', 'inprogress', None, None, None, None, at(1)),
+    ('a', None, None, 'log', _b('first '), 'text/plain; charset="utf8"',
+        at(1)),
+    (None, None, None, 'stdout', _b('noise\n'), None, None),
+    ('a', None, None, 'log', _b('second'), None, at(2)),
+    ('a', 'success', set(['quick']), None, None, None, at(2)),
+    ('b', 'inprogress', None, None, None, None, at(3)),
+    ('b', None, None, 'traceback', _b('boom'), 'text/x-traceback', at(3)),
+    ('b', 'fail', None, None, None, None, at(4)),
+    ('c', 'exists', None, None, None, None, None),
+    ('c', 'skip', None, 'reason', _b('later'), None, at(5)),
+    ('d', 'xfail', None, None, None, None, at(6)),
+    ('e', 'uxsuccess', None, None, None, None, at(7)),
+    ('f', 'inprogress', None, None, None, None, at(8)),
+    ]
+
+
+def send(result, events):
+    result.startTestRun()
+    for (test_id, test_status, test_tags, file_name, file_bytes, mime_type,
+        timestamp) in events:
+        result.status(test_id=test_id, test_status=test_status,
+            test_tags=test_tags, file_name=file_name, file_bytes=file_bytes,
+            mime_type=mime_type, timestamp=timestamp)
+    result.stopTestRun()
+
+
+def decorator_v1(events):
+    """The v1 stream StreamToExtendedDecorator writes for events."""
+    stream = io.BytesIO()
+    result = StreamResultRouter(
+        StreamToExtendedDecorator(TestProtocolClient(stream)))
+    result.add_rule(CatFiles(stream), 'test_id', test_id=None)
+    send(result, events)
+    return stream.getvalue()
+
+
+def transcoded_v1(events, spool_size=1024):
+    stream = io.BytesIO()
+    send(StreamResultToV1(stream, spool_size), events)
+    return stream.getvalue()
+
+
+def reparse(v1_bytes):
+    result = StreamResult()
+    passthrough = io.BytesIO()
+    v1_to_v2(io.BytesIO(v1_bytes), result, passthrough)
+    return result._events, passthrough.getvalue()
+
+
+class TestStreamResultToV1(TestCase):
+
+    def test_same_tests_as_decorator(self):
+        # Tags are written inside the test rather than around it, so compare
+        # the streams as parsed.
+        self.assertEqual(reparse(decorator_v1(EVENTS)),
+            reparse(transcoded_v1(EVENTS)))
+
+    def test_spooled_attachments(self):
+        self.assertEqual(reparse(decorator_v1(EVENTS)),
+            reparse(transcoded_v1(EVENTS, spool_size=2)))
+
+    def test_test_line_written_at_start(self):
+        stream = io.BytesIO()
+        result = StreamResultToV1(stream)
+        result.startTestRun()
+        result.status(test_id='a', test_status='inprogress', timestamp=at(1))
+        self.assertEqual(
+            _b('time: 2020-01-01 00:00:01.000000Z\ntest: a\n'),
+            stream.getvalue())
+        result.status(test_id='a', test_status='success', timestamp=at(2))
+        self.assertEqual(
+            _b('time: 2020-01-01 00:00:01.000000Z\ntest: a\n'
+                'time: 2020-01-01 00:00:02.000000Z\n'
+                'successful: a [ multipart\n]\n'),
+            stream.getvalue())
+
+    def test_raw_timestamps(self):
+        stream = io.BytesIO()
+        result = StreamResultToV1(stream)
+        result.startTestRun()
+        result.status(test_id='a', test_status='inprogress',
+            timestamp=(1577836801, 999))
+        self.assertEqual(
+            _b('time: 2020-01-01 00:00:01.000000Z\ntest: a\n'),
+            stream.getvalue())
+
+    def test_concurrent_tests_are_not_interleaved(self):
+        stream = io.BytesIO()
+        result = StreamResultToV1(stream)
+        result.startTestRun()
+        result.status(test_id='a', test_status='inprogress')
+        result.status(test_id='b', test_status='inprogress')
+        result.status(test_id='c', test_status='inprogress')
+        result.status(test_id='b', test_status='success')
+        self.assertEqual(_b('test: a\n'), stream.getvalue())
+        result.status(test_id='a', test_status='fail')
+        self.assertEqual(
+            _b('test: a\nfailure: a [ multipart\n]\n'
+                'test: b\nsuccessful: b [ multipart\n]\n'
+                'test: c\n'),
+            stream.getvalue())
+        result.stopTestRun()
+        self.assertTrue(
+            stream.getvalue().endswith(_b('failure: c [ multipart\n]\n')))
+
+    def test_route_codes_are_separate_tests(self):
+        stream = io.BytesIO()
+        result = StreamResultToV1(stream)
+        result.startTestRun()
+        result.status(test_id='a', test_status='inprogress', route_code='0')
+        result.status(test_id='a', test_status='inprogress', route_code='1')
+        result.status(test_id='a', test_status='success', route_code='1')
+        result.status(test_id='a', test_status='skip', route_code='0')
+        result.stopTestRun()
+        self.assertEqual(
+            _b('test: a\nskip: a [ multipart\n]\n'
+                'test: a\nsuccessful: a [ multipart\n]\n'),
+            stream.getvalue())
@@ -0,0 +1,145 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+import io
+
+from testtools import ExtendedToStreamDecorator, TestCase
+from testtools.compat import _b
+from testtools.testresult.doubles import StreamResult
+
+from subunit import ProtocolTestCase, _to_v2
+
+
+# Every directive, with details in each form, tags in and out of tests, and
+# a test left unfinished. Times are given so the events are deterministic.
+STREAM = _b(
+    "time: 2009-10-10 01:02:03.000000Z\n"
+    "tags: global\n"
+    "test: a\n"
+    "tags: local\n"
+    "time: 2009-10-10 01:02:04.000000Z\n"
+    "success: a\n"
+    "test: b\n"
+    "failure: b [\n"
+    "tb line\n"
+    " ]quoted\n"
+    "]\n"
+    "test: c\n"
+    "error: c [ multipart\n"
+    "Content-Type: text/plain;charset=utf8\n"
+    "log\n"
+    "5\r\n"
+    "hello0\r\n"
+    "Content-Type: text/x-traceback;charset=utf8,language=python\n"
+    "traceback\n"
+    "3\r\n"
+    "abc0\r\n"
+    "]\n"
+    "test: d\n"
+    "skip: d [\n"
+    "reason\n"
+    "]\n"
+    "test: e\n"
+    "xfail: e\n"
+    "test: f\n"
+    "uxsuccess: f [\n"
+    "]\n"
+    "non-subunit line\n"
+    "progress: 5\n"
+    "tags: -global\n"
+    "test: g\n"
+    "success: g [\n"
+    "]\n"
+    "test: h\n"
+    "skip: h\n"
+    "test: i\n"
+    "error: i [\n"
+    "partial\n")
+
+
+def sorted_files(events):
+    """Sort each run of a test's file events by file name.
+
+    The decorator sends details in the order of a dict, which is arbitrary
+    on Python 2.
+    """
+    result = []
+    run = []
+    for event in events:
+        if event[0] == 'status' and event[5] is not None and (
+            not run or run[0][1] == event[1]):
+            run.append(event)
+            continue
+        result.extend(sorted(run, key=lambda event: event[5]))
+        run = []
+        if event[0] == 'status' and event[5] is not None:
+            run.append(event)
+        else:
+            result.append(event)
+    result.extend(sorted(run, key=lambda event: event[5]))
+    return result
+
+
+def decorator_events(stream_bytes):
+    """The events ProtocolTestCase gives ExtendedToStreamDecorator."""
+    result = StreamResult()
+    passthrough = io.BytesIO()
+    decorator = ExtendedToStreamDecorator(result)
+    decorator.startTestRun()
+    ProtocolTestCase(io.BytesIO(stream_bytes), passthrough).run(decorator)
+    decorator.stopTestRun()
+    return sorted_files(result._events), passthrough.getvalue()
+
+
+def transcoded_events(stream_bytes, block_size=65536):
+    result = StreamResult()
+    passthrough = io.BytesIO()
+    _to_v2.v1_to_v2(io.BytesIO(stream_bytes), result, passthrough,
+        block_size=block_size)
+    return sorted_files(result._events), passthrough.getvalue()
+
+
+class TestV1ToV2(TestCase):
+
+    def test_same_as_decorator(self):
+        self.assertEqual(decorator_events(STREAM), transcoded_events(STREAM))
+
+    def test_same_as_decorator_small_blocks(self):
+        self.assertEqual(decorator_events(STREAM),
+            transcoded_events(STREAM, block_size=3))
+
+    def test_large_multipart_detail_in_several_events(self):
+        body = _b('x' * 1024 * 1024 + 'y')
+        stream = (_b("time: 2009-10-10 01:02:03.000000Z\n"
+            "test: a\nsuccess: a [ multipart\nContent-Type: text/plain\n"
+            "log\n") + _b("%X\r\n" % len(body)) + body + _b("0\r\n]\n"))
+        events, _ = transcoded_events(stream)
+        events = [event for event in events if event[0] == 'status']
+        files = [event for event in events if event[5] == 'log']
+        self.assertEqual(2, len(files))
+        self.assertEqual(body, files[0][6] + files[1][6])
+        self.assertEqual([False, True], [event[7] for event in files])
+        self.assertEqual(['text/plain', 'text/plain'],
+            [event[8] for event in files])
+        self.assertEqual(('status', 'a', 'success'), events[-1][:3])
+
+    def test_lost_connection_in_details(self):
+        events, _ = transcoded_events(_b("test: a\nfailure: a [\n"))
+        events = [event for event in events if event[0] == 'status']
+        self.assertEqual(('status', 'a', 'fail'), events[-1][:3])
+        self.assertIn(
+            _b("lost connection during failure report of test 'a'"),
+            events[-2][6])
@@ -0,0 +1,58 @@
+#
+#  subunit: extensions to Python unittest to get test results from subprocesses.
+#  Copyright (C) 2013  Robert Collins <robertc@robertcollins.net>
+#
+#  Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+#  license at the users choice. A copy of both licenses are available in the
+#  project source as Apache-2.0 and BSD. You may not use this file except in
+#  compliance with one of these two licences.
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+#  license you chose for the specific language governing permissions and
+#  limitations under that license.
+#
+
+from testtools import TestCase
+
+from subunit import _varint
+
+
+class TestVarint(TestCase):
+
+    boundaries = [
+        (0, b'\x00'),
+        (63, b'\x3f'),
+        (64, b'\x40\x40'),
+        (16383, b'\x7f\xff'),
+        (16384, b'\x80\x40\x00'),
+        (4194303, b'\xbf\xff\xff'),
+        (4194304, b'\xc0\x40\x00\x00'),
+        (1073741823, b'\xff\xff\xff\xff'),
+        ]
+
+    def test_encode(self):
+        for value, encoded in self.boundaries:
+            self.assertEqual(encoded, _varint.encode(value))
+
+    def test_encode_out_of_range(self):
+        self.assertRaises(ValueError, _varint.encode, -1)
+        self.assertRaises(ValueError, _varint.encode, 1073741824)
+
+    def test_decode(self):
+        for value, encoded in self.boundaries:
+            self.assertEqual(
+                (value, len(encoded)), _varint.decode(b'x' + encoded, 1))
+            self.assertEqual(
+                (value, len(encoded)),
+                _varint.decode(memoryview(encoded + b'x'), 0))
+
+    def test_decode_truncated(self):
+        self.assertRaises(ValueError, _varint.decode, b'', 0)
+        self.assertRaises(ValueError, _varint.decode, b'\x80\x40', 0)
+
+    def test_round_trip_table(self):
+        for value in range(0, 16384, 7):
+            encoded = _varint.encode(value)
+            self.assertEqual((value, len(encoded)), _varint.decode(encoded, 0))
@@ -22,17 +22,18 @@ import os
 import select
 import struct
 import sys
+import time
 import zlib
 
-from extras import safe_hasattr, try_imports
-builtins = try_imports(['__builtin__', 'builtins'])
-
 import subunit
+from subunit import _varint
 import subunit.iso8601 as iso8601
 
 __all__ = [
+    'ByteStreamDecoder',
     'ByteStreamToStreamResult',
     'StreamResultToBytes',
+    'timestamp_to_datetime',
     ]
 
 SIGNATURE = b'\xb3'
@@ -50,12 +51,44 @@ FLAG_MIME_TYPE = 0x0020
 FLAG_EOF = 0x0010
 FLAG_FILE_CONTENT = 0x0040
 EPOCH = datetime.datetime.utcfromtimestamp(0).replace(tzinfo=iso8601.Utc())
+# The block size the shipped filters read v2 input in; see
+# ByteStreamToStreamResult.
+INPUT_BLOCK_SIZE = 65536
 NUL_ELEMENT = b'\0'[0]
 # Contains True for types for which 'nul in thing' falsely returns false.
 _nul_test_broken = {}
 _PY3 = (sys.version_info >= (3,))
 
 
+def _timestamp_fields(timestamp):
+    """Return the seconds and nanoseconds since the epoch of a timestamp.
+
+    :param timestamp: A (seconds, nanoseconds) pair, an aware datetime, or
+        an integer count of nanoseconds such as time.time_ns() returns.
+    """
+    if type(timestamp) is tuple:
+        return timestamp
+    if isinstance(timestamp, datetime.datetime):
+        since_epoch = timestamp - EPOCH
+        return (since_epoch.days * 86400 + since_epoch.seconds,
+            since_epoch.microseconds * 1000)
+    return divmod(timestamp, 1000000000)
+
+
+def timestamp_to_datetime(timestamp):
+    """Return timestamp as an aware datetime.
+
+    :param timestamp: Any timestamp StreamResultToBytes accepts, such as the
+        (seconds, nanoseconds) pairs decoded with raw_timestamps=True. A
+        datetime is returned unchanged, and None stays None. Nanoseconds are
+        truncated to microseconds.
+    """
+    if timestamp is None or isinstance(timestamp, datetime.datetime):
+        return timestamp
+    seconds, nanoseconds = _timestamp_fields(timestamp)
+    return EPOCH + datetime.timedelta(0, seconds, nanoseconds // 1000)
+
+
 def has_nul(buffer_or_bytes):
     """Return True if a null byte is present in buffer_or_bytes."""
     # Simple "if NUL_ELEMENT in utf8_bytes:" fails on Python 3.1 and 3.2 with
@@ -72,10 +105,134 @@ def has_nul(buffer_or_bytes):
         return NUL_ELEMENT in buffer_or_bytes
 
 
+def _crc32(data, crc=0):
+    """Return zlib.crc32(data, crc) for any bytes-like data."""
+    if not _PY3 and not isinstance(data, bytes):
+        # Python 2's crc32 only takes str and read-only buffers.
+        data = memoryview(data).tobytes()
+    return zlib.crc32(data, crc)
+
 class ParseError(Exception):
     """Used to pass error messages within the parser."""
 
 
+def _write_all(stream, data):
+    """Write all of data to stream."""
+    if _PY3:
+        # On eventlet 0.17.3, GreenIO.write() can make partial write.
+        # Use a loop to ensure that all bytes are written.
+        # See also the eventlet issue:
+        # https://github.com/eventlet/eventlet/issues/248
+        view = memoryview(data)
+        datalen = len(data)
+        offset = 0
+        while offset < datalen:
+            written = stream.write(view[offset:])
+            offset += written
+    else:
+        stream.write(data)
+
+
+# Fragments at least this long are written on their own rather than joined.
+_LARGE_FRAGMENT = 65536
+
+
+def _write_fragments(stream, fragments):
+    """Write a sequence of byte strings to stream, in order.
+
+    Runs of small fragments are joined and written together, but large ones
+    (such as file content) are written as they are, so that a packet is
+    never copied in full.
+    """
+    pending = []
+    for fragment in fragments:
+        if len(fragment) < _LARGE_FRAGMENT:
+            pending.append(fragment)
+            continue
+        if pending:
+            _write_all(stream, b''.join(pending))
+            pending = []
+        _write_all(stream, fragment)
+    if pending:
+        _write_all(stream, b''.join(pending))
+
+
+class _BatchingStream(object):
+    """Collect writes to a stream in memory and write them out in batches.
+
+    flush() only writes the collected bytes once there are at least
+    buffer_size of them, or the oldest is flush_interval seconds old. Either
+    may be None to not flush for that reason. There is no timer: the age is
+    only checked when flush() is called. Use flush_all() to write everything
+    out.
+    """
+
+    def __init__(self, stream, buffer_size, flush_interval=None):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = bytearray()
+        self._started = None
+
+    def write(self, data):
+        if not self._buffer:
+            self._started = time.time()
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        if (self.buffer_size is not None and
+            len(self._buffer) >= self.buffer_size):
+            self.flush_all()
+        elif (self.flush_interval is not None and self._buffer and
+            time.time() - self._started >= self.flush_interval):
+            self.flush_all()
+
+    def flush_all(self):
+        if self._buffer:
+            buffer = self._buffer
+            self._buffer = bytearray()
+            _write_all(self.stream, buffer)
+        self.stream.flush()
+
+
+def _iter_chunks(file_bytes, chunk_size):
+    """Yield file_bytes in pieces of at most chunk_size bytes.
+
+    :param file_bytes: bytes, a file-like object with a read method or an
+        iterable of bytes. Only a file-like or iterable source is read
+        incrementally; bytes that fit in one piece are yielded unaltered and
+        larger bytes are sliced (without copying on Python 3).
+    """
+    read = getattr(file_bytes, 'read', None)
+    if read is not None:
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    if isinstance(file_bytes, (bytes, bytearray, memoryview)):
+        if not _PY3 and not isinstance(file_bytes, bytes):
+            # Python 2 cannot join these with the other packet fragments.
+            file_bytes = memoryview(file_bytes).tobytes()
+        if len(file_bytes) <= chunk_size:
+            yield file_bytes
+            return
+        # On Python 2 these slices are copies.
+        view = memoryview(file_bytes) if _PY3 else file_bytes
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+        return
+    pending = bytearray()
+    for piece in file_bytes:
+        pending.extend(piece)
+        while len(pending) >= chunk_size:
+            yield bytes(pending[:chunk_size])
+            del pending[:chunk_size]
+    if pending:
+        yield bytes(pending)
+
+
 class StreamResultToBytes(object):
     """Convert StreamResult API calls to bytes.
     
@@ -95,30 +252,102 @@ class StreamResultToBytes(object):
 
     zero_b = b'\0'[0]
 
-    def __init__(self, output_stream):
+    def __init__(self, output_stream, buffer_size=None, flush_interval=None):
         """Create a StreamResultToBytes with output written to output_stream.
 
         :param output_stream: A file-like object. Must support write(bytes)
             and flush() methods. Flush will be called after each write.
             The stream will be passed through subunit.make_stream_binary,
             to handle regular cases such as stdout.
+        :param buffer_size: If set to non-None, packets are collected in
+            memory and written to output_stream in batches of at least this
+            many bytes rather than written and flushed one at a time. Anything
+            collected is written out by stopTestRun. Other writers to the same
+            stream should write to self.output_stream to keep their output in
+            order with the packets.
+        :param flush_interval: When buffer_size is set, also write out the
+            collected packets when writing a packet finds the oldest one is
+            at least this many seconds old.
         """
         self.output_stream = subunit.make_stream_binary(output_stream)
+        if buffer_size is not None:
+            self.output_stream = _BatchingStream(
+                self.output_stream, buffer_size, flush_interval)
 
     def startTestRun(self):
         pass
 
     def stopTestRun(self):
-        pass
+        flush_all = getattr(self.output_stream, 'flush_all', None)
+        if flush_all is not None:
+            flush_all()
 
     def status(self, test_id=None, test_status=None, test_tags=None,
         runnable=True, file_name=None, file_bytes=None, eof=False,
         mime_type=None, route_code=None, timestamp=None):
-        self._write_packet(test_id=test_id, test_status=test_status,
+        """Write a status event.
+
+        file_bytes may be bytes, a file-like object with a read method, or
+        an iterable of bytes. File content too large for one packet (or read
+        from a file-like or iterable source) is written as a series of
+        packets of at most 4MiB each: all but the last carry only the test
+        id, file name, mime type, route code and timestamp, and the last
+        carries the remaining content along with every other field,
+        including eof.
+
+        timestamp may be an aware datetime, a (seconds, nanoseconds) pair
+        since the epoch, or an integer count of nanoseconds since the epoch
+        such as time.time_ns() returns. The latter two are written without
+        any datetime arithmetic.
+        """
+        for packet in self._packets(test_id=test_id, test_status=test_status,
+            test_tags=test_tags, runnable=runnable, file_name=file_name,
+            file_bytes=file_bytes, eof=eof, mime_type=mime_type,
+            route_code=route_code, timestamp=timestamp):
+            self._write_packet(**packet)
+
+    def _packets(self, test_id=None, test_status=None, test_tags=None,
+        runnable=True, file_name=None, file_bytes=None, eof=False,
+        mime_type=None, route_code=None, timestamp=None):
+        """Yield the keyword arguments of each packet for a status event."""
+        if file_name is not None:
+            chunk_size = self._file_chunk_size(test_id, test_tags,
+                file_name, mime_type, route_code, timestamp)
+            chunks = _iter_chunks(file_bytes, chunk_size)
+            file_bytes = next(chunks, b'')
+            for chunk in chunks:
+                yield dict(test_id=test_id, runnable=runnable,
+                    file_name=file_name, file_bytes=file_bytes,
+                    mime_type=mime_type, route_code=route_code,
+                    timestamp=timestamp)
+                file_bytes = chunk
+        yield dict(test_id=test_id, test_status=test_status,
             test_tags=test_tags, runnable=runnable, file_name=file_name,
             file_bytes=file_bytes, eof=eof, mime_type=mime_type,
             route_code=route_code, timestamp=timestamp)
 
+    def _file_chunk_size(self, test_id, test_tags, file_name, mime_type,
+        route_code, timestamp):
+        """Return how many file bytes fit in a packet with these fields.
+
+        The length and file length are counted as 3 bytes each, as they are
+        whenever chunking is needed.
+        """
+        # signature, flags, length, file length and CRC.
+        overhead = 1 + 2 + 3 + 3 + 4
+        if timestamp is not None:
+            nanoseconds = _timestamp_fields(timestamp)[1]
+            overhead += 4 + len(_varint.encode(nanoseconds))
+        strings = [test_id, file_name, route_code, mime_type or None]
+        if test_tags:
+            overhead += len(_varint.encode(len(test_tags)))
+            strings.extend(test_tags)
+        for a_string in strings:
+            if a_string is not None:
+                length = len(a_string.encode('utf-8'))
+                overhead += len(_varint.encode(length)) + length
+        return max(4194303 - overhead, 1)
+
     def _write_utf8(self, a_string, packet):
         utf8 = a_string.encode('utf-8')
         self._write_number(len(utf8), packet)
@@ -129,24 +358,7 @@ class StreamResultToBytes(object):
         packet.append(struct.pack(FMT_16, length))
 
     def _write_number(self, value, packet):
-        packet.extend(self._encode_number(value))
-
-    def _encode_number(self, value):
-        assert value >= 0
-        if value < 64:
-            return [struct.pack(FMT_8, value)]
-        elif value < 16384:
-            value = value | 0x4000
-            return [struct.pack(FMT_16, value)]
-        elif value < 4194304:
-            value = value | 0x800000
-            return [struct.pack(FMT_16, value >> 8),
-                    struct.pack(FMT_8, value & 0xff)]
-        elif value < 1073741824:
-            value = value | 0xc0000000
-            return [struct.pack(FMT_32, value)]
-        else:
-            raise ValueError('value too large to encode: %r' % (value,))
+        packet.append(_varint.encode(value))
 
     def _write_packet(self, test_id=None, test_status=None, test_tags=None,
         runnable=True, file_name=None, file_bytes=None, eof=False,
@@ -158,9 +370,7 @@ class StreamResultToBytes(object):
         flags = 0x2000 # Version 0x2
         if timestamp is not None:
             flags = flags | FLAG_TIMESTAMP
-            since_epoch = timestamp - EPOCH
-            nanoseconds = since_epoch.microseconds * 1000
-            seconds = (since_epoch.seconds + since_epoch.days * 24 * 3600)
+            seconds, nanoseconds = _timestamp_fields(timestamp)
             packet.append(struct.pack(FMT_32, seconds))
             self._write_number(nanoseconds, packet)
         if test_id is not None:
@@ -200,50 +410,40 @@ class StreamResultToBytes(object):
             # three bytes to encode length, 419430+3=4194303
             length_length = 3
         else:
-            # Longer than policy:
-            # TODO: chunk the packet automatically?
-            # - strip all but file data
-            # - do 4M chunks of that till done
-            # - include original data in final chunk.
+            # Longer than policy. status() chunks file content, so only
+            # oversized test ids, tags and the like get here.
             raise ValueError("Length too long: %r" % base_length)
-        packet[2:3] = self._encode_number(base_length + length_length)
-        # We could either do a partial application of crc32 over each chunk
-        # or a single join to a temp variable then a final join
-        # or two writes (that python might then split).
-        # For now, simplest code: join, crc32, join, output
-        content = b''.join(packet)
-        data = content + struct.pack(FMT_32, zlib.crc32(content) & 0xffffffff)
-        if _PY3:
-            # On eventlet 0.17.3, GreenIO.write() can make partial write.
-            # Use a loop to ensure that all bytes are written.
-            # See also the eventlet issue:
-            # https://github.com/eventlet/eventlet/issues/248
-            view = memoryview(data)
-            datalen = len(data)
-            offset = 0
-            while offset < datalen:
-                written = self.output_stream.write(view[offset:])
-                offset += written
-        else:
-            self.output_stream.write(data)
+        packet[2] = _varint.encode(base_length + length_length)
+        crc = 0
+        for fragment in packet:
+            crc = _crc32(fragment, crc)
+        packet.append(struct.pack(FMT_32, crc & 0xffffffff))
+        _write_fragments(self.output_stream, packet)
         self.output_stream.flush()
 
 
-class ByteStreamToStreamResult(object):
-    """Parse a subunit byte stream.
+def _parse_error_events(packet_bytes, error):
+    """Return the events that report a packet that could not be parsed.
 
-    Mixed streams that contain non-subunit content is supported when a
-    non_subunit_name is passed to the contructor. The default is to raise an
-    error containing the non-subunit byte after it has been read from the
-    stream.
+    :param packet_bytes: The bytes of the packet that were read.
+    :param error: The ParseError raised while parsing it.
+    :return: A list of dicts of keyword arguments for StreamResult.status.
+    """
+    return [
+        dict(test_id="subunit.parser", eof=True, file_name="Packet data",
+            file_bytes=packet_bytes, mime_type="application/octet-stream"),
+        dict(test_id="subunit.parser", test_status='fail', eof=True,
+            file_name="Parser Error",
+            file_bytes=(error.args[0]).encode('utf8'),
+            mime_type="text/plain;charset=utf8"),
+        ]
 
-    Typical use:
 
-       >>> case = ByteStreamToStreamResult(sys.stdin.buffer)
-       >>> result = StreamResult()
-       >>> result.startTestRun()
-       >>> case.run(result)
-       >>> result.stopTestRun()
+class _PacketDecoder(object):
+    """Decode complete packets held in memory.
+
+    This is shared by the readers of v2 streams; subclasses set zero_copy
+    and raw_timestamps.
     """
 
     status_lookup = {
@@ -257,7 +457,151 @@ class ByteStreamToStreamResult(object):
         0x7: 'xfail',
         }
 
-    def __init__(self, source, non_subunit_name=None):
+    def _parse_varint(self, data, pos, max_3_bytes=False):
+        # because the only incremental IO we do is at the start, and the 32 bit
+        # CRC means we can always safely read enough to cover any varint, we
+        # can be sure that there should be enough data - and if not it is an
+        # error not a normal situation.
+        # Indexing gives a str on Python 2, so read the first byte via struct.
+        if max_3_bytes and _varint._unpack_1(data, pos)[0] >= 0xc0:
+            raise ParseError('3 byte maximum given but 4 byte value found.')
+        try:
+            return _varint.decode(data, pos)
+        except ValueError:
+            raise ParseError('Number at offset %d extends past end of packet'
+                % (pos - 3,))
+
+    def _decode_packet(self, data, consumed):
+        """Check the CRC of a complete packet and decode its fields.
+
+        :param data: A bytes-like object holding the whole packet, from the
+            signature to the CRC.
+        :param consumed: The number of bytes the length took up.
+        :return: A dict of keyword arguments for StreamResult.status.
+        """
+        length = len(data)
+        crc = _crc32(data[:-4]) & 0xffffffff
+        packet_crc = struct.unpack_from(FMT_32, data, length - 4)[0]
+        if crc != packet_crc:
+            # Bad CRC, report it and stop parsing the packet.
+            raise ParseError(
+                'Bad checksum - calculated (0x%x), stored (0x%x)'
+                    % (crc, packet_crc))
+        return self._decode(memoryview(data)[:-4], 3 + consumed)
+
+    def _decode(self, body, pos):
+        """Decode the fields of a packet.
+
+        :param body: A memoryview of the packet, from the signature up to but
+            excluding the CRC.
+        :param pos: The offset of the first field after the length.
+        :return: A dict of keyword arguments for StreamResult.status.
+        """
+        flags = struct.unpack_from(FMT_16, body, 1)[0]
+        # One packet could have both file and status data; the Python API
+        # presents these separately (perhaps it shouldn't?)
+        if flags & FLAG_TIMESTAMP:
+            seconds = struct.unpack_from(FMT_32, body, pos)[0]
+            nanoseconds, consumed = self._parse_varint(body, pos+4)
+            pos = pos + 4 + consumed
+            if self.raw_timestamps:
+                timestamp = (seconds, nanoseconds)
+            else:
+                timestamp = EPOCH + datetime.timedelta(
+                    0, seconds, nanoseconds // 1000)
+        else:
+            timestamp = None
+        if flags & FLAG_TEST_ID:
+            test_id, pos = self._read_utf8(body, pos)
+        else:
+            test_id = None
+        if flags & FLAG_TAGS:
+            tag_count, consumed = self._parse_varint(body, pos)
+            pos += consumed
+            test_tags = set()
+            for _ in range(tag_count):
+                tag, pos = self._read_utf8(body, pos)
+                test_tags.add(tag)
+        else:
+            test_tags = None
+        if flags & FLAG_MIME_TYPE:
+            mime_type, pos = self._read_utf8(body, pos)
+        else:
+            mime_type = None
+        if flags & FLAG_FILE_CONTENT:
+            file_name, pos = self._read_utf8(body, pos)
+            content_length, consumed = self._parse_varint(body, pos)
+            pos += consumed
+            file_bytes = body[pos:pos+content_length]
+            if len(file_bytes) != content_length:
+                raise ParseError('File content extends past end of packet: '
+                    'claimed %d bytes, %d available' % (
+                    content_length, len(file_bytes)))
+            if not self.zero_copy:
+                file_bytes = file_bytes.tobytes()
+            pos += content_length
+        else:
+            file_name = None
+            file_bytes = None
+        if flags & FLAG_ROUTE_CODE:
+            route_code, pos = self._read_utf8(body, pos)
+        else:
+            route_code = None
+        return dict(test_id=test_id,
+            test_status=self.status_lookup[flags & 0x0007],
+            test_tags=test_tags, runnable=bool(flags & FLAG_RUNNABLE),
+            mime_type=mime_type, eof=bool(flags & FLAG_EOF),
+            file_name=file_name, file_bytes=file_bytes,
+            route_code=route_code, timestamp=timestamp)
+
+    def _read_utf8(self, buf, pos):
+        # Offsets in errors are relative to the flags, as they always were.
+        length, consumed = self._parse_varint(buf, pos)
+        pos += consumed
+        utf8_bytes = buf[pos:pos+length]
+        if length != len(utf8_bytes):
+            raise ParseError(
+                'UTF8 string at offset %d extends past end of packet: '
+                'claimed %d bytes, %d available' % (pos - 3, length,
+                len(utf8_bytes)))
+        try:
+            utf8, decoded_bytes = utf_8_decode(utf8_bytes)
+        except UnicodeDecodeError:
+            if has_nul(utf8_bytes):
+                raise ParseError(
+                    'UTF8 string at offset %d contains NUL byte' % (pos-3,))
+            raise ParseError('UTF8 string at offset %d is not UTF8' % (pos-3,))
+        # Checking the decoded string for NUL is much cheaper than scanning
+        # the memoryview.
+        if u'\0' in utf8:
+            raise ParseError('UTF8 string at offset %d contains NUL byte' % (
+                pos-3,))
+        if decoded_bytes != length:
+            raise ParseError("Invalid (partially decodable) string at "
+                "offset %d, %d undecoded bytes" % (
+                pos-3, length - decoded_bytes))
+        return utf8, length+pos
+
+
+class ByteStreamToStreamResult(_PacketDecoder):
+    """Parse a subunit byte stream.
+
+    Mixed streams that contain non-subunit content is supported when a
+    non_subunit_name is passed to the contructor. The default is to raise an
+    error containing the non-subunit byte after it has been read from the
+    stream.
+
+    Typical use:
+
+       >>> case = ByteStreamToStreamResult(sys.stdin.buffer)
+       >>> result = StreamResult()
+       >>> result.startTestRun()
+       >>> case.run(result)
+       >>> result.stopTestRun()
+    """
+
+    def __init__(self, source, non_subunit_name=None, block_size=None,
+        zero_copy=False, raw_timestamps=False):
         """Create a ByteStreamToStreamResult.
 
         :param source: A file like object to read bytes from. Must support
@@ -267,16 +611,40 @@ class ByteStreamToStreamResult(object):
         :param non_subunit_name: If set to non-None, non subunit content
             encountered in the stream will be converted into file packets
             labelled with this name.
+        :param block_size: If set to non-None, read source in blocks of up
+            to this many bytes (using read1() where the source supports it)
+            rather than one byte at a time, and search the blocks for packet
+            signatures. Non subunit content is still emitted up to the next
+            packet, the end of the stream, or 1MiB - but bytes already read
+            into the block buffer are not waited on with select, so sources
+            without a fileno produce one chunk per block read.
+        :param zero_copy: If True, file_bytes is passed to result.status()
+            as a memoryview slice of the packet rather than as a bytes copy.
+            The packet buffer is never reused, so the memoryview stays valid
+            after status() returns - but it keeps the buffer alive.
+        :param raw_timestamps: If True, timestamps are passed to
+            result.status() as (seconds, nanoseconds) pairs since the epoch
+            rather than as datetimes, keeping any sub-microsecond part.
+            StreamResultToBytes writes these back out as they are, and
+            timestamp_to_datetime converts them for consumers that need a
+            datetime.
         """
         self.non_subunit_name = non_subunit_name
         self.source = subunit.make_stream_binary(source)
         self.codec = codecs.lookup('utf8').incrementaldecoder()
+        self.block_size = block_size
+        self.zero_copy = zero_copy
+        self.raw_timestamps = raw_timestamps
+        self._read = self.source.read
 
     def run(self, result):
         """Parse source and emit events to result.
         
         This is a blocking call: it will run until EOF is detected on source.
         """
+        if self.block_size is not None:
+            return self._run_blocks(result)
+        self._read = self.source.read
         self.codec.reset()
         mid_character = False
         while True:
@@ -357,162 +725,321 @@ class ByteStreamToStreamResult(object):
             # Otherwise, parse a data packet.
             self._parse_packet(result)
 
+    def _run_blocks(self, result):
+        """Parse source a block at a time and emit events to result."""
+        # Invalid UTF8 is replaced rather than raised so that the decoder
+        # state always tells us whether a signature byte is mid-character.
+        decoder = codecs.getincrementaldecoder('utf8')('replace')
+        self._buffer = b''
+        self._offset = 0
+        self._read = self._read_buffered
+        source_read = getattr(self.source, 'read1', self.source.read)
+        pending = []
+        pending_length = 0
+        while True:
+            buffer = self._buffer
+            offset = self._offset
+            if offset == len(buffer):
+                if pending and not self._more_readable():
+                    self._emit_non_subunit(result, pending)
+                    pending = []
+                    pending_length = 0
+                buffer = source_read(self.block_size)
+                if not buffer:
+                    # EOF
+                    if pending:
+                        self._emit_non_subunit(result, pending)
+                    return
+                self._buffer = buffer
+                self._offset = offset = 0
+            search_from = offset
+            while True:
+                signature = buffer.find(SIGNATURE, search_from)
+                if signature == -1:
+                    end = len(buffer)
+                else:
+                    end = signature
+                if end > search_from:
+                    decoder.decode(buffer[search_from:end])
+                if signature != -1 and decoder.getstate()[0]:
+                    # The signature byte is part of a UTF8 character.
+                    decoder.decode(buffer[signature:signature + 1])
+                    search_from = signature + 1
+                    continue
+                break
+            if end > offset:
+                if self.non_subunit_name is None:
+                    self._offset = offset + 1
+                    raise Exception(
+                        "Non subunit content", buffer[offset:offset + 1])
+                while end - offset >= 1048576 - pending_length:
+                    # Emit exactly 1MiB at a time, as run() does.
+                    split = offset + 1048576 - pending_length
+                    pending.append(buffer[offset:split])
+                    self._emit_non_subunit(result, pending)
+                    pending = []
+                    pending_length = 0
+                    offset = split
+                if end > offset:
+                    pending.append(buffer[offset:end])
+                    pending_length += end - offset
+            self._offset = end
+            if signature == -1:
+                continue
+            if pending:
+                self._emit_non_subunit(result, pending)
+                pending = []
+                pending_length = 0
+            self._offset = end + 1
+            self._parse_packet(result)
+
+    def _emit_non_subunit(self, result, chunks):
+        result.status(
+            file_name=self.non_subunit_name, file_bytes=b''.join(chunks))
+
+    def _more_readable(self):
+        """Return True if the source has more bytes ready to read now."""
+        if sys.platform == 'win32':
+            return False
+        try:
+            self.source.fileno()
+        except:
+            return False
+        return bool(select.select([self.source], [], [], 0.000001)[0])
+
+    def _read_buffered(self, count):
+        """Read count bytes, consuming the block buffer first."""
+        buffer = self._buffer
+        offset = self._offset
+        available = len(buffer) - offset
+        if available >= count:
+            self._offset = offset + count
+            return buffer[offset:offset + count]
+        self._buffer = b''
+        self._offset = 0
+        data = buffer[offset:]
+        remainder = self.source.read(count - available)
+        if not data:
+            return remainder
+        return data + remainder
+
     def _parse_packet(self, result):
         try:
             packet = [SIGNATURE]
             self._parse(packet, result)
         except ParseError as error:
-            result.status(test_id="subunit.parser", eof=True,
-                file_name="Packet data", file_bytes=b''.join(packet),
-                mime_type="application/octet-stream")
-            result.status(test_id="subunit.parser", test_status='fail',
-                eof=True, file_name="Parser Error",
-                file_bytes=(error.args[0]).encode('utf8'),
-                mime_type="text/plain;charset=utf8")
-
-    def _to_bytes(self, data, pos, length):
-        """Return a slice of data from pos for length as bytes."""
-        # memoryview in 2.7.3 and 3.2 isn't directly usable with struct :(.
-        # see https://bugs.launchpad.net/subunit/+bug/1216163
-        result = data[pos:pos+length]
-        if type(result) is not bytes:
-            return result.tobytes()
-        return result
+            # The packet may be a bytearray or memoryview, which Python 2
+            # cannot join.
+            packet_bytes = b''.join(
+                memoryview(fragment).tobytes() for fragment in packet)
+            for event in _parse_error_events(packet_bytes, error):
+                result.status(**event)
 
-    def _parse_varint(self, data, pos, max_3_bytes=False):
-        # because the only incremental IO we do is at the start, and the 32 bit
-        # CRC means we can always safely read enough to cover any varint, we
-        # can be sure that there should be enough data - and if not it is an
-        # error not a normal situation.
-        data_0 = struct.unpack(FMT_8, self._to_bytes(data, pos, 1))[0]
-        typeenum = data_0 & 0xc0
-        value_0 = data_0 & 0x3f
-        if typeenum == 0x00:
-            return value_0, 1
-        elif typeenum == 0x40:
-            data_1 = struct.unpack(FMT_8, self._to_bytes(data, pos+1, 1))[0]
-            return (value_0 << 8) | data_1, 2
-        elif typeenum == 0x80:
-            data_1 = struct.unpack(FMT_16, self._to_bytes(data, pos+1, 2))[0]
-            return (value_0 << 16) | data_1, 3
-        else:
-            if max_3_bytes:
-                raise ParseError('3 byte maximum given but 4 byte value found.')
-            data_1, data_2 = struct.unpack(FMT_24, self._to_bytes(data, pos+1, 3))
-            result = (value_0 << 24) | data_1 << 8 | data_2
-            return result, 4
+    def _read_packet(self, header, length):
+        """Read the rest of a packet into one contiguous buffer.
+
+        :param header: The 5 bytes read after the signature.
+        :param length: The length of the packet, from signature to CRC.
+        :return: A bytes-like object holding the whole packet - shorter than
+            length if the source ran out.
+        """
+        if self.block_size is not None:
+            # Block mode: the packet is usually already in the block buffer.
+            start = self._offset - 6
+            end = start + length
+            if start >= 0 and end <= len(self._buffer):
+                self._offset = end
+                return memoryview(self._buffer)[start:end]
+            return SIGNATURE + header + self._read(length - 6)
+        readinto = getattr(self.source, 'readinto', None)
+        if readinto is None:
+            return SIGNATURE + header + self._read(length - 6)
+        packet = bytearray(length)
+        packet[:6] = SIGNATURE + header
+        view = memoryview(packet)
+        pos = 6
+        while pos < length:
+            count = readinto(view[pos:])
+            if not count:
+                del view
+                del packet[pos:]
+                break
+            pos += count
+        return packet
 
     def _parse(self, packet, result):
-            # 2 bytes flags, at most 3 bytes length.
-            packet.append(self.source.read(5))
-            if len(packet[-1]) != 5:
-                raise ParseError(
-                    'Short read - got %d bytes, wanted 5' % len(packet[-1]))
-            flag_bytes = packet[-1][:2]
-            flags = struct.unpack(FMT_16, flag_bytes)[0]
-            length, consumed = self._parse_varint(
-                packet[-1], 2, max_3_bytes=True)
-            remainder = self.source.read(length - 6)
-            if len(remainder) != length - 6:
-                raise ParseError(
-                    'Short read - got %d bytes, wanted %d bytes' % (
-                    len(remainder), length - 6))
-            if consumed != 3:
-                # Avoid having to parse torn values
-                packet[-1] += remainder
-                pos = 2 + consumed
-            else:
-                # Avoid copying potentially lots of data.
-                packet.append(remainder)
-                pos = 0
-            crc = zlib.crc32(packet[0])
-            for fragment in packet[1:-1]:
-                crc = zlib.crc32(fragment, crc)
-            crc = zlib.crc32(packet[-1][:-4], crc) & 0xffffffff
-            packet_crc = struct.unpack(FMT_32, packet[-1][-4:])[0]
-            if crc != packet_crc:
-                # Bad CRC, report it and stop parsing the packet.
-                raise ParseError(
-                    'Bad checksum - calculated (0x%x), stored (0x%x)'
-                        % (crc, packet_crc))
-            if safe_hasattr(builtins, 'memoryview'):
-                body = memoryview(packet[-1])
-            else:
-                body = packet[-1]
-            # Discard CRC-32
-            body = body[:-4]
-            # One packet could have both file and status data; the Python API
-            # presents these separately (perhaps it shouldn't?)
-            if flags & FLAG_TIMESTAMP:
-                seconds = struct.unpack(FMT_32, self._to_bytes(body, pos, 4))[0]
-                nanoseconds, consumed = self._parse_varint(body, pos+4)
-                pos = pos + 4 + consumed
-                timestamp = EPOCH + datetime.timedelta(
-                    seconds=seconds, microseconds=nanoseconds/1000)
-            else:
-                timestamp = None
-            if flags & FLAG_TEST_ID:
-                test_id, pos = self._read_utf8(body, pos)
-            else:
-                test_id = None
-            if flags & FLAG_TAGS:
-                tag_count, consumed = self._parse_varint(body, pos)
-                pos += consumed
-                test_tags = set()
-                for _ in range(tag_count):
-                    tag, pos = self._read_utf8(body, pos)
-                    test_tags.add(tag)
-            else:
-                test_tags = None
-            if flags & FLAG_MIME_TYPE:
-                mime_type, pos = self._read_utf8(body, pos)
-            else:
-                mime_type = None
-            if flags & FLAG_FILE_CONTENT:
-                file_name, pos = self._read_utf8(body, pos)
-                content_length, consumed = self._parse_varint(body, pos)
-                pos += consumed
-                file_bytes = self._to_bytes(body, pos, content_length)
-                if len(file_bytes) != content_length:
-                    raise ParseError('File content extends past end of packet: '
-                        'claimed %d bytes, %d available' % (
-                        content_length, len(file_bytes)))
-                pos += content_length
-            else:
-                file_name = None
-                file_bytes = None
-            if flags & FLAG_ROUTE_CODE:
-                route_code, pos = self._read_utf8(body, pos)
-            else:
-                route_code = None
-            runnable = bool(flags & FLAG_RUNNABLE)
-            eof = bool(flags & FLAG_EOF)
-            test_status = self.status_lookup[flags & 0x0007]
-            result.status(test_id=test_id, test_status=test_status,
-                test_tags=test_tags, runnable=runnable, mime_type=mime_type,
-                eof=eof, file_name=file_name, file_bytes=file_bytes,
-                route_code=route_code, timestamp=timestamp)
+        # 2 bytes flags, at most 3 bytes length.
+        header = self._read(5)
+        packet.append(header)
+        if len(header) != 5:
+            raise ParseError(
+                'Short read - got %d bytes, wanted 5' % len(header))
+        length, consumed = self._parse_varint(header, 2, max_3_bytes=True)
+        if length < 6:
+            raise ParseError('Packet length %d is shorter than its header'
+                % length)
+        # From here on the whole packet, signature included, is one buffer
+        # which is decoded in place.
+        data = self._read_packet(header, length)
+        packet[:] = [data]
+        if len(data) != length:
+            raise ParseError(
+                'Short read - got %d bytes, wanted %d bytes' % (
+                len(data) - 6, length - 6))
+        result.status(**self._decode_packet(data, consumed))
+
     __call__ = run
 
-    def _read_utf8(self, buf, pos):
-        length, consumed = self._parse_varint(buf, pos)
-        pos += consumed
-        utf8_bytes = buf[pos:pos+length]
-        if length != len(utf8_bytes):
-            raise ParseError(
-                'UTF8 string at offset %d extends past end of packet: '
-                'claimed %d bytes, %d available' % (pos - 2, length,
-                len(utf8_bytes)))
-        if has_nul(utf8_bytes):
-            raise ParseError('UTF8 string at offset %d contains NUL byte' % (
-                pos-2,))
+
+class ByteStreamDecoder(_PacketDecoder):
+    """Decode a subunit byte stream that is pushed to it a piece at a time.
+
+    This does no IO of its own, so it can sit behind an event loop, where
+    ByteStreamToStreamResult would block reading its source. Each event is a
+    dict of keyword arguments for StreamResult.status, and packets that
+    cannot be parsed produce the same events ByteStreamToStreamResult
+    reports them with.
+
+    Typical use:
+
+       >>> decoder = ByteStreamDecoder()
+       >>> for data in chunks:
+       ...     for event in decoder.feed(data):
+       ...         result.status(**event)
+       >>> for event in decoder.close():
+       ...     result.status(**event)
+    """
+
+    def __init__(self, non_subunit_name=None, zero_copy=False,
+        raw_timestamps=False):
+        """Create a ByteStreamDecoder.
+
+        :param non_subunit_name: If set to non-None, non subunit content
+            is converted into file events labelled with this name: one for
+            each run of it in the data fed, split every 1MiB. Otherwise
+            feeding non subunit content raises an error.
+        :param zero_copy: If True, file_bytes is a memoryview slice of a copy
+            of the packet rather than a bytes copy of its own.
+        :param raw_timestamps: If True, timestamps are (seconds, nanoseconds)
+            pairs since the epoch rather than datetimes.
+        """
+        self.non_subunit_name = non_subunit_name
+        self.zero_copy = zero_copy
+        self.raw_timestamps = raw_timestamps
+        # Invalid UTF8 is replaced rather than raised so that the decoder
+        # state always tells us whether a signature byte is mid-character.
+        self._codec = codecs.getincrementaldecoder('utf8')('replace')
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Decode data, following on from the data fed before it.
+
+        :param data: Some bytes of the stream.
+        :return: A list of the events that data completes. Bytes of an
+            incomplete packet are kept until the rest of it is fed.
+        """
+        return [event for event, packet in self.feed_packets(data)]
+
+    def feed_packets(self, data):
+        """Decode data, pairing each event with the packet it came from.
+
+        This is feed() for filters that pass packets on without encoding
+        them again.
+
+        :param data: Some bytes of the stream.
+        :return: A list of (event, packet) pairs: packet is the bytes of the
+            whole packet the event was decoded from, or None for non subunit
+            content and for packets that could not be parsed.
+        """
+        buffer = self._buffer
+        buffer += data
+        events = []
+        pos = 0
         try:
-            utf8, decoded_bytes = utf_8_decode(utf8_bytes)
-            if decoded_bytes != length:
-                raise ParseError("Invalid (partially decodable) string at "
-                    "offset %d, %d undecoded bytes" % (
-                    pos-2, length - decoded_bytes))
-            return utf8, length+pos
-        except UnicodeDecodeError:
-            raise ParseError('UTF8 string at offset %d is not UTF8' % (pos-2,))
+            while pos < len(buffer):
+                # On Python 2 SIGNATURE[0] is a str, never equal to buffer[pos].
+                if (buffer.startswith(SIGNATURE, pos) and
+                    not self._codec.getstate()[0]):
+                    consumed = self._decode_next(buffer, pos, events)
+                    if not consumed:
+                        break
+                    pos += consumed
+                else:
+                    pos = self._non_subunit(buffer, pos, events)
+        finally:
+            del buffer[:pos]
+        return events
+
+    def close(self):
+        """Finish decoding: the stream has ended.
+
+        :return: A list of the events reporting an incomplete packet left
+            over from the data fed, if there is one.
+        """
+        data = bytes(self._buffer)
+        del self._buffer[:]
+        self._codec.reset()
+        if not data:
+            return []
+        if len(data) < 6:
+            error = ParseError(
+                'Short read - got %d bytes, wanted 5' % (len(data) - 1))
+        else:
+            length = self._parse_varint(data, 3, max_3_bytes=True)[0]
+            error = ParseError('Short read - got %d bytes, wanted %d bytes'
+                % (len(data) - 6, length - 6))
+        return _parse_error_events(data, error)
 
+    def _decode_next(self, buffer, pos, events):
+        """Decode the packet starting at pos, if it is all in buffer.
+
+        :return: The number of bytes used, or 0 if more are needed.
+        """
+        if len(buffer) - pos < 6:
+            return 0
+        try:
+            length, consumed = self._parse_varint(
+                buffer, pos + 3, max_3_bytes=True)
+            if length < 6:
+                raise ParseError('Packet length %d is shorter than its header'
+                    % length)
+        except ParseError as error:
+            events.extend((event, None) for event in
+                _parse_error_events(bytes(buffer[pos:pos + 6]), error))
+            return 6
+        if len(buffer) - pos < length:
+            return 0
+        # A copy, so that buffer can be resized while memoryviews of the
+        # packet are in use.
+        data = bytes(buffer[pos:pos + length])
+        try:
+            events.append((self._decode_packet(data, consumed), data))
+        except ParseError as error:
+            events.extend(
+                (event, None) for event in _parse_error_events(data, error))
+        return length
+
+    def _non_subunit(self, buffer, pos, events):
+        """Report the non subunit content starting at pos.
+
+        :return: The offset of the next packet, or the end of buffer.
+        """
+        if self.non_subunit_name is None:
+            raise Exception("Non subunit content", bytes(buffer[pos:pos + 1]))
+        search_from = pos
+        while True:
+            signature = buffer.find(SIGNATURE, search_from)
+            end = len(buffer) if signature == -1 else signature
+            if end > search_from:
+                self._codec.decode(bytes(buffer[search_from:end]))
+            if signature != -1 and self._codec.getstate()[0]:
+                # The signature byte is part of a UTF8 character.
+                self._codec.decode(bytes(buffer[signature:signature + 1]))
+                search_from = signature + 1
+                continue
+            break
+        for offset in range(pos, end, 1048576):
+            events.append((dict(file_name=self.non_subunit_name,
+                file_bytes=bytes(buffer[offset:min(end, offset + 1048576)])),
+                None))
+        return end
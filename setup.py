@@ -68,6 +68,7 @@ setup(
         'filters/subunit-2to1',
         'filters/subunit-filter',
         'filters/subunit-ls',
+        'filters/subunit-merge',
         'filters/subunit-notify',
         'filters/subunit-output',
         'filters/subunit-stats',